@@ -0,0 +1,340 @@
+"""
+End-to-end benchmark of preprocess -> extraction -> evaluation -> classification.
+
+Each stage is driven in-process through the FastAPI test client with deterministic
+synthetic recordings (see ``synthetic.py``), recording wall time, the peak RSS growth
+of the stage (peak minus the RSS at the start of the stage, so imports and what earlier
+stages left behind do not mask a stage's own regression) and request and response
+payload sizes. Results are compared with a JSON baseline (``pipeline_baseline.json``)
+and the run fails (exit code 1) when a metric grows beyond its threshold.
+
+Run from the Backend directory:
+
+    python benchmarks/bench_pipeline.py                       # tiers xs,s; compare with baseline
+    python benchmarks/bench_pipeline.py --tiers xs,s,m --update-baseline
+    python benchmarks/bench_pipeline.py --signal respiration --sampling-rate 1000
+
+The response cache and the preprocess step cache are disabled and CPU-bound work runs
+in the benchmark process (BACKEND_PROCESS_WORKERS=0) so RSS covers all the work.
+Baselines are machine specific; record one per machine.
+"""
+import argparse
+import gc
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import threading
+import time
+
+# Measure the work itself, not the caches or worker pools
+os.environ["RESPONSE_CACHE_ENTRIES"] = "0"
+os.environ["PREPROCESS_CACHE_SIZE"] = "0"
+os.environ.setdefault("BACKEND_PROCESS_WORKERS", "0")
+os.environ.setdefault("BACKEND_LOG_LEVEL", "WARNING")
+
+# Make the backend modules importable when run as a script
+base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+bench_dir = os.path.dirname(os.path.abspath(__file__))
+for path in (base_dir, bench_dir):
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+from fastapi.testclient import TestClient
+
+import synthetic
+
+# Tier name -> (samples, channels)
+TIERS = {
+    "xs": (10_000, 2),
+    "s": (100_000, 8),
+    "m": (1_000_000, 32),
+    "l": (10_000_000, 128),
+}
+DEFAULT_TIERS = ["xs", "s"]
+STAGES = ["preprocess", "extraction", "evaluation", "classification"]
+DEFAULT_BASELINE = os.path.join(bench_dir, "pipeline_baseline.json")
+
+# A metric regresses when current / baseline exceeds its threshold
+DEFAULT_THRESHOLDS = {
+    "wall_s": 1.25,
+    "peak_rss_delta_mb": 1.20,
+    "request_bytes": 1.05,
+    "response_bytes": 1.05,
+}
+# Changes below these are noise, not regressions
+MIN_WALL_DELTA_S = 0.05
+MIN_RSS_DELTA_MB = 8
+
+
+class PeakRss:
+    """
+    Samples this process's resident set size in the background and keeps the peak;
+    ``delta`` is the peak above the RSS on entry.
+    """
+
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.start = 0
+        self.peak = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    @property
+    def delta(self):
+        return self.peak - self.start
+
+    def __enter__(self):
+        gc.collect()
+        self.start = self.peak = _rss_bytes()
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, _rss_bytes())
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.peak = max(self.peak, _rss_bytes())
+
+
+def run_case(tier, signal_kind, sampling_rate, seed=0, repeat=1):
+    """
+    Run the four stages on one synthetic recording.
+
+    Returns:
+    --------
+    dict
+        Stage -> {'wall_s', 'peak_rss_delta_mb', 'rss_start_mb', 'request_bytes',
+        'response_bytes'}; the wall time is the best of ``repeat`` runs and the peak RSS
+        growth the largest. ``rss_start_mb`` is informational and not compared.
+    """
+    import classification
+    import evaluation
+    import extraction
+    import preprocess
+
+    n_samples, n_channels = TIERS[tier]
+    frame = synthetic.recording(n_samples, n_channels, signal_kind, sampling_rate, seed)
+    clients = {
+        "preprocess": TestClient(preprocess.app),
+        "extraction": TestClient(extraction.app),
+        "evaluation": TestClient(evaluation.app),
+        "classification": TestClient(classification.app),
+    }
+
+    preprocess_body = json.dumps({
+        "config": {
+            "operations": ["missing", "encode", "normalize"],
+            "settings": {
+                "missingValues": "mean",
+                "encodingMethod": ["onehot", "label"],
+                "normalizationMethod": "zscore",
+            },
+            "columns": [],
+        },
+        "data_from_visualization": json.loads(frame.to_json(orient="records")),
+    }).encode()
+    del frame
+
+    results = {}
+
+    def measure(stage, request_bytes, call):
+        best = None
+        for _ in range(repeat):
+            with PeakRss() as rss:
+                start = time.perf_counter()
+                response = call()
+                wall = time.perf_counter() - start
+            if response.status_code != 200:
+                raise RuntimeError(f"{stage} failed with {response.status_code}: {response.text[:500]}")
+            payload = response.json()
+            if isinstance(payload, dict) and payload.get("error"):
+                raise RuntimeError(f"{stage} failed: {payload['error']}")
+            entry = {
+                "wall_s": wall,
+                "peak_rss_delta_mb": rss.delta / 2 ** 20,
+                "rss_start_mb": rss.start / 2 ** 20,
+                "request_bytes": request_bytes,
+                "response_bytes": len(response.content),
+            }
+            if best is None:
+                best = entry
+            else:
+                best["wall_s"] = min(best["wall_s"], entry["wall_s"])
+                best["peak_rss_delta_mb"] = max(best["peak_rss_delta_mb"], entry["peak_rss_delta_mb"])
+        results[stage] = best
+        print(
+            f"  {stage:<15} {best['wall_s']:9.3f} s  +{best['peak_rss_delta_mb']:8.1f} MB  "
+            f"req {best['request_bytes'] / 2 ** 20:9.2f} MB  resp {best['response_bytes'] / 2 ** 20:9.2f} MB"
+        )
+        return payload
+
+    processed = measure(
+        "preprocess", len(preprocess_body),
+        lambda: clients["preprocess"].post(
+            "/preprocess", content=preprocess_body, headers={"Content-Type": "application/json"}
+        ),
+    )["processedData"]
+    del preprocess_body
+
+    features_file = json.dumps(processed).encode()
+    del processed
+    extraction_config = json.dumps({
+        "methods": ["pca"],
+        "features": [],
+        "settings": {"pcaComponents": min(4, n_channels)},
+    })
+    extracted = measure(
+        "extraction", len(features_file),
+        lambda: clients["extraction"].post(
+            "/extraction",
+            data={"config": extraction_config},
+            files={"file": ("processed.json", features_file, "application/json")},
+        ),
+    )["processedData"]
+    del features_file
+
+    extracted_file = json.dumps(extracted).encode()
+    del extracted
+    measure(
+        "evaluation", len(extracted_file),
+        lambda: clients["evaluation"].post(
+            "/evaluation",
+            data={"methods": json.dumps(["variance", "correlation", "kurtosis", "skewness"])},
+            files={"features": ("features.json", extracted_file, "application/json")},
+        ),
+    )
+    measure(
+        "classification", len(extracted_file),
+        lambda: clients["classification"].post(
+            "/classification",
+            data={"model_type": "kmeans"},
+            files={"features": ("features.json", extracted_file, "application/json")},
+        ),
+    )
+    return results
+
+
+def compare(results, baseline, thresholds):
+    """List of (case, stage, metric, baseline, current, ratio) entries that regressed."""
+    regressions = []
+    for case, stages in results.items():
+        for stage, metrics in stages.items():
+            reference = baseline.get("results", {}).get(case, {}).get(stage)
+            if not reference:
+                continue
+            for metric, limit in thresholds.items():
+                old, new = reference.get(metric), metrics.get(metric)
+                if not old or new is None:
+                    continue
+                ratio = new / old
+                if metric == "wall_s" and new - old < MIN_WALL_DELTA_S:
+                    continue
+                if metric == "peak_rss_delta_mb" and new - old < MIN_RSS_DELTA_MB:
+                    continue
+                if ratio > limit:
+                    regressions.append((case, stage, metric, old, new, ratio))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--tiers", default=",".join(DEFAULT_TIERS),
+                        help=f"comma separated tiers out of {list(TIERS)}")
+    parser.add_argument("--signal", default="emg", choices=["emg", "respiration"])
+    parser.add_argument("--sampling-rate", type=int, default=None,
+                        help="Hz; defaults to 2500 for EMG and 100 for respiration")
+    parser.add_argument("--repeat", type=int, default=1, help="runs per stage (best wall time is kept)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--update-baseline", action="store_true", help="write the results as the new baseline")
+    parser.add_argument("--output", help="also write the results to this JSON file")
+    args = parser.parse_args(argv)
+
+    results = {}
+    for tier in args.tiers.split(","):
+        if tier not in TIERS:
+            parser.error(f"unknown tier '{tier}'")
+        case = f"{tier}/{args.signal}" + (f"@{args.sampling_rate}" if args.sampling_rate else "")
+        n_samples, n_channels = TIERS[tier]
+        print(f"{case}: {n_samples} samples x {n_channels} channels")
+        results[case] = run_case(tier, args.signal, args.sampling_rate, args.seed, args.repeat)
+
+    report = {"meta": _environment(), "thresholds": DEFAULT_THRESHOLDS, "results": results}
+    if args.output:
+        _write_json(args.output, report)
+
+    if args.update_baseline:
+        baseline = _read_json(args.baseline) or {"thresholds": DEFAULT_THRESHOLDS, "results": {}}
+        baseline["meta"] = report["meta"]
+        baseline.setdefault("results", {}).update(results)
+        _write_json(args.baseline, baseline)
+        print(f"Baseline written to {args.baseline}")
+        return 0
+
+    baseline = _read_json(args.baseline)
+    if baseline is None:
+        print(f"No baseline at {args.baseline}; run with --update-baseline to record one")
+        return 0
+    thresholds = {**DEFAULT_THRESHOLDS, **baseline.get("thresholds", {})}
+    regressions = compare(results, baseline, thresholds)
+    for case, stage, metric, old, new, ratio in regressions:
+        print(f"REGRESSION {case} {stage} {metric}: {old:.4g} -> {new:.4g} (x{ratio:.2f}, limit x{thresholds[metric]})")
+    if regressions:
+        return 1
+    print("No regressions against the baseline")
+    return 0
+
+
+# =============================================================================
+# Internals
+# =============================================================================
+def _rss_bytes():
+    # Without /proc only the lifetime peak is available, so stage deltas read as 0 once
+    # an earlier stage used more memory
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        # ru_maxrss is the lifetime peak (kB on Linux, bytes on macOS)
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024
+
+
+def _environment():
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=base_dir, capture_output=True, text=True, timeout=10
+        ).stdout.strip()
+    except (OSError, subprocess.SubprocessError):
+        commit = ""
+    return {
+        "commit": commit,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+    }
+
+
+def _read_json(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, json.JSONDecodeError):
+        return None
+
+
+def _write_json(path, data):
+    with open(path, "w") as f:
+        json.dump(data, f, indent=2, sort_keys=True)
+        f.write("\n")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
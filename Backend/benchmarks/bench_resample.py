@@ -0,0 +1,79 @@
+"""
+Timing benchmark of the signal_resample methods and of the streaming resampler.
+
+Run from the Backend directory:
+
+    python benchmarks/bench_resample.py
+"""
+import os
+import sys
+import timeit
+
+import numpy as np
+
+# Make the custom_methods package importable when run as a script
+base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if base_dir not in sys.path:
+    sys.path.insert(0, base_dir)
+
+from custom_methods.signal_resample import StreamingResampler, signal_resample
+
+# (label, sampling rate, desired sampling rate, duration in seconds, channels)
+CASES = [
+    ("EMG 2500 -> 1000 Hz", 2500, 1000, 60, 8),
+    ("EMG 2500 -> 100 Hz", 2500, 100, 60, 8),
+    ("RSP 1000 -> 10 Hz", 1000, 10, 600, 1),
+]
+METHODS = ["interpolation", "numpy", "poly", "FFT", "pandas"]
+CHUNK_SECONDS = 5
+
+
+def _time(func, repeat=3):
+    return min(timeit.repeat(func, number=1, repeat=repeat))
+
+
+def _stream(signal, sampling_rate, desired_sampling_rate):
+    resampler = StreamingResampler(sampling_rate, desired_sampling_rate)
+    chunk = CHUNK_SECONDS * sampling_rate
+    outputs = [resampler.process(signal[i : i + chunk]) for i in range(0, len(signal), chunk)]
+    outputs.append(resampler.flush())
+    return np.concatenate(outputs)
+
+
+def main():
+    rng = np.random.default_rng(42)
+    for label, sampling_rate, desired_sampling_rate, duration, channels in CASES:
+        signal = rng.standard_normal((duration * sampling_rate, channels))
+        print(f"{label} ({signal.shape[0]} samples x {channels} channels)")
+        for method in METHODS:
+            try:
+                # Existing methods are 1-D only for pandas, so time them per channel
+                seconds = _time(
+                    lambda: [
+                        signal_resample(
+                            signal[:, c],
+                            sampling_rate=sampling_rate,
+                            desired_sampling_rate=desired_sampling_rate,
+                            method=method,
+                        )
+                        for c in range(channels)
+                    ]
+                )
+                print(f"  {method:<22} per channel  {seconds * 1000:9.1f} ms")
+            except Exception as e:
+                print(f"  {method:<22} failed: {e}")
+        seconds = _time(
+            lambda: signal_resample(
+                signal,
+                sampling_rate=sampling_rate,
+                desired_sampling_rate=desired_sampling_rate,
+                method="poly",
+            )
+        )
+        print(f"  {'poly':<22} 2-D, axis=0  {seconds * 1000:9.1f} ms")
+        seconds = _time(lambda: _stream(signal, sampling_rate, desired_sampling_rate))
+        print(f"  {'StreamingResampler':<22} {CHUNK_SECONDS} s chunks  {seconds * 1000:8.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
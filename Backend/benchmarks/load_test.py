@@ -0,0 +1,340 @@
+"""
+Load test of the backend services with scripted multi-user sessions.
+
+Each virtual user runs sessions like the frontend does: upload (channel listing),
+preprocess, extract, evaluate, plot several channels, classify. The harness sweeps
+the number of concurrent users and reports p50/p95/p99 latency, throughput and error
+rate per endpoint, for a cold cache (every session of the run, across all concurrency
+levels, sends a different dataset) and a warm cache (all sessions send the same, already
+processed dataset). A plot response with a missing channel image counts as an error.
+
+By default it launches each service with uvicorn on local ports (``--base-port`` +
+0..4, in the order main, extraction, evaluation, viz, classification, mirroring ports
+8000-8004). Use ``--external`` to target servers that are already running.
+
+Run from the Backend directory:
+
+    python benchmarks/load_test.py --concurrency 1,4,16 --sessions 3
+    python benchmarks/load_test.py --external --base-port 8000 --cache warm
+    python benchmarks/load_test.py --workers 4 --output load.json   # uvicorn --workers
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import shutil
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+
+import httpx
+import numpy as np
+
+bench_dir = os.path.dirname(os.path.abspath(__file__))
+base_dir = os.path.dirname(bench_dir)
+if bench_dir not in sys.path:
+    sys.path.insert(0, bench_dir)
+
+import synthetic
+
+# Service -> (uvicorn app, port offset)
+SERVICES = {
+    "main": ("main_app:app", 0),
+    "extraction": ("extraction:app", 1),
+    "evaluation": ("evaluation:app", 2),
+    "viz": ("vizreport:app", 3),
+    "classification": ("classification:app", 4),
+}
+VIZ_TYPES = ["timeseries", "psd", "spectrogram"]
+PERCENTILES = (50, 95, 99)
+REQUEST_TIMEOUT_S = 600
+
+
+class Servers:
+    """Launches the services with uvicorn and stops them again."""
+
+    def __init__(self, services, base_port, workers=1, env=None):
+        self.services = services
+        self.base_port = base_port
+        self.workers = workers
+        self.env = env or {}
+        self.processes = {}
+        self.cache_dir = tempfile.mkdtemp(prefix="load-test-cache-")
+
+    def __enter__(self):
+        env = {**os.environ, "RESPONSE_CACHE_DIR": self.cache_dir, "BACKEND_LOG_LEVEL": "WARNING", **self.env}
+        for name in self.services:
+            module, offset = SERVICES[name]
+            command = [
+                sys.executable, "-m", "uvicorn", module,
+                "--host", "127.0.0.1", "--port", str(self.base_port + offset),
+                "--workers", str(self.workers), "--log-level", "warning",
+            ]
+            # Own process group, so the worker pool processes are stopped with the server
+            self.processes[name] = subprocess.Popen(command, cwd=base_dir, env=env, start_new_session=True)
+        return self
+
+    def __exit__(self, *exc):
+        for process in self.processes.values():
+            self._signal_group(process, signal.SIGTERM)
+        for process in self.processes.values():
+            try:
+                process.wait(timeout=30)
+            except subprocess.TimeoutExpired:
+                pass
+            # Pool workers of services that do not shut their pools down outlive the server
+            self._signal_group(process, signal.SIGKILL)
+        shutil.rmtree(self.cache_dir, ignore_errors=True)
+
+    @staticmethod
+    def _signal_group(process, sig):
+        try:
+            os.killpg(process.pid, sig)
+        except ProcessLookupError:
+            pass
+
+    async def wait_ready(self, urls, timeout=120):
+        """Poll ``/metrics`` of every service until it answers."""
+        deadline = time.monotonic() + timeout
+        async with httpx.AsyncClient(timeout=5) as client:
+            for name, url in urls.items():
+                while True:
+                    process = self.processes.get(name)
+                    if process is not None and process.poll() is not None:
+                        raise RuntimeError(f"{name} exited with code {process.returncode} during startup")
+                    try:
+                        if (await client.get(f"{url}/metrics")).status_code == 200:
+                            break
+                    except httpx.HTTPError:
+                        pass
+                    if time.monotonic() > deadline:
+                        raise RuntimeError(f"{name} did not start within {timeout} s")
+                    await asyncio.sleep(0.25)
+
+
+class Session:
+    """One user's pass through the app; every request is recorded in ``records``."""
+
+    def __init__(self, client, urls, frame, n_viz_channels, records):
+        self.client = client
+        self.urls = urls
+        self.frame = frame
+        self.n_viz_channels = n_viz_channels
+        self.records = records
+
+    async def run(self):
+        rows = json.loads(self.frame.to_json(orient="records"))
+        signal_columns = [c for c in self.frame.columns if self.frame[c].dtype.kind == "f"]
+
+        # Upload: the frontend lists the channels of the uploaded table
+        if "viz" in self.urls:
+            await self._request("upload", "POST", f"{self.urls['viz']}/channels", json={
+                col: self.frame[col].tolist() for col in signal_columns
+            })
+
+        processed = await self._request("preprocess", "POST", f"{self.urls['main']}/preprocess", json={
+            "config": {
+                "operations": ["missing", "encode", "normalize"],
+                "settings": {"missingValues": "mean", "encodingMethod": ["onehot", "label"], "normalizationMethod": "zscore"},
+                "columns": [],
+            },
+            "data_from_visualization": rows,
+        })
+        if processed is None:
+            return
+
+        extracted = await self._request(
+            "extraction", "POST", f"{self.urls['extraction']}/extraction",
+            data={"config": json.dumps({"methods": ["pca"], "features": [], "settings": {"pcaComponents": 2}})},
+            files={"file": ("processed.json", json.dumps(processed["processedData"]).encode(), "application/json")},
+        )
+
+        if extracted is not None and "evaluation" in self.urls:
+            await self._request(
+                "evaluation", "POST", f"{self.urls['evaluation']}/evaluation",
+                data={"methods": json.dumps(["variance", "correlation"])},
+                files={"features": ("features.json", json.dumps(extracted["processedData"]).encode(), "application/json")},
+            )
+
+        if "viz" in self.urls:
+            # The frontend re-keys uploaded columns as ch1, ch2, ... before plotting
+            generic = {col: f"ch{i + 1}" for i, col in enumerate(signal_columns)}
+            signal_rows = json.loads(self.frame[signal_columns].rename(columns=generic).to_json(orient="records"))
+            channels = [f"ch{i + 1}" for i in range(min(self.n_viz_channels, len(signal_columns)))]
+            for viz_type in VIZ_TYPES:
+                await self._request(
+                    f"viz:{viz_type}", "POST", f"{self.urls['viz']}/viz", params={"type": viz_type},
+                    json={"data": signal_rows, "channels": channels, "fs": synthetic.EMG_SAMPLING_RATE},
+                )
+
+        if extracted is not None and "classification" in self.urls:
+            await self._request(
+                "classification", "POST", f"{self.urls['classification']}/classification",
+                data={"model_type": "kmeans"},
+                files={"features": ("features.json", json.dumps(extracted["processedData"]).encode(), "application/json")},
+            )
+
+    async def _request(self, endpoint, method, url, **kwargs):
+        start = time.perf_counter()
+        try:
+            response = await self.client.request(method, url, **kwargs)
+            ok = response.status_code == 200
+            payload = response.json() if ok else None
+            if isinstance(payload, dict) and payload.get("error"):
+                ok = False
+            status = response.status_code
+            images = payload.get("images") if isinstance(payload, dict) else None
+            if isinstance(images, dict) and (not images or any(image is None for image in images.values())):
+                # The plot endpoints answer 200 with None for channels they could not draw
+                ok, status = False, "missing-image"
+            cache = response.headers.get("x-cache", "")
+        except (httpx.HTTPError, json.JSONDecodeError) as e:
+            ok, payload, status, cache = False, None, type(e).__name__, ""
+        self.records.append({
+            "endpoint": endpoint,
+            "latency_s": time.perf_counter() - start,
+            "ok": ok,
+            "status": status,
+            "cache": cache,
+        })
+        return payload if ok else None
+
+
+async def run_level(urls, concurrency, sessions_per_user, cache_mode, samples, channels, n_viz_channels, seed,
+                    cold_seeds):
+    """
+    Run ``concurrency`` users with ``sessions_per_user`` sessions each.
+
+    In 'cold' mode every session gets its own dataset, seeded from ``cold_seeds`` (an
+    iterator shared by all levels, so no level replays a dataset an earlier one already
+    cached); in 'warm' mode all sessions share one dataset (``seed``) that is processed
+    once before the measurement starts.
+    """
+    limits = httpx.Limits(max_connections=concurrency * 2, max_keepalive_connections=concurrency * 2)
+    async with httpx.AsyncClient(timeout=REQUEST_TIMEOUT_S, limits=limits) as client:
+        shared = None
+        if cache_mode == "warm":
+            shared = synthetic.recording(samples, channels, seed=seed)
+            await Session(client, urls, shared, n_viz_channels, []).run()
+
+        records = []
+
+        async def user(index):
+            for session in range(sessions_per_user):
+                if shared is not None:
+                    frame = shared
+                else:
+                    # A fresh seed per session keeps every payload (and cache key) unique
+                    frame = synthetic.recording(samples, channels, seed=next(cold_seeds))
+                await Session(client, urls, frame, n_viz_channels, records).run()
+
+        start = time.perf_counter()
+        await asyncio.gather(*(user(i) for i in range(concurrency)))
+        wall = time.perf_counter() - start
+    return summarize(records, wall, concurrency * sessions_per_user)
+
+
+def summarize(records, wall, sessions):
+    """Per-endpoint latency percentiles, throughput and error rate."""
+    by_endpoint = defaultdict(list)
+    for record in records:
+        by_endpoint[record["endpoint"]].append(record)
+    endpoints = {}
+    for endpoint, entries in by_endpoint.items():
+        latencies = np.array([e["latency_s"] for e in entries])
+        errors = [e for e in entries if not e["ok"]]
+        endpoints[endpoint] = {
+            "requests": len(entries),
+            "errors": len(errors),
+            "error_rate": len(errors) / len(entries),
+            "error_statuses": sorted({str(e["status"]) for e in errors}),
+            "cache_hits": sum(1 for e in entries if e["cache"] == "hit"),
+            "throughput_rps": len(entries) / wall,
+            **{f"p{p}_s": float(np.percentile(latencies, p)) for p in PERCENTILES},
+            "max_s": float(latencies.max()),
+        }
+    return {
+        "wall_s": wall,
+        "sessions": sessions,
+        "sessions_per_s": sessions / wall,
+        "requests": len(records),
+        "error_rate": sum(1 for r in records if not r["ok"]) / max(1, len(records)),
+        "endpoints": endpoints,
+    }
+
+
+def print_level(cache_mode, concurrency, summary):
+    print(
+        f"\n[{cache_mode}] {concurrency} users: {summary['sessions']} sessions in {summary['wall_s']:.1f} s "
+        f"({summary['sessions_per_s']:.2f} sessions/s, error rate {summary['error_rate']:.1%})"
+    )
+    print(f"  {'endpoint':<18}{'req':>6}{'err%':>7}{'hits':>6}{'rps':>8}{'p50':>9}{'p95':>9}{'p99':>9}")
+    for endpoint, stats in summary["endpoints"].items():
+        print(
+            f"  {endpoint:<18}{stats['requests']:>6}{stats['error_rate'] * 100:>6.1f}%{stats['cache_hits']:>6}"
+            f"{stats['throughput_rps']:>8.2f}{stats['p50_s']:>8.2f}s{stats['p95_s']:>8.2f}s{stats['p99_s']:>8.2f}s"
+        )
+
+
+async def main_async(args):
+    services = [name for name in SERVICES if name not in args.skip]
+    urls = {name: f"http://127.0.0.1:{args.base_port + SERVICES[name][1]}" for name in services}
+    levels = [int(c) for c in args.concurrency.split(",")]
+    cache_modes = ["cold", "warm"] if args.cache == "both" else [args.cache]
+
+    report = {"config": vars(args), "levels": []}
+    # Never the warm dataset's seed
+    cold_seeds = itertools.count(args.seed + 1)
+    servers = None
+    if not args.external:
+        servers = Servers(services, args.base_port, args.workers).__enter__()
+    try:
+        if servers is not None:
+            await servers.wait_ready(urls)
+        for cache_mode in cache_modes:
+            for concurrency in levels:
+                summary = await run_level(
+                    urls, concurrency, args.sessions, cache_mode,
+                    args.samples, args.channels, args.viz_channels, args.seed, cold_seeds,
+                )
+                print_level(cache_mode, concurrency, summary)
+                report["levels"].append({"cache": cache_mode, "concurrency": concurrency, **summary})
+    finally:
+        if servers is not None:
+            servers.__exit__(None, None, None)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"\nResults written to {args.output}")
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--concurrency", default="1,2,4,8", help="comma separated numbers of concurrent users")
+    parser.add_argument("--sessions", type=int, default=2, help="sessions per user at each level")
+    parser.add_argument("--cache", default="both", choices=["cold", "warm", "both"])
+    parser.add_argument("--samples", type=int, default=5000, help="rows per uploaded dataset")
+    parser.add_argument("--channels", type=int, default=4, help="EMG channels per dataset")
+    parser.add_argument("--viz-channels", type=int, default=3, help="channels plotted per visualization")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--base-port", type=int, default=18000)
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn worker processes per service")
+    parser.add_argument("--external", action="store_true", help="use already running servers")
+    parser.add_argument("--skip", nargs="*", default=[], choices=list(SERVICES),
+                        help="services to leave out (e.g. viz when ydata-profiling is not installed)")
+    parser.add_argument("--output", help="write the results to this JSON file")
+    args = parser.parse_args(argv)
+    if "main" in args.skip or "extraction" in args.skip:
+        parser.error("the sessions need the main and extraction services")
+    asyncio.run(main_async(args))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,150 @@
+"""
+Deterministic synthetic recordings for the benchmarks.
+
+The same seed always gives the same data, so benchmark runs on different commits
+process identical payloads:
+
+- ``emg``: band-limited (20-450 Hz) noise in activation bursts plus powerline
+  interference, sampled at 2500 Hz by default,
+- ``respiration``: a breathing waveform with drifting rate and depth plus sensor
+  noise, sampled at 100 or 1000 Hz,
+- ``categorical_metadata``: per-segment subject, posture, session and activity
+  columns, as exported next to the signals.
+"""
+import numpy as np
+import pandas as pd
+from scipy import signal as sps
+
+EMG_SAMPLING_RATE = 2500
+RESPIRATION_SAMPLING_RATES = (100, 1000)
+# Rows per metadata segment (one trial of a subject in one posture)
+SEGMENT_SECONDS = 4
+
+POSTURES = ["sitting", "standing", "walking", "lying"]
+ACTIVITIES = ["rest", "light", "moderate", "vigorous"]
+
+
+def emg(n_samples, n_channels, sampling_rate=EMG_SAMPLING_RATE, seed=0):
+    """
+    Multi-channel surface EMG.
+
+    Parameters:
+    -----------
+    n_samples : int
+        Samples per channel.
+    n_channels : int
+        Number of channels.
+    sampling_rate : int
+        Sampling rate in Hz.
+    seed : int
+        Random seed.
+
+    Returns:
+    --------
+    numpy.ndarray
+        float32 array of shape (n_samples, n_channels), in millivolts.
+    """
+    rng = np.random.default_rng(seed)
+    nyquist = sampling_rate / 2
+    b, a = sps.butter(4, [20 / nyquist, min(450, nyquist * 0.9) / nyquist], btype="band")
+    noise = sps.lfilter(b, a, rng.standard_normal((n_samples, n_channels)), axis=0)
+
+    # Bursts: a smoothed random on/off pattern per channel, 0.2-1.0 s long
+    t = np.arange(n_samples) / sampling_rate
+    envelope = np.empty((n_samples, n_channels))
+    for c in range(n_channels):
+        burst_rate = rng.uniform(0.5, 1.5)
+        phase = rng.uniform(0, 2 * np.pi)
+        envelope[:, c] = 0.1 + np.clip(np.sin(2 * np.pi * burst_rate * t + phase), 0, None) ** 2
+    powerline = 0.05 * np.sin(2 * np.pi * 50 * t)[:, None]
+    gains = rng.uniform(0.2, 1.0, n_channels)
+    return (noise * envelope * gains + powerline).astype(np.float32)
+
+
+def respiration(n_samples, n_channels=1, sampling_rate=100, seed=0):
+    """
+    Respiration belt signals with a breathing rate drifting around 15 breaths/min.
+
+    Returns:
+    --------
+    numpy.ndarray
+        float32 array of shape (n_samples, n_channels).
+    """
+    rng = np.random.default_rng(seed)
+    t = np.arange(n_samples) / sampling_rate
+    out = np.empty((n_samples, n_channels))
+    for c in range(n_channels):
+        # Instantaneous rate 0.15-0.35 Hz, integrated into a phase
+        drift = np.sin(2 * np.pi * t / rng.uniform(60, 180) + rng.uniform(0, 2 * np.pi))
+        rate = 0.25 + 0.1 * drift
+        phase = 2 * np.pi * np.cumsum(rate) / sampling_rate
+        depth = 1.0 + 0.2 * np.sin(2 * np.pi * t / rng.uniform(30, 90))
+        baseline = 0.3 * np.sin(2 * np.pi * t / 300)
+        out[:, c] = depth * np.sin(phase) + baseline + 0.05 * rng.standard_normal(n_samples)
+    return out.astype(np.float32)
+
+
+def categorical_metadata(n_rows, sampling_rate, seed=0, missing_fraction=0.001):
+    """
+    Per-segment metadata columns.
+
+    Each block of ``SEGMENT_SECONDS`` seconds gets one subject, posture, session and
+    activity; ``missing_fraction`` of the posture values are missing.
+
+    Returns:
+    --------
+    pandas.DataFrame
+        Columns 'subject' (high cardinality), 'posture', 'session' (ordinal) and
+        'activity' (the classification target).
+    """
+    rng = np.random.default_rng(seed)
+    segment = max(1, SEGMENT_SECONDS * sampling_rate)
+    n_segments = -(-n_rows // segment)
+    subjects = np.array([f"S{i:03d}" for i in range(max(2, n_segments // 8))])
+    per_segment = {
+        "subject": rng.choice(subjects, n_segments),
+        "posture": rng.choice(POSTURES, n_segments),
+        "session": rng.integers(1, 6, n_segments).astype(str),
+        "activity": rng.choice(ACTIVITIES, n_segments),
+    }
+    frame = pd.DataFrame({name: np.repeat(values, segment)[:n_rows] for name, values in per_segment.items()})
+    missing = rng.random(n_rows) < missing_fraction
+    frame.loc[missing, "posture"] = None
+    return frame
+
+
+def recording(n_samples, n_channels, kind="emg", sampling_rate=None, seed=0, metadata=True):
+    """
+    A table as uploaded to the platform: signal channels followed by metadata.
+
+    Parameters:
+    -----------
+    n_samples : int
+        Rows.
+    n_channels : int
+        Signal channels, named ``emg1..`` or ``rsp1..``.
+    kind : str
+        'emg' or 'respiration'.
+    sampling_rate : int
+        Defaults to 2500 Hz for EMG and 100 Hz for respiration.
+    metadata : bool
+        Append the :func:`categorical_metadata` columns.
+
+    Returns:
+    --------
+    pandas.DataFrame
+    """
+    if kind == "emg":
+        sampling_rate = sampling_rate or EMG_SAMPLING_RATE
+        values = emg(n_samples, n_channels, sampling_rate, seed)
+        prefix = "emg"
+    elif kind == "respiration":
+        sampling_rate = sampling_rate or RESPIRATION_SAMPLING_RATES[0]
+        values = respiration(n_samples, n_channels, sampling_rate, seed)
+        prefix = "rsp"
+    else:
+        raise ValueError(f"Unknown signal kind: {kind}")
+    frame = pd.DataFrame(values, columns=[f"{prefix}{i + 1}" for i in range(n_channels)])
+    if metadata:
+        frame = pd.concat([frame, categorical_metadata(n_samples, sampling_rate, seed + 1)], axis=1)
+    return frame
@@ -2,19 +2,95 @@ from fastapi import FastAPI, UploadFile, Form, File
 from fastapi.middleware.cors import CORSMiddleware
 import pandas as pd
 import numpy as np
+import hashlib
 import json
+import os
+import threading
+import time
+import warnings
 from typing import Dict, List, Any, Optional
-from sklearn.cluster import KMeans, DBSCAN, AgglomerativeClustering
+from joblib import Parallel, delayed
+from scipy.sparse import csr_matrix
+from scipy.sparse.csgraph import connected_components
+from sklearn.cluster import KMeans, MiniBatchKMeans, DBSCAN, AgglomerativeClustering
 from sklearn.model_selection import train_test_split
-from sklearn.ensemble import RandomForestClassifier
 from sklearn.metrics import silhouette_score, calinski_harabasz_score, davies_bouldin_score, accuracy_score, precision_score, recall_score, f1_score
 from sklearn.decomposition import PCA
 from sklearn.manifold import TSNE
 from sklearn.preprocessing import StandardScaler
-from sklearn.svm import SVC
-from sklearn.linear_model import LogisticRegression
+from sklearn.neighbors import NearestNeighbors, kneighbors_graph
 from typing import Union
 
+import incremental
+import model_registry
+import model_search
+import similarity
+from preprocess_pipeline import StepCache
+from telemetry import get_logger, instrument, register_collector
+from workers import run_in_process, run_in_thread
+
+logger = get_logger("classification")
+
+SUPERVISED_MODELS = ['random_forest', 'svm', 'logistic_regression', 'logistic']
+# How supervised models are scored (see classify)
+VALIDATION_MODES = ('holdout', 'cv', 'search')
+# Where supervised feature importances come from: the model's own weights (only for
+# models that have them) or permutation importance (any model)
+IMPORTANCE_METHODS = ('model', 'permutation')
+
+DEFAULT_CLUSTERS = 3
+AUTO_K_RANGE = (2, 10)
+# Rows the auto-k sweep fits and scores each candidate k on
+CLUSTER_SAMPLE_SIZE = int(os.environ.get("CLASSIFICATION_SAMPLE_SIZE", "20000"))
+# Rows used for silhouette coefficients, which need all pairwise distances
+SILHOUETTE_SAMPLE_SIZE = int(os.environ.get("CLASSIFICATION_SILHOUETTE_SAMPLE", "5000"))
+# Above this many rows k-means is fitted with MiniBatchKMeans
+MINIBATCH_ROWS = int(os.environ.get("CLASSIFICATION_MINIBATCH_ROWS", "50000"))
+# Threads fitting the candidates of the auto-k sweep
+AUTO_K_JOBS = int(os.environ.get("CLASSIFICATION_AUTO_K_JOBS", str(min(4, os.cpu_count() or 1))))
+
+HIERARCHICAL_MODELS = ('hierarchical', 'agglomerative')
+HIERARCHICAL_LINKAGES = ('ward', 'average', 'complete', 'single')
+# Neighbors per row in the connectivity graph that constrains the merges
+HIERARCHICAL_NEIGHBORS = 10
+# Rows the merge tree is built on (its cost grows quadratically); the other rows join
+# the cluster of their nearest tree row
+HIERARCHICAL_MAX_ROWS = int(os.environ.get("CLASSIFICATION_HIERARCHICAL_ROWS", "20000"))
+# Leaves of the truncated dendrogram returned for display
+DENDROGRAM_LEAVES = 30
+
+# How clustering results are returned for plotting: every point, or per-cluster density
+# grids plus a sample ('auto' switches to density above DENSITY_AUTO_ROWS rows)
+VISUALIZATION_MODES = ('points', 'density', 'auto')
+DENSITY_AUTO_ROWS = int(os.environ.get("CLASSIFICATION_DENSITY_ROWS", "20000"))
+DENSITY_GRID_SIZE = 64
+# Points in the stratified sample sent with density grids, and the minimum per cluster
+DENSITY_SAMPLE_POINTS = 2000
+DENSITY_MIN_CLUSTER_POINTS = 20
+
+# Neighbor graphs kept for DBSCAN previews (one per uploaded dataset)
+PREVIEW_CACHE_SIZE = int(os.environ.get("CLASSIFICATION_PREVIEW_CACHE_SIZE", "4"))
+PREVIEW_CACHE_MB = float(os.environ.get("CLASSIFICATION_PREVIEW_CACHE_MB", "512"))
+# The radius graph is built this much wider than the requested eps so nearby slider
+# positions reuse it
+PREVIEW_RADIUS_HEADROOM = 1.5
+# Neighbors kept per point for the k-distance curve (grown when min_pts needs more)
+PREVIEW_KDIST_NEIGHBORS = 32
+KDIST_CURVE_POINTS = 200
+
+_preview_cache = StepCache(PREVIEW_CACHE_SIZE, max_bytes=int(PREVIEW_CACHE_MB * 2 ** 20))
+
+
+@register_collector
+def _preview_cache_metrics():
+    with _preview_cache.lock:
+        hits, misses, entries = _preview_cache.hits, _preview_cache.misses, len(_preview_cache.entries)
+    return [
+        ("backend_dbscan_preview_cache_lookups_total", "counter", "DBSCAN preview neighbor graph cache lookups.",
+         [({"result": "hit"}, hits), ({"result": "miss"}, misses)]),
+        ("backend_dbscan_preview_cache_entries", "gauge", "Neighbor graphs held in memory.",
+         [({}, entries)]),
+    ]
 
 app = FastAPI()
 
@@ -26,56 +102,254 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+# Request latency/size metrics and GET /metrics
+instrument(app)
+# Stored models and POST /predict
+app.include_router(model_registry.router)
+# partial_fit training on streamed feature batches
+app.include_router(incremental.router)
+# Nearest-neighbour search over indexed feature tables
+app.include_router(similarity.router)
 
 @app.post("/classification")
 async def classify_features(
     model_type: str = Form(...),
     features: UploadFile = File(...),
-    target: str = Form(None)
+    target: str = Form(None),
+    n_clusters: str = Form(None),
+    k_min: int = Form(AUTO_K_RANGE[0]),
+    k_max: int = Form(AUTO_K_RANGE[1]),
+    sample_size: int = Form(None),
+    validation: str = Form("holdout"),
+    cv_folds: int = Form(model_search.CV_FOLDS),
+    svm_solver: str = Form("auto"),
+    calibrate: bool = Form(False),
+    visualization: str = Form("points"),
+    grid_size: int = Form(DENSITY_GRID_SIZE),
+    linkage: str = Form("ward"),
+    n_neighbors: int = Form(HIERARCHICAL_NEIGHBORS),
+    importance: str = Form("model"),
+    n_repeats: int = Form(model_search.PERMUTATION_REPEATS)
 ):
+    content = await features.read()
+    return await classify(
+        content, model_type, target, n_clusters, (k_min, k_max), sample_size, validation, cv_folds,
+        svm_solver, calibrate, visualization, grid_size, linkage, n_neighbors, importance, n_repeats,
+    )
+
+
+async def classify(
+    content: bytes,
+    model_type: str,
+    target: Optional[str],
+    n_clusters: Union[int, str, None] = None,
+    k_range: tuple = AUTO_K_RANGE,
+    sample_size: Optional[int] = None,
+    validation: str = "holdout",
+    cv_folds: int = model_search.CV_FOLDS,
+    svm_solver: str = "auto",
+    calibrate: bool = False,
+    visualization: str = "points",
+    grid_size: int = DENSITY_GRID_SIZE,
+    linkage: str = "ward",
+    n_neighbors: int = HIERARCHICAL_NEIGHBORS,
+    importance: str = "model",
+    n_repeats: int = model_search.PERMUTATION_REPEATS,
+) -> Dict[str, Any]:
+    """
+    Run a classification request on the worker process pool.
+
+    ``validation`` selects how supervised models are scored: 'holdout' (a single 70/30
+    split, see :func:`run_classification`), 'cv' (stratified ``cv_folds``-fold
+    cross-validation) or 'search' (successive-halving hyperparameter search followed
+    by cross-validation, see ``model_search``). Clustering ignores it.
+
+    SVMs are trained with ``svm_solver`` (see ``model_search.SVM_SOLVERS``; 'auto'
+    switches to a kernel approximation with a linear solver on large tables) and only
+    predict probabilities when ``calibrate`` is set.
+
+    With ``importance='permutation'`` supervised results also carry
+    'permutationImportance' (``n_repeats`` shuffles per feature, see
+    ``model_search.permutation_importance``) and 'feature_importances' holds its means,
+    so every model type reports comparable importances. They are measured on the
+    held-out 30% for 'holdout' and, for 'cv' and 'search', on each fold's held-out rows
+    with that fold's cross-validation model (see ``model_search.cross_validate``), since
+    their final model is fitted on all rows.
+    """
+    validation = (validation or "holdout").lower()
+    if validation not in VALIDATION_MODES:
+        return {"error": f"Unknown validation '{validation}', use one of {list(VALIDATION_MODES)}"}
+    importance = (importance or "model").lower()
+    if importance not in IMPORTANCE_METHODS:
+        return {"error": f"Unknown importance '{importance}', use one of {list(IMPORTANCE_METHODS)}"}
+    if validation == "holdout" or model_type.lower() not in SUPERVISED_MODELS:
+        # Model fitting runs in the worker process pool to keep the event loop free
+        result = await run_in_process(
+            run_classification, content, model_type, target,
+            n_clusters=n_clusters, k_range=k_range, sample_size=sample_size,
+            svm_solver=svm_solver, calibrate=calibrate, visualization=visualization, grid_size=grid_size,
+            linkage=linkage, n_neighbors=n_neighbors, importance=importance,
+        )
+        held_out = result.pop('heldOut', None)
+        if held_out is not None:
+            try:
+                if result.get('modelId'):
+                    permutation = await model_search.permutation_importance(
+                        result['modelId'], held_out['dataset'], held_out['features'], held_out['classes'], n_repeats
+                    )
+                    _set_permutation_importance(result, permutation, 'holdout')
+                else:
+                    logger.warning("Permutation importance skipped: the model could not be stored")
+            finally:
+                model_search.remove_dataset(held_out['dataset'])
+        return result
+
+    model_type = model_type.lower()
+    prepared = await run_in_process(prepare_supervised, content, target)
+    if "error" in prepared:
+        return prepared
+    dataset = prepared["dataset"]
+    try:
+        cv = await model_search.cross_validate(
+            dataset, model_type, cv_folds, tune=validation == "search", svm_solver=svm_solver,
+            features=prepared["features"], importance_repeats=n_repeats if importance == "permutation" else 0,
+        )
+        permutation = cv.pop("permutation", None)
+        final = await run_in_process(
+            fit_supervised, dataset["directory"], model_type, cv["bestParams"], prepared["features"],
+            prepared["classes"], cv["solver"] or svm_solver, calibrate, {
+                'target': target,
+                'validation': validation,
+                'params': cv["bestParams"],
+                'metrics': {name: summary["mean"] for name, summary in cv["metrics"].items()},
+                'metricsStd': {name: summary["std"] for name, summary in cv["metrics"].items()},
+            },
+        )
+        result = {
+            'mode': 'supervised',
+            'model': model_type,
+            'modelId': final['modelId'],
+            'metrics': {name: summary["mean"] for name, summary in cv["metrics"].items()},
+            'metricsStd': {name: summary["std"] for name, summary in cv["metrics"].items()},
+            'bestParams': cv["bestParams"],
+            'solver': final['solver'],
+            'crossValidation': cv,
+            'feature_importances': final['feature_importances']
+        }
+        if permutation is not None:
+            _set_permutation_importance(result, permutation, 'out-of-fold')
+    except ValueError as e:
+        return {"error": str(e)}
+    finally:
+        model_search.remove_dataset(dataset)
+    return result
+
+
+def prepare_supervised(content: bytes, target: Optional[str]) -> Dict[str, Any]:
+    """
+    Parse the upload into a numeric feature matrix and class codes for cross-validation
+    and write them with ``model_search.write_dataset`` (runs in a worker process).
+    """
+    try:
+        df = _feature_frame(content)
+    except ValueError as e:
+        return {"error": str(e)}
+    if not target or target not in df.columns:
+        return {'error': f"Target column '{target}' not found in data"}
+    numeric_cols = [c for c in df.select_dtypes(include=[np.number]).columns if c != target]
+    if not numeric_cols:
+        return {"error": "No numeric feature columns to train on"}
+    try:
+        classes, y_codes = np.unique(df[target].to_numpy(), return_inverse=True)
+    except TypeError:
+        return {"error": f"Target column '{target}' mixes incomparable value types"}
+    if len(classes) < 2:
+        return {"error": f"Target column '{target}' has a single class"}
+    return {
+        'dataset': model_search.write_dataset(df[numeric_cols].to_numpy(dtype=float), y_codes),
+        'features': numeric_cols,
+        'classes': classes.tolist(),
+    }
+
+
+def fit_supervised(directory: str, model_type: str, params: Dict[str, Any], features: List[str],
+                   classes: list, svm_solver: str, calibrate: bool, metadata: Dict[str, Any]) -> Dict[str, Any]:
+    """Fit the chosen configuration on all rows and store it in the model registry (runs in a worker process)."""
+    X = pd.DataFrame(np.load(os.path.join(directory, "X.npy")), columns=features)
+    y = np.asarray(classes)[np.load(os.path.join(directory, "y.npy"))]
+    scaler = StandardScaler()
+    X_scaled = scaler.fit_transform(X)
+    model = model_search.build_model(model_type, params, calibrate, svm_solver, n_rows=len(X))
+    model.fit(X_scaled, y)
+    solver = model_search.solver_name(model)
+    try:
+        model_id = model_registry.save_model(model, scaler, features, {
+            'modelType': model_type, 'solver': solver, 'numTrain': len(X), **metadata,
+        })
+    except OSError as e:
+        logger.warning("Could not store the trained model: %s", e)
+        model_id = None
+    return {'modelId': model_id, 'solver': solver, 'feature_importances': _feature_importances(model, features)}
+
+
+def run_classification(
+    content: bytes,
+    model_type: str,
+    target: Optional[str],
+    n_clusters: Union[int, str, None] = None,
+    k_range: tuple = AUTO_K_RANGE,
+    sample_size: Optional[int] = None,
+    svm_solver: str = "auto",
+    calibrate: bool = False,
+    visualization: str = "points",
+    grid_size: int = DENSITY_GRID_SIZE,
+    linkage: str = "ward",
+    n_neighbors: int = HIERARCHICAL_NEIGHBORS,
+    importance: str = "model",
+) -> Dict[str, Any]:
+    """
+    Train/cluster on the uploaded feature table (runs in a worker process).
+
+    Parameters:
+    -----------
+    n_clusters : int or str
+        Number of clusters (default 3), or 'auto': k-means picks it with
+        :func:`select_k` over ``k_range``, hierarchical clustering cuts the tree at the
+        largest gap between merge heights (see :func:`hierarchical_clusters`).
+    k_range : tuple
+        Smallest and largest k tried by the auto-k sweep.
+    sample_size : int
+        Row budget of the auto-k sweep (default CLASSIFICATION_SAMPLE_SIZE).
+    svm_solver : str
+        SVM solver, see ``model_search.build_model``.
+    calibrate : bool
+        Fit SVMs with probability calibration.
+    visualization : str
+        'points' returns the 2-D PCA coordinates and label of every row ('pca_coords',
+        'labels'); 'density' returns per-cluster ``grid_size`` x ``grid_size`` histograms
+        of the projection and a stratified sample of points instead (see
+        :func:`density_view`); 'auto' picks 'density' above DENSITY_AUTO_ROWS rows.
+    linkage, n_neighbors : str, int
+        Linkage and connectivity graph size for 'hierarchical' clustering.
+    importance : str
+        With 'permutation' the unscaled held-out rows of a supervised model are written
+        with ``model_search.write_dataset`` and returned as 'heldOut' ({'dataset',
+        'features', 'classes'}) for :func:`classify` to score and remove.
+    """
     try:
         # Parse data
+        target_column = target
+        model_type = model_type.lower()
+        logger.info("Classification requested with model: %s, target: %s", model_type, target_column)
         try:
-            content = await features.read()
-            feature_data_json = json.loads(content.decode("utf-8"))
-            
-            # Parse target column name
-            target_column = target
-            
-            # Parse model type
-            model_type = model_type.lower()
-            print(f"Classification requested with model: {model_type}, target: {target_column}")
-        except json.JSONDecodeError:
-            return {"error": "Invalid JSON in feature data"}
-        
-        # Extract data from the JSON structure
-        if isinstance(feature_data_json, dict):
-            # Handle possible data structures
-            if "features" in feature_data_json:
-                feature_data = feature_data_json["features"]
-            elif "selectedFeatures" in feature_data_json:
-                feature_data = feature_data_json["selectedFeatures"]
-            elif "originalData" in feature_data_json:
-                feature_data = feature_data_json["originalData"]
-            else:
-                return {"error": "Could not find feature data in the provided payload"}
-        else:
-            feature_data = feature_data_json
-              # Convert to DataFrame
-        try:
-            df = pd.DataFrame(feature_data)
-            print(f"Data loaded with columns: {df.columns.tolist()}")
-        except Exception as e:
-            return {"error": f"Failed to create DataFrame: {str(e)}"}
-            
-        if df.empty:
-            return {"error": "DataFrame is empty after conversion"}
+            df = _feature_frame(content)
+        except ValueError as e:
+            return {"error": str(e)}
         
         # Select numeric columns
         numeric_cols = df.select_dtypes(include=[np.number]).columns.tolist()
         # Decide mode based on model_type: supervised if a supervised model is selected, else unsupervised clustering
-        supervised_models = ['random_forest', 'svm', 'logistic_regression', 'logistic']
-        if model_type in supervised_models:
+        if model_type in SUPERVISED_MODELS:
             # Ensure target column is provided and exists in the data
             if not target_column or target_column not in df.columns:
                 return {'error': f"Target column '{target_column}' not found in data"}
@@ -86,16 +360,12 @@ async def classify_features(
                 X = X.drop(columns=[target_column])
             scaler = StandardScaler()
             X_scaled = scaler.fit_transform(X)
-            X_train, X_test, y_train, y_test = train_test_split(
-                X_scaled, y, test_size=0.3, random_state=42,
+            X_train, X_test, y_train, y_test, _, test_rows = train_test_split(
+                X_scaled, y, np.arange(len(y)), test_size=0.3, random_state=42,
                 stratify=y if len(y.unique()) > 1 else None
             )
-            if model_type == 'svm':
-                model = SVC(kernel='rbf', probability=True, random_state=42)
-            elif model_type in ['logistic_regression', 'logistic']:
-                model = LogisticRegression(max_iter=1000, random_state=42)
-            else:
-                model = RandomForestClassifier(n_estimators=100, random_state=42)
+            model = model_search.build_model(model_type, calibrate=calibrate, svm_solver=svm_solver, n_rows=len(X_train))
+            solver = model_search.solver_name(model)
             model.fit(X_train, y_train)
             y_pred = model.predict(X_test)
             metrics = {
@@ -104,42 +374,86 @@ async def classify_features(
                 'recall': recall_score(y_test, y_pred, average='weighted', zero_division=0),
                 'f1_score': f1_score(y_test, y_pred, average='weighted', zero_division=0)
             }
-            feat_imp: Dict[str, Any] = {}
-            if hasattr(model, 'feature_importances_'):
-                imps = model.feature_importances_
-                feat_imp = {col: float(imps[i]) for i, col in enumerate(X.columns)}
-            elif hasattr(model, 'coef_'):
-                coefs = np.abs(model.coef_).mean(axis=0)
-                feat_imp = {col: float(coefs[i]) for i, col in enumerate(X.columns)}
-            return {
+            feat_imp = _feature_importances(model, X.columns)
+            # Keep the fitted model so new batches can be scored without retraining
+            try:
+                model_id = model_registry.save_model(model, scaler, X.columns.tolist(), {
+                    'modelType': model_type,
+                    'solver': solver,
+                    'target': target_column,
+                    'metrics': metrics,
+                    'numTrain': len(X_train),
+                    'numTest': len(X_test),
+                })
+            except OSError as e:
+                logger.warning("Could not store the trained model: %s", e)
+                model_id = None
+            result = {
                 'mode': 'supervised',
                 'model': model_type,
+                'modelId': model_id,
+                'solver': solver,
                 'metrics': metrics,
                 'feature_importances': feat_imp
             }
+            if importance == "permutation" and model_id is not None:
+                classes, y_codes = np.unique(y_test.to_numpy(), return_inverse=True)
+                result['heldOut'] = {
+                    'dataset': model_search.write_dataset(X.to_numpy(dtype=float)[test_rows], y_codes),
+                    'features': X.columns.tolist(),
+                    'classes': classes.tolist(),
+                }
+            return result
         # Unsupervised clustering path
         X = df[numeric_cols]
-        print(f"Using {len(numeric_cols)} numeric feature columns for clustering")
-        # Default to KMeans clustering
-        num_clusters = 3
-        model = KMeans(n_clusters=num_clusters, random_state=42)
-        cluster_labels = model.fit_predict(X)
+        logger.debug("Using %s numeric feature columns for clustering", len(numeric_cols))
+        X_values = X.to_numpy(dtype=float)
+        hierarchical = model_type in HIERARCHICAL_MODELS
+        if hierarchical and linkage not in HIERARCHICAL_LINKAGES:
+            return {"error": f"Unknown linkage '{linkage}', use one of {list(HIERARCHICAL_LINKAGES)}"}
+        k_selection = None
+        hierarchy = None
+        num_clusters = None
+        if isinstance(n_clusters, str) and n_clusters.strip().lower() == "auto":
+            if not hierarchical:
+                k_selection = select_k(X_values, k_range[0], k_range[1], sample_size or CLUSTER_SAMPLE_SIZE)
+                num_clusters = k_selection['selected']
+        else:
+            try:
+                num_clusters = int(n_clusters) if n_clusters not in (None, "") else DEFAULT_CLUSTERS
+            except ValueError:
+                return {"error": f"n_clusters must be an integer or 'auto', got '{n_clusters}'"}
+        if num_clusters is not None and not 1 <= num_clusters <= len(X_values):
+            return {"error": f"n_clusters must be between 1 and the number of rows ({len(X_values)})"}
+        visualization = (visualization or "points").lower()
+        if visualization not in VISUALIZATION_MODES:
+            return {"error": f"Unknown visualization '{visualization}', use one of {list(VISUALIZATION_MODES)}"}
+        if visualization == "auto":
+            visualization = "density" if len(X_values) > DENSITY_AUTO_ROWS else "points"
+        if hierarchical:
+            model = None
+            cluster_labels, hierarchy = hierarchical_clusters(X_values, num_clusters, k_range, linkage, n_neighbors)
+            num_clusters = hierarchy['selected']
+        else:
+            # Default to KMeans clustering
+            model = _kmeans(num_clusters, len(X_values))
+            cluster_labels = model.fit_predict(X_values)
         # Compute 2D PCA coordinates for visualization
         scaler_vis = StandardScaler()
         X_scaled_vis = scaler_vis.fit_transform(X)
-        pca_vis = PCA(n_components=2)
+        pca_vis = PCA(n_components=2, svd_solver='randomized', random_state=42)
         coords = pca_vis.fit_transform(X_scaled_vis)
-        pca_coords = coords.tolist()
         # Compute cluster distribution
         from collections import Counter
         # Count labels and convert numpy ints to native Python types for JSON serialization
         raw_counts = Counter(cluster_labels)
         cluster_distribution = { str(int(k)): int(v) for k, v in raw_counts.items() }
         df['cluster'] = cluster_labels
-        # Compute clustering metrics
-        silhouette = silhouette_score(X, cluster_labels) if num_clusters > 1 else None
-        calinski = calinski_harabasz_score(X, cluster_labels) if num_clusters > 1 else None
-        davies = davies_bouldin_score(X, cluster_labels) if num_clusters > 1 else None
+        # Compute clustering metrics; silhouette is estimated on a sample of large tables
+        has_clusters = 1 < len(raw_counts) < len(X_values)
+        silhouette = _silhouette(X_values, cluster_labels) if has_clusters else None
+        calinski = calinski_harabasz_score(X_values, cluster_labels) if has_clusters else None
+        davies = davies_bouldin_score(X_values, cluster_labels) if has_clusters else None
         # Compute explained variance (1 - within_ss/total_ss) for KMeans if available
         explained_variance = None
         if hasattr(model, 'inertia_'):
@@ -153,21 +467,32 @@ async def classify_features(
         if hasattr(model, 'cluster_centers_'):
             centers = model.cluster_centers_
             cluster_centers = {f'center_{i}': centers[i].tolist() for i in range(len(centers))}
-        return {
+        result = {
             'mode': 'unsupervised',
             'model': model_type,
+            'algorithm': 'agglomerative' if hierarchical else 'minibatch_kmeans' if isinstance(model, MiniBatchKMeans) else 'kmeans',
             'numClusters': num_clusters,
             'cluster_distribution': cluster_distribution,
             'metrics': {
-                'silhouette': silhouette,
-                'calinskiHarabasz': calinski,
-                'daviesBouldin': davies
+                'silhouette': None if silhouette is None else float(silhouette),
+                'silhouetteSampleSize': min(len(X_values), SILHOUETTE_SAMPLE_SIZE) if has_clusters else None,
+                'calinskiHarabasz': None if calinski is None else float(calinski),
+                'daviesBouldin': None if davies is None else float(davies)
             },
             'explainedVariance': explained_variance,
             'cluster_centers': cluster_centers,
-            'labels': [int(l) for l in cluster_labels],
-            'pca_coords': pca_coords
+            'visualization': visualization,
         }
+        if visualization == "density":
+            result['density'] = density_view(coords, cluster_labels, grid_size)
+        else:
+            result['labels'] = [int(l) for l in cluster_labels]
+            result['pca_coords'] = coords.tolist()
+        if k_selection is not None:
+            result['kSelection'] = k_selection
+        if hierarchy is not None:
+            result['hierarchy'] = hierarchy
+        return result
     except Exception as e:
         return {"error": str(e)}
 
@@ -177,27 +502,414 @@ async def preview_dbscan(
     min_pts: int = Form(...),
     features: UploadFile = File(...)
 ):
-    """Run a lightweight DBSCAN to return approximate cluster count for given eps/min_pts."""
+    """Return the DBSCAN cluster count for given eps/min_pts, for the UI's parameter sliders."""
+    content = await features.read()
+    # Runs on a thread so every request sees this process's cached neighbor graphs
+    return await run_in_thread(run_dbscan_preview, content, eps, min_pts)
+
+
+def run_dbscan_preview(content: bytes, eps: float, min_pts: int) -> Dict[str, Any]:
+    """
+    Count DBSCAN clusters for the uploaded features.
+
+    The payload is parsed, scaled and indexed once per dataset; the radius-neighbors
+    graph and the k-nearest-neighbor distances are cached (keyed by a hash of the
+    upload), so moving the sliders only relabels the connected components of the cached
+    graph. The result matches ``DBSCAN(eps, min_samples=min_pts)`` on the scaled features.
+
+    Returns:
+    --------
+    dict
+        'numClusters', 'numNoise' and 'numCore' points, 'kDistance' (the sorted distances
+        of each point to its min_pts-th neighbor, downsampled to KDIST_CURVE_POINTS),
+        'suggestedEps' (the knee of that curve) and 'cached' (whether the graph was reused).
+    """
     try:
-        content = await features.read()
-        payload = json.loads(content.decode('utf-8'))
-        # extract feature list
-        feature_data = payload.get('features', payload)
-        df = pd.DataFrame(feature_data)
-        # numeric only
-        import numpy as np
-        numeric_cols = df.select_dtypes(include=[np.number]).columns.tolist()
-        if not numeric_cols:
-            return {'numClusters': 0}
-        X = df[numeric_cols]
-        # Scale features for consistent distance metric
-        from sklearn.preprocessing import StandardScaler
-        scaler = StandardScaler()
-        X = scaler.fit_transform(X)
-        model = DBSCAN(eps=eps, min_samples=min_pts)
-        labels = model.fit_predict(X)
-        # count clusters excluding noise (-1)
-        unique = set(labels.tolist()) - {-1}
-        return {'numClusters': len(unique)}
+        if eps <= 0 or min_pts < 1:
+            return {'numClusters': None, 'error': 'eps must be positive and min_pts at least 1'}
+        key = hashlib.sha256(content).hexdigest()
+        entry = _preview_cache.get(key)
+        cached = entry is not None
+        if entry is None:
+            payload = json.loads(content.decode('utf-8'))
+            # extract feature list
+            feature_data = payload.get('features', payload)
+            df = pd.DataFrame(feature_data)
+            # numeric only
+            numeric_cols = df.select_dtypes(include=[np.number]).columns.tolist()
+            if not numeric_cols:
+                return {'numClusters': 0}
+            # Scale features for consistent distance metric
+            X = StandardScaler().fit_transform(df[numeric_cols])
+            if len(X) < 2:
+                return {'numClusters': 0}
+            entry = {
+                'index': NearestNeighbors().fit(X),
+                'graph': None,
+                'radius': 0.0,
+                'kdist': None,
+                'lock': threading.Lock(),
+            }
+            _preview_cache.put(key, entry)
+
+        # Graphs are only widened, under the entry's lock; readers get a consistent snapshot
+        with entry['lock']:
+            index = entry['index']
+            if entry['radius'] < eps:
+                # Neighbors within the widened radius, self excluded, with distances as data
+                entry['radius'] = eps * PREVIEW_RADIUS_HEADROOM
+                entry['graph'] = index.radius_neighbors_graph(radius=entry['radius'], mode='distance')
+                cached = False
+            n_neighbors = min(max(PREVIEW_KDIST_NEIGHBORS, min_pts), index.n_samples_fit_ - 1)
+            if entry['kdist'] is None or entry['kdist'].shape[1] < n_neighbors:
+                entry['kdist'] = index.kneighbors(n_neighbors=n_neighbors, return_distance=True)[0]
+            graph, kdist = entry['graph'], entry['kdist']
+
+        labels, core = _dbscan_labels(graph, eps, min_pts)
+        curve = _kdistance_curve(kdist, min_pts)
+        return {
+            'numClusters': int(labels.max() + 1),
+            'numNoise': int((labels == -1).sum()),
+            'numCore': int(core.sum()),
+            'kDistance': curve.tolist(),
+            'suggestedEps': _knee(curve),
+            'cached': cached,
+        }
     except Exception as e:
         return {'numClusters': None, 'error': str(e)}
+
+
+def select_k(X: np.ndarray, k_min: int, k_max: int, sample_size: int = CLUSTER_SAMPLE_SIZE) -> Dict[str, Any]:
+    """
+    Choose the number of k-means clusters by sweeping k over a sample of the rows.
+
+    Every candidate is fitted with MiniBatchKMeans (in parallel threads) on at most
+    ``sample_size`` rows and scored with the silhouette coefficient (on at most
+    SILHOUETTE_SAMPLE_SIZE rows) and the Calinski-Harabasz index, so time and memory
+    do not grow with the table.
+
+    Returns:
+    --------
+    dict
+        'selected' (k with the best silhouette, Calinski-Harabasz breaking ties),
+        'method', 'kRange', 'sampleSize' and 'curve', one entry per k with
+        'inertia' (for the elbow plot), 'silhouette', 'calinskiHarabasz' and 'seconds'.
+    """
+    sample = _sample_rows(X, sample_size)
+    k_min = max(2, int(k_min))
+    k_max = min(int(k_max), len(sample) - 1)
+    if k_max < k_min:
+        raise ValueError(f"Cannot sweep k from {k_min} to {k_max} with {len(sample)} rows")
+    curve = Parallel(n_jobs=AUTO_K_JOBS, prefer="threads")(
+        delayed(_score_k)(sample, k) for k in range(k_min, k_max + 1)
+    )
+    scored = [entry for entry in curve if entry['silhouette'] is not None]
+    if scored:
+        best = max(scored, key=lambda entry: (entry['silhouette'], entry['calinskiHarabasz']))
+    else:
+        best = curve[0]
+    logger.info("Auto-k selected k=%s over k=%s..%s on %s rows", best['k'], k_min, k_max, len(sample))
+    return {
+        'selected': best['k'],
+        'method': 'silhouette',
+        'kRange': [k_min, k_max],
+        'sampleSize': len(sample),
+        'curve': curve,
+    }
+
+
+def hierarchical_clusters(X: np.ndarray, n_clusters: Optional[int], k_range: tuple = AUTO_K_RANGE,
+                          linkage: str = "ward", n_neighbors: int = HIERARCHICAL_NEIGHBORS):
+    """
+    Agglomerative clustering constrained to a sparse k-nearest-neighbour graph.
+
+    Merges are only allowed between neighbouring groups, so memory grows with
+    ``n_neighbors`` per row instead of with all pairs of rows. The full merge tree is
+    built once on at most HIERARCHICAL_MAX_ROWS rows and then cut, so any number of
+    clusters can be read from it; rows left out of the tree join the cluster of their
+    nearest tree row.
+
+    Parameters:
+    -----------
+    X : numpy.ndarray
+        Feature matrix.
+    n_clusters : int or None
+        Clusters to cut the tree into; None picks the k in ``k_range`` whose cut has the
+        largest ratio between the merge that would reduce k clusters to k - 1 and the
+        merge before it (the most pronounced jump in merge height).
+    linkage : str
+        'ward', 'average', 'complete' or 'single'.
+    n_neighbors : int
+        Neighbours per row in the connectivity graph.
+
+    Returns:
+    --------
+    tuple
+        (labels, hierarchy) where hierarchy holds the 'selected' k, the tree settings,
+        'cutLevels' ({'k', 'height', 'ratio'} for the top DENDROGRAM_LEAVES cuts; a cut
+        just below 'height' yields k clusters) and the truncated 'dendrogram'
+        ('leaves' with their 'size' and 'cluster', and the 'merges' above them).
+    """
+    n = len(X)
+    if n < 3:
+        raise ValueError("Hierarchical clustering needs at least 3 rows")
+    tree_rows = np.arange(n)
+    if n > HIERARCHICAL_MAX_ROWS:
+        tree_rows = np.sort(np.random.default_rng(42).choice(n, HIERARCHICAL_MAX_ROWS, replace=False))
+    X_tree = X[tree_rows]
+    m = len(X_tree)
+    n_neighbors = int(min(max(n_neighbors, 1), m - 1))
+    connectivity = kneighbors_graph(X_tree, n_neighbors, include_self=False)
+    n_components, _ = connected_components(connectivity, directed=False)
+    start = time.perf_counter()
+    with warnings.catch_warnings():
+        # Disconnected graphs are joined by scikit-learn; reported as 'connectedComponents'
+        warnings.simplefilter("ignore", UserWarning)
+        tree = AgglomerativeClustering(
+            n_clusters=None, distance_threshold=0, compute_full_tree=True,
+            connectivity=connectivity, linkage=linkage,
+        ).fit(X_tree)
+    children, heights = tree.children_, tree.distances_
+    logger.debug("Merge tree on %s rows built in %.2fs", m, time.perf_counter() - start)
+
+    # heights[m - k] is the merge that reduces k clusters to k - 1, ratios[k] its jump
+    # over the merge before
+    ratios = np.full(m + 1, np.nan)
+    ks = np.arange(2, m)
+    ratios[ks] = heights[m - ks] / np.maximum(heights[m - ks - 1], np.finfo(float).tiny)
+    top = min(DENDROGRAM_LEAVES, m)
+    cut_levels = [
+        {'k': k, 'height': float(heights[m - k]), 'ratio': None if np.isnan(ratios[k]) else float(ratios[k])}
+        for k in range(2, top + 1)
+    ]
+    if n_clusters is None:
+        k_min, k_max = max(k_range[0], 2), min(k_range[1], m - 1)
+        if k_min > k_max:
+            raise ValueError(f"No k in {list(k_range)} can be cut from a tree of {m} rows")
+        n_clusters = k_min + int(np.argmax(ratios[k_min:k_max + 1]))
+    n_clusters = int(min(n_clusters, m))
+
+    node_labels = _cut_tree(children, m, n_clusters)
+    labels = np.empty(n, dtype=int)
+    labels[tree_rows] = node_labels[:m]
+    if m < n:
+        rest = np.setdiff1d(np.arange(n), tree_rows, assume_unique=True)
+        nearest = NearestNeighbors(n_neighbors=1).fit(X_tree).kneighbors(X[rest], return_distance=False)[:, 0]
+        labels[rest] = node_labels[nearest]
+
+    sizes = np.ones(2 * m - 1, dtype=int)
+    for i, (a, b) in enumerate(children):
+        sizes[m + i] = sizes[a] + sizes[b]
+    first_shown = m - top
+    merges = [
+        {'id': int(m + i), 'children': [int(a), int(b)], 'height': float(heights[i]), 'size': int(sizes[m + i])}
+        for i, (a, b) in enumerate(children[first_shown:], start=first_shown)
+    ]
+    shown = {merge['id'] for merge in merges}
+    leaves = [
+        {'id': c, 'size': int(sizes[c]), 'cluster': int(node_labels[c]) if n_clusters <= top else None}
+        for merge in merges for c in merge['children'] if c not in shown
+    ]
+    return labels, {
+        'selected': n_clusters,
+        'linkage': linkage,
+        'nNeighbors': n_neighbors,
+        'treeRows': m,
+        'connectedComponents': int(n_components),
+        'cutLevels': cut_levels,
+        'dendrogram': {'leaves': leaves, 'merges': merges},
+    }
+
+
+def density_view(coords: np.ndarray, labels: np.ndarray, grid_size: int = DENSITY_GRID_SIZE,
+                 sample_points: int = DENSITY_SAMPLE_POINTS) -> Dict[str, Any]:
+    """
+    Compact plot data for a 2-D projection of many clustered points.
+
+    Parameters:
+    -----------
+    coords : numpy.ndarray
+        (n, 2) projected coordinates.
+    labels : numpy.ndarray
+        Cluster label of each row.
+    grid_size : int
+        Bins per axis; all clusters share the same bin edges so grids can be overlaid.
+    sample_points : int
+        Size of the stratified sample: clusters are sampled in proportion to their size,
+        with at least DENSITY_MIN_CLUSTER_POINTS points each (or all of a smaller cluster).
+
+    Returns:
+    --------
+    dict
+        'xEdges', 'yEdges', 'grids' (cluster -> grid_size x grid_size counts, indexed
+        [x bin][y bin]) and 'sample' with 'indices' (row numbers), 'coords' and 'labels'.
+    """
+    grid_size = int(min(max(grid_size, 2), 512))
+    x, y = coords[:, 0], coords[:, 1]
+    x_edges = np.histogram_bin_edges(x, bins=grid_size)
+    y_edges = np.histogram_bin_edges(y, bins=grid_size)
+    rng = np.random.default_rng(42)
+    grids = {}
+    sample = []
+    clusters, counts = np.unique(labels, return_counts=True)
+    for cluster, count in zip(clusters, counts):
+        rows = np.flatnonzero(labels == cluster)
+        grid, _, _ = np.histogram2d(x[rows], y[rows], bins=[x_edges, y_edges])
+        grids[str(int(cluster))] = grid.astype(int).tolist()
+        share = max(DENSITY_MIN_CLUSTER_POINTS, int(round(sample_points * count / len(labels))))
+        sample.append(rows if count <= share else rng.choice(rows, share, replace=False))
+    sample = np.sort(np.concatenate(sample))
+    return {
+        'gridSize': grid_size,
+        'xEdges': x_edges.tolist(),
+        'yEdges': y_edges.tolist(),
+        'grids': grids,
+        'sample': {
+            'indices': sample.tolist(),
+            'coords': coords[sample].round(6).tolist(),
+            'labels': labels[sample].astype(int).tolist(),
+        },
+    }
+
+
+# =============================================================================
+# Internals
+# =============================================================================
+def _feature_frame(content):
+    # The feature table of an upload; ValueError carries the message for the client
+    try:
+        feature_data_json = json.loads(content.decode("utf-8"))
+    except (UnicodeDecodeError, json.JSONDecodeError):
+        raise ValueError("Invalid JSON in feature data")
+    
+    # Extract data from the JSON structure
+    if isinstance(feature_data_json, dict):
+        # Handle possible data structures
+        if "features" in feature_data_json:
+            feature_data = feature_data_json["features"]
+        elif "selectedFeatures" in feature_data_json:
+            feature_data = feature_data_json["selectedFeatures"]
+        elif "originalData" in feature_data_json:
+            feature_data = feature_data_json["originalData"]
+        else:
+            raise ValueError("Could not find feature data in the provided payload")
+    else:
+        feature_data = feature_data_json
+    # Convert to DataFrame
+    try:
+        df = pd.DataFrame(feature_data)
+        logger.debug("Data loaded with columns: %s", df.columns.tolist())
+    except Exception as e:
+        raise ValueError(f"Failed to create DataFrame: {str(e)}")
+    if df.empty:
+        raise ValueError("DataFrame is empty after conversion")
+    return df
+
+
+def _feature_importances(model, columns):
+    feat_imp: Dict[str, Any] = {}
+    if hasattr(model, 'feature_importances_'):
+        imps = model.feature_importances_
+        feat_imp = {col: float(imps[i]) for i, col in enumerate(columns)}
+    elif hasattr(model, 'coef_'):
+        coefs = np.abs(model.coef_).mean(axis=0)
+        feat_imp = {col: float(coefs[i]) for i, col in enumerate(columns)}
+    return feat_imp
+
+
+def _kmeans(n_clusters, n_rows):
+    if n_rows > MINIBATCH_ROWS:
+        return MiniBatchKMeans(n_clusters=n_clusters, random_state=42, batch_size=4096, n_init=3)
+    return KMeans(n_clusters=n_clusters, random_state=42)
+
+
+def _score_k(X, k):
+    start = time.perf_counter()
+    model = MiniBatchKMeans(n_clusters=k, random_state=42, batch_size=4096, n_init=3).fit(X)
+    labels = model.labels_
+    entry = {'k': k, 'inertia': float(model.inertia_), 'silhouette': None, 'calinskiHarabasz': None}
+    if 1 < len(np.unique(labels)) < len(X):
+        entry['silhouette'] = float(_silhouette(X, labels))
+        entry['calinskiHarabasz'] = float(calinski_harabasz_score(X, labels))
+    entry['seconds'] = time.perf_counter() - start
+    return entry
+
+
+def _silhouette(X, labels):
+    # Exact up to the sample budget, estimated on a fixed random sample above it
+    if len(X) <= SILHOUETTE_SAMPLE_SIZE:
+        return silhouette_score(X, labels)
+    return silhouette_score(X, labels, sample_size=SILHOUETTE_SAMPLE_SIZE, random_state=42)
+
+
+def _cut_tree(children, n_leaves, n_clusters):
+    # Cluster of every tree node after the first n_leaves - n_clusters merges: parents
+    # are resolved to their root by pointer jumping. Nodes merged above the cut are
+    # left out (-1).
+    parent = np.arange(2 * n_leaves - 1)
+    applied = n_leaves - n_clusters
+    parent[children[:applied].ravel()] = np.repeat(np.arange(n_leaves, n_leaves + applied), 2)
+    while True:
+        grandparent = parent[parent]
+        if np.array_equal(grandparent, parent):
+            break
+        parent = grandparent
+    roots = np.unique(parent[:n_leaves])
+    labels = np.searchsorted(roots, parent)
+    labels[(labels >= len(roots)) | (roots[np.minimum(labels, len(roots) - 1)] != parent)] = -1
+    return labels
+
+
+def _set_permutation_importance(result, permutation, split):
+    result['permutationImportance'] = {**permutation, 'split': split}
+    result['feature_importances'] = {
+        feature: scores['mean'] for feature, scores in permutation['importances'].items()
+    }
+
+
+def _sample_rows(X, size):
+    if size is None or len(X) <= size:
+        return X
+    rows = np.random.default_rng(42).choice(len(X), size, replace=False)
+    return X[np.sort(rows)]
+
+
+def _dbscan_labels(graph, eps, min_pts):
+    # DBSCAN on a precomputed radius graph: core points have min_pts neighbors within
+    # eps (themselves included), clusters are the connected components of core points,
+    # and border points join the cluster of a core neighbor
+    n = graph.shape[0]
+    within = graph.data <= eps
+    adjacency = csr_matrix((within, graph.indices, graph.indptr), shape=graph.shape)
+    adjacency.eliminate_zeros()
+    core = np.diff(adjacency.indptr) + 1 >= min_pts
+    labels = np.full(n, -1)
+    if not core.any():
+        return labels, core
+    core_idx = np.flatnonzero(core)
+    _, components = connected_components(adjacency[core_idx][:, core_idx], directed=False)
+    labels[core_idx] = components
+    border_idx = np.flatnonzero(~core)
+    to_core = adjacency[border_idx][:, core_idx].tocsr()
+    has_core = np.diff(to_core.indptr) > 0
+    # First core neighbor of each border point
+    labels[border_idx[has_core]] = components[to_core.indices[to_core.indptr[:-1][has_core]]]
+    return labels, core
+
+
+def _kdistance_curve(kdist, min_pts):
+    # Distance to the (min_pts - 1)-th other point, the eps at which a point becomes core
+    column = min(max(min_pts - 2, 0), kdist.shape[1] - 1)
+    distances = np.sort(kdist[:, column])
+    if len(distances) > KDIST_CURVE_POINTS:
+        distances = distances[np.linspace(0, len(distances) - 1, KDIST_CURVE_POINTS).round().astype(int)]
+    return distances
+
+
+def _knee(curve):
+    # Point of the ascending curve farthest below the chord between its ends
+    if len(curve) < 3 or curve[-1] <= curve[0]:
+        return float(curve[-1]) if len(curve) else None
+    x = np.linspace(0, 1, len(curve))
+    y = (curve - curve[0]) / (curve[-1] - curve[0])
+    return float(curve[np.argmax(x - y)])
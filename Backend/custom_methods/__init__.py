@@ -6,6 +6,7 @@ __all__ = [
     "signal_filter",
     "signal_interpolate",
     "signal_resample",
+    "StreamingResampler",
     "signal_rate",
     "signal_period",
     "signal_formatpeaks",
@@ -16,7 +17,7 @@ __all__ = [
 
 from .signal_filter import signal_filter
 from .signal_interpolate import signal_interpolate
-from .signal_resample import signal_resample
+from .signal_resample import StreamingResampler, signal_resample
 from .signal_rate import signal_rate
 from .signal_period import signal_period
 from .signal_formatpeaks import signal_formatpeaks
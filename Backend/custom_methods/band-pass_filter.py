@@ -4,7 +4,8 @@
 
 import pandas as pd
 import numpy as np
-from scipy import signal
+
+from custom_methods.filter_engine import FILTER_TYPES, design_filter, filter_matrix
 
 def process_data(df, params):
     """
@@ -61,31 +62,23 @@ def process_data(df, params):
     if not numeric_cols:
         return result
 
-    normalized = [low_cutoff/(sampling_rate/2), high_cutoff/(sampling_rate/2)]
-    # Design filter
-    if filter_type.lower() == 'butter':
-        b, a = signal.butter(filter_order, normalized, btype='band', analog=False)
-    elif filter_type.lower() == 'cheby1':
-        rp = params.get('ripple', 1)
-        b, a = signal.cheby1(filter_order, rp, normalized, btype='band', analog=False)
-    elif filter_type.lower() == 'cheby2':
-        rs = params.get('stopband_attenuation', 40)
-        b, a = signal.cheby2(filter_order, rs, normalized, btype='band', analog=False)
-    elif filter_type.lower() == 'ellip':
-        rp = params.get('ripple', 1)
-        rs = params.get('stopband_attenuation', 40)
-        b, a = signal.ellip(filter_order, rp, rs, normalized, btype='band', analog=False)
-    else:
-        b, a = signal.butter(filter_order, normalized, btype='band', analog=False)
+    # Design filter (cached across calls with the same parameters)
+    sos = design_filter(
+        filter_type if filter_type.lower() in FILTER_TYPES else 'butter',
+        filter_order,
+        [low_cutoff, high_cutoff],
+        sampling_rate,
+        btype='bandpass',
+        ripple=params.get('ripple', 1),
+        stopband_attenuation=params.get('stopband_attenuation', 40),
+    )
 
-    for col in numeric_cols:
-        data = result[col].values
-        try:
-            filtered = signal.filtfilt(b, a, data)
-        except ValueError:
-            continue
-        new_name = f"{col}_band_pass" if add_suffix else col
-        result[new_name] = filtered
+    # Filter all numeric columns in one pass; columns too short to filter are skipped
+    filtered, valid = filter_matrix(result[numeric_cols].to_numpy(dtype=float), sos)
+    filtered_cols = [col for col, ok in zip(numeric_cols, valid) if ok]
+    if filtered_cols:
+        new_names = [f"{col}_band_pass" if add_suffix else col for col in filtered_cols]
+        result[new_names] = filtered[:, valid]
 
     # Attach metadata
     info = {
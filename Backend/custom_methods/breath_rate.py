@@ -26,6 +26,7 @@ def process_data(df, params):
             - 'method' : str
             - 'peak_method' : str
             - 'interpolation_method' : str
+            - 'chunk_size' : int, optional block size (in samples) for peak detection.
 
     Returns:
     --------
@@ -42,6 +43,10 @@ def process_data(df, params):
     method = params.get('method', 'trough')
     peak_method = params.get('peak_method', 'khodadad2018')
     interpolation_method = params.get('interpolation_method', 'monotone_cubic')
+    chunk_size = params.get('chunk_size', None)
+    chunk_size = None if chunk_size in (None, '') else int(chunk_size)
+    if chunk_size is not None and chunk_size <= 0:
+        raise ValueError("Chunk size must be positive")
 
     # Determine respiration signal column; fallback to first column if not provided or invalid
     if not signal_column or signal_column not in df.columns:
@@ -59,6 +64,7 @@ def process_data(df, params):
         method=method,
         peak_method=peak_method,
         interpolation_method=interpolation_method,
+        chunk_size=chunk_size,
     )
 
     # Return original dataframe with the rate as a new column
@@ -77,10 +83,18 @@ def breath_rate(
     method="trough",
     peak_method="khodadad2018",
     interpolation_method="monotone_cubic",
+    chunk_size=None,
 ):
     if method.lower() in ["period", "peak", "peaks", "trough", "troughs", "signal_rate"]:
         if troughs is None:
-            _, troughs = rsp_peaks(rsp_cleaned, sampling_rate=sampling_rate, method=peak_method)
+            # Only the trough indices are needed, so skip the dense peak signal
+            _, troughs = rsp_peaks(
+                rsp_cleaned,
+                sampling_rate=sampling_rate,
+                method=peak_method,
+                chunk_size=chunk_size,
+                sparse=True,
+            )
         if isinstance(troughs, (pd.DataFrame, dict)):
             troughs = troughs["RSP_Troughs"]
         rate = signal_rate(
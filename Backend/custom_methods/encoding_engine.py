@@ -0,0 +1,238 @@
+# -*- coding: utf-8 -*-
+"""
+Single-pass categorical encoding for the ``encode`` step of ``/preprocess``.
+
+Every categorical column is factorized once. The resulting codes and categories are
+used both to choose an encoding (when the client lets the backend decide) and to
+build that encoding, so only the encoding a column actually gets is computed.
+One-hot blocks are built directly from the codes as sparse boolean columns instead
+of dense ``pd.get_dummies`` output, which keeps high-cardinality columns (serials,
+operator IDs) from multiplying memory.
+"""
+import logging
+
+import numpy as np
+import pandas as pd
+import scipy.sparse
+
+logger = logging.getLogger("backend.encoding")
+
+ENCODING_METHODS = ["onehot", "label"]
+
+# Value sets that indicate an ordered categorical (label encoding keeps the order usable)
+ORDINAL_PATTERNS = [
+    # Size patterns
+    ['small', 'medium', 'large'],
+    ['s', 'm', 'l', 'xl'],
+    ['xs', 's', 'm', 'l', 'xl'],
+    # Rating patterns
+    ['bad', 'ok', 'good'],
+    ['poor', 'fair', 'good', 'excellent'],
+    ['low', 'medium', 'high'],
+    # Grade patterns
+    ['f', 'd', 'c', 'b', 'a'],
+    ['1', '2', '3', '4', '5'],
+    # Frequency patterns
+    ['never', 'rarely', 'sometimes', 'often', 'always'],
+]
+
+
+def profile_categorical(series):
+    """
+    Factorize a categorical column once.
+
+    Parameters:
+    -----------
+    series : pandas.Series
+        Categorical column.
+
+    Returns:
+    --------
+    dict
+        'codes' (int array, -1 for missing), 'categories' (non-missing values in order
+        of first appearance), 'n_unique' and 'n_rows'.
+    """
+    codes, categories = pd.factorize(series, use_na_sentinel=True)
+    return {
+        "codes": codes,
+        "categories": categories,
+        "n_unique": len(categories),
+        "n_rows": len(series),
+    }
+
+
+def choose_encoding(profile):
+    """
+    Choose between one-hot and label encoding for a profiled column.
+
+    Low cardinality (<= 5) uses one-hot, high cardinality (> 20) uses label encoding.
+    In between, ordinal-looking or numeric-like values and columns with more than 10%
+    unique values use label encoding.
+
+    Returns:
+    --------
+    tuple
+        (decision, reason)
+    """
+    unique_count = profile["n_unique"]
+    if unique_count <= 5:
+        return "onehot", f"Low cardinality ({unique_count} unique values)"
+    if unique_count > 20:
+        return "label", f"High cardinality ({unique_count} unique values)"
+
+    values = list(profile["categories"])
+    values_lower = [str(v).lower() for v in values]
+    is_ordinal = any(
+        all(val in pattern for val in values_lower) or all(val in values_lower for val in pattern)
+        for pattern in ORDINAL_PATTERNS
+    )
+    if not is_ordinal:
+        # Numeric-like strings are treated as ordered
+        try:
+            [float(str(v)) for v in values]
+            is_ordinal = True
+        except ValueError:
+            pass
+    if is_ordinal:
+        return "label", f"Detected ordinal relationship (cardinality: {unique_count})"
+
+    sparse_ratio = unique_count / profile["n_rows"]
+    if sparse_ratio > 0.1:  # More than 10% unique
+        return "label", f"High sparsity ratio ({sparse_ratio:.2f}, cardinality: {unique_count})"
+    return "onehot", f"Medium cardinality with low sparsity ({unique_count} unique values)"
+
+
+def plan_encoding(df, cat_cols, encoding_methods):
+    """
+    Decide the encoding of every categorical column.
+
+    Parameters:
+    -----------
+    df : pandas.DataFrame
+        Input data.
+    cat_cols : list
+        Categorical columns to encode.
+    encoding_methods : list
+        Methods selected by the client. A single method is applied to every column;
+        when both are selected the method is chosen per column with
+        :func:`choose_encoding`.
+
+    Returns:
+    --------
+    tuple
+        (plan, profiles) where ``plan`` maps column -> 'onehot' or 'label' and
+        ``profiles`` holds the :func:`profile_categorical` output of each column.
+    """
+    methods = [m for m in ENCODING_METHODS if m in encoding_methods]
+    if not methods:
+        return {}, {}
+
+    profiles = {col: profile_categorical(df[col]) for col in cat_cols}
+    plan = {}
+    for col in cat_cols:
+        if len(methods) == 1:
+            plan[col] = methods[0]
+        else:
+            decision, reason = choose_encoding(profiles[col])
+            logger.debug("Column '%s': %s encoding chosen - %s", col, decision, reason)
+            plan[col] = decision
+    return plan, profiles
+
+
+def encode_frame(df, plan, profiles, passthrough=None):
+    """
+    Build the encoded DataFrame for an encoding plan.
+
+    Output columns are the ``passthrough`` columns in their original order (label
+    encoded columns stay in place when they are passed through), followed by the
+    one-hot blocks, followed by label encoded columns that are not passed through.
+
+    Parameters:
+    -----------
+    df : pandas.DataFrame
+        Input data; not modified.
+    plan : dict
+        Output of :func:`plan_encoding`.
+    profiles : dict
+        Column profiles from :func:`plan_encoding`.
+    passthrough : list
+        Columns kept in front (default: every column that is not one-hot encoded).
+
+    Returns:
+    --------
+    tuple
+        (encoded, encoding_details, new_columns) where ``new_columns`` maps each encoded
+        column to the names of the columns it produced.
+    """
+    if passthrough is None:
+        passthrough = [col for col in df.columns if plan.get(col) != "onehot"]
+
+    encoding_details = {}
+    new_columns = {}
+    label_blocks = {}
+    onehot_blocks = []
+    for col, method in plan.items():
+        if method == "label":
+            codes, details = _encode_label(df[col])
+            label_blocks[col] = pd.Series(codes, index=df.index, name=col)
+            new_columns[col] = [col]
+        else:
+            block, details = _encode_onehot(df[col], profiles[col], col)
+            block.index = df.index
+            onehot_blocks.append(block)
+            new_columns[col] = details["newColumns"]
+        encoding_details[col] = details
+
+    front = {col: label_blocks.get(col, df[col]) for col in passthrough}
+    blocks = [pd.DataFrame(front, index=df.index)] if front else []
+    blocks += onehot_blocks
+    trailing = [series for col, series in label_blocks.items() if col not in passthrough]
+    if trailing:
+        blocks.append(pd.concat(trailing, axis=1))
+
+    encoded = pd.concat(blocks, axis=1) if blocks else pd.DataFrame(index=df.index)
+    return encoded, encoding_details, new_columns
+
+
+# =============================================================================
+# Internals
+# =============================================================================
+def _encode_label(series):
+    # Same codes as sklearn's LabelEncoder on the string values (sorted classes, NaN as "nan")
+    as_str = series.map(str)
+    codes, classes = pd.factorize(as_str, sort=True)
+    first_seen = pd.unique(codes)
+    original_values = classes[first_seen].tolist()
+    encoded_values = first_seen.tolist()
+    return codes, {
+        "method": "label",
+        "originalValues": original_values,
+        "encodedValues": encoded_values,
+        "mapping": dict(zip(original_values, encoded_values)),
+    }
+
+
+def _encode_onehot(series, profile, name):
+    categories = profile["categories"]
+    # Columns are ordered by sorted category, like pd.get_dummies
+    try:
+        order = np.argsort(categories, kind="stable")
+    except TypeError:
+        order = np.arange(len(categories))
+    rank = np.empty(len(order), dtype=np.int64)
+    rank[order] = np.arange(len(order))
+
+    codes = profile["codes"]
+    present = codes >= 0
+    rows = np.flatnonzero(present)
+    matrix = scipy.sparse.csc_matrix(
+        (np.ones(len(rows), dtype=bool), (rows, rank[codes[present]])),
+        shape=(len(series), len(categories)),
+    )
+    columns = [f"{name}_{categories[i]}" for i in order]
+    block = pd.DataFrame.sparse.from_spmatrix(matrix, columns=columns)
+    return block, {
+        "method": "onehot",
+        "originalValues": categories.tolist(),
+        "newColumns": columns,
+    }
@@ -0,0 +1,196 @@
+# -*- coding: utf-8 -*-
+"""
+Shared filter design cache and multi-channel zero-phase filtering.
+
+Used by the low-pass, high-pass and band-pass preprocessing methods and by
+:func:`signal_filter`. Filters are designed once per parameter set as second-order
+sections and applied to a whole ``(samples, channels)`` matrix in a single
+``scipy.signal.sosfiltfilt`` call.
+"""
+import functools
+
+import numpy as np
+import pandas as pd
+import scipy.signal
+
+FILTER_TYPES = ["butter", "cheby1", "cheby2", "ellip", "bessel"]
+
+
+def design_filter(
+    filter_type,
+    order,
+    cutoff,
+    sampling_rate,
+    btype="lowpass",
+    ripple=1,
+    stopband_attenuation=40,
+):
+    """
+    Design (or reuse) an IIR filter as second-order sections.
+
+    Parameters:
+    -----------
+    filter_type : str
+        One of 'butter', 'cheby1', 'cheby2', 'ellip' or 'bessel'.
+    order : int
+        Filter order.
+    cutoff : float or list
+        Cutoff frequency in Hz, or [low, high] for band filters.
+    sampling_rate : float
+        Sampling rate in Hz.
+    btype : str
+        'lowpass', 'highpass', 'bandpass' or 'bandstop'.
+    ripple : float
+        Passband ripple in dB (cheby1 and ellip only).
+    stopband_attenuation : float
+        Stopband attenuation in dB (cheby2 and ellip only).
+
+    Returns:
+    --------
+    numpy.ndarray
+        Array of second-order sections, shape (n_sections, 6).
+    """
+    filter_type = filter_type.lower()
+    if filter_type not in FILTER_TYPES:
+        raise ValueError(f"Unknown filter type '{filter_type}', expected one of {FILTER_TYPES}")
+    if np.ndim(cutoff) > 0:
+        cutoff = tuple(float(c) for c in cutoff)
+    else:
+        cutoff = float(cutoff)
+    # Only the parameters that affect the chosen design are part of the cache key
+    ripple = float(ripple) if filter_type in ["cheby1", "ellip"] else None
+    stopband_attenuation = (
+        float(stopband_attenuation) if filter_type in ["cheby2", "ellip"] else None
+    )
+    sos = _design_filter_cached(
+        filter_type, int(order), cutoff, float(sampling_rate), btype, ripple, stopband_attenuation
+    )
+    # The cached design is shared between callers; the copy is tiny compared to the signal
+    return sos.copy()
+
+
+@functools.lru_cache(maxsize=128)
+def _design_filter_cached(filter_type, order, cutoff, sampling_rate, btype, ripple, stopband_attenuation):
+    if filter_type == "cheby1":
+        sos = scipy.signal.cheby1(order, ripple, cutoff, btype=btype, output="sos", fs=sampling_rate)
+    elif filter_type == "cheby2":
+        sos = scipy.signal.cheby2(
+            order, stopband_attenuation, cutoff, btype=btype, output="sos", fs=sampling_rate
+        )
+    elif filter_type == "ellip":
+        sos = scipy.signal.ellip(
+            order, ripple, stopband_attenuation, cutoff, btype=btype, output="sos", fs=sampling_rate
+        )
+    elif filter_type == "bessel":
+        sos = scipy.signal.bessel(order, cutoff, btype=btype, output="sos", fs=sampling_rate)
+    else:
+        sos = scipy.signal.butter(order, cutoff, btype=btype, output="sos", fs=sampling_rate)
+    return sos
+
+
+def design_notch(powerline, sampling_rate, harmonics=None, quality_factor=30):
+    """
+    Design (or reuse) a cascade of notch filters at a powerline frequency and its harmonics.
+
+    Parameters:
+    -----------
+    powerline : float
+        Mains frequency in Hz (normally 50 or 60).
+    sampling_rate : float
+        Sampling rate in Hz.
+    harmonics : int
+        Number of frequencies to remove (1 = fundamental only). Defaults to every harmonic
+        below the Nyquist frequency.
+    quality_factor : float
+        Quality factor of each notch (higher = narrower).
+
+    Returns:
+    --------
+    numpy.ndarray
+        Second-order sections of the whole cascade, shape (n_notches, 6).
+    """
+    sos = _design_notch_cached(
+        float(powerline),
+        float(sampling_rate),
+        None if harmonics is None else int(harmonics),
+        float(quality_factor),
+    )
+    return sos.copy()
+
+
+@functools.lru_cache(maxsize=32)
+def _design_notch_cached(powerline, sampling_rate, harmonics, quality_factor):
+    nyquist = sampling_rate / 2
+    frequencies = np.arange(1, int(np.ceil(nyquist / powerline)) + 1) * powerline
+    frequencies = frequencies[frequencies < nyquist]
+    if harmonics is not None:
+        frequencies = frequencies[:harmonics]
+    if len(frequencies) == 0:
+        raise ValueError(
+            f"Powerline frequency {powerline} Hz is above the Nyquist frequency ({nyquist} Hz)"
+        )
+    sections = []
+    for frequency in frequencies:
+        b, a = scipy.signal.iirnotch(frequency, quality_factor, fs=sampling_rate)
+        sections.append(scipy.signal.tf2sos(b, a))
+    return np.vstack(sections)
+
+
+def filter_padlen(sos):
+    """Default edge padding used by ``scipy.signal.sosfiltfilt`` for this filter."""
+    ntaps = 2 * len(sos) + 1
+    ntaps -= min((sos[:, 2] == 0).sum(), (sos[:, 5] == 0).sum())
+    return 3 * ntaps
+
+
+def filter_matrix(data, sos, min_valid=0):
+    """
+    Zero-phase filter every column of a (samples, channels) matrix at once.
+
+    NaN segments are bridged by linear interpolation (constant at the edges) before
+    filtering and set back to NaN afterwards, so that all channels can go through a
+    single ``sosfiltfilt(..., axis=0)`` call regardless of where their gaps are.
+
+    Parameters:
+    -----------
+    data : numpy.ndarray
+        Signal matrix of shape (samples, channels), or a 1D signal.
+    sos : numpy.ndarray
+        Second-order sections, e.g. from :func:`design_filter`.
+    min_valid : int
+        Columns with fewer non-NaN samples than this are not filtered.
+
+    Returns:
+    --------
+    tuple
+        (filtered, filtered_columns) where ``filtered`` has the same shape as ``data`` and
+        ``filtered_columns`` is a boolean mask of the columns that were filtered. Columns
+        that were not filtered are returned unchanged.
+    """
+    data = np.asarray(data, dtype=float)
+    squeeze = data.ndim == 1
+    if squeeze:
+        data = data[:, np.newaxis]
+
+    missing = np.isnan(data)
+    n_valid = len(data) - missing.sum(axis=0)
+    # sosfiltfilt needs more samples than its edge padding
+    valid_columns = (n_valid >= min_valid) & (n_valid > 0) & (len(data) > filter_padlen(sos))
+
+    filtered = data.copy()
+    if valid_columns.any():
+        block = data[:, valid_columns]
+        block_missing = missing[:, valid_columns]
+        if block_missing.any():
+            block = (
+                pd.DataFrame(block)
+                .interpolate(method="linear", limit_direction="both", axis=0)
+                .to_numpy()
+            )
+        block = scipy.signal.sosfiltfilt(sos, block, axis=0)
+        block[block_missing] = np.nan
+        filtered[:, valid_columns] = block
+
+    if squeeze:
+        return filtered[:, 0], valid_columns
+    return filtered, valid_columns
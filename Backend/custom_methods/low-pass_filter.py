@@ -4,7 +4,11 @@
 
 import pandas as pd
 import numpy as np
-from scipy import signal
+
+from custom_methods.filter_engine import FILTER_TYPES, design_filter, filter_matrix
+from telemetry import get_logger
+
+logger = get_logger("custom_methods.low_pass_filter")
 
 def process_data(df, params):
     """
@@ -65,73 +69,44 @@ def process_data(df, params):
                 if pd.api.types.is_numeric_dtype(result[col]):
                     numeric_cols.append(col)
                 else:
-                    print(f"Warning: Column '{col}' is not numeric and will be skipped")
+                    logger.warning("Column '%s' is not numeric and will be skipped", col)
             else:
-                print(f"Warning: Column '{col}' not found in dataframe")
+                logger.warning("Column '%s' not found in dataframe", col)
     
     if len(numeric_cols) == 0:
-        print("Warning: No numeric columns found to filter")
+        logger.warning("No numeric columns found to filter")
         return result
     
-    # Calculate normalized cutoff frequency (0 to 1, where 1 is Nyquist frequency)
-    nyquist = sampling_rate / 2
-    normalized_cutoff = cutoff_freq / nyquist
-    
     try:
-        # Design the filter based on filter type
-        if filter_type.lower() == 'butter':
-            b, a = signal.butter(filter_order, normalized_cutoff, btype='low', analog=False)
-        elif filter_type.lower() == 'cheby1':
-            # Chebyshev Type I filter (ripple in passband)
-            rp = params.get('ripple', 1)  # passband ripple in dB
-            b, a = signal.cheby1(filter_order, rp, normalized_cutoff, btype='low', analog=False)
-        elif filter_type.lower() == 'cheby2':
-            # Chebyshev Type II filter (ripple in stopband)
-            rs = params.get('stopband_attenuation', 40)  # stopband attenuation in dB
-            b, a = signal.cheby2(filter_order, rs, normalized_cutoff, btype='low', analog=False)
-        elif filter_type.lower() == 'ellip':
-            # Elliptic filter (ripple in both passband and stopband)
-            rp = params.get('ripple', 1)  # passband ripple in dB
-            rs = params.get('stopband_attenuation', 40)  # stopband attenuation in dB
-            b, a = signal.ellip(filter_order, rp, rs, normalized_cutoff, btype='low', analog=False)
+        # Design the filter (cached across calls with the same parameters)
+        if filter_type.lower() not in FILTER_TYPES:
+            logger.warning("Unknown filter type '%s', using Butterworth", filter_type)
+            design_type = 'butter'
         else:
-            print(f"Warning: Unknown filter type '{filter_type}', using Butterworth")
-            b, a = signal.butter(filter_order, normalized_cutoff, btype='low', analog=False)
-        
-        # Apply filter to each numeric column
-        for col in numeric_cols:
-            # Get the signal data
-            signal_data = result[col].values
-            
-            # Handle NaN values
-            if np.any(np.isnan(signal_data)):
-                # Create a mask for non-NaN values
-                valid_mask = ~np.isnan(signal_data)
-                if np.sum(valid_mask) < filter_order * 3:
-                    print(f"Warning: Column '{col}' has too many NaN values for reliable filtering")
-                    continue
-                
-                # Apply filter only to valid data
-                valid_data = signal_data[valid_mask]
-                filtered_valid = signal.filtfilt(b, a, valid_data)
-                
-                # Create filtered signal with NaN values preserved
-                filtered_signal = np.full_like(signal_data, np.nan)
-                filtered_signal[valid_mask] = filtered_valid
-            else:
-                # Apply filter to the entire signal
-                if len(signal_data) < filter_order * 3:
-                    print(f"Warning: Column '{col}' has insufficient data points for reliable filtering")
-                    continue
-                filtered_signal = signal.filtfilt(b, a, signal_data)
-            
-            # Store the filtered signal
-            if add_suffix:
-                new_col_name = f"{col}_filtered"
-            else:
-                new_col_name = col
-            
-            result[new_col_name] = filtered_signal
+            design_type = filter_type
+        sos = design_filter(
+            design_type,
+            filter_order,
+            cutoff_freq,
+            sampling_rate,
+            btype='lowpass',
+            ripple=params.get('ripple', 1),  # passband ripple in dB
+            stopband_attenuation=params.get('stopband_attenuation', 40),  # stopband attenuation in dB
+        )
+
+        # Filter all numeric columns in one pass, preserving NaN positions
+        filtered, valid = filter_matrix(
+            result[numeric_cols].to_numpy(dtype=float), sos, min_valid=filter_order * 3
+        )
+        for col, ok in zip(numeric_cols, valid):
+            if not ok:
+                logger.warning("Column '%s' has insufficient data points for reliable filtering", col)
+
+        # Store the filtered signals
+        filtered_cols = [col for col, ok in zip(numeric_cols, valid) if ok]
+        new_col_names = [f"{col}_filtered" if add_suffix else col for col in filtered_cols]
+        if filtered_cols:
+            result[new_col_names] = filtered[:, valid]
         
         # Add metadata about the filtering operation
         filter_info = {
@@ -146,10 +121,13 @@ def process_data(df, params):
         if hasattr(result, 'attrs'):
             result.attrs['lowpass_filter_info'] = filter_info
             
-        print(f"Applied {filter_type} low-pass filter (fc={cutoff_freq}Hz, fs={sampling_rate}Hz, order={filter_order}) to {len(numeric_cols)} columns")
+        logger.debug(
+            "Applied %s low-pass filter (fc=%sHz, fs=%sHz, order=%s) to %s columns",
+            filter_type, cutoff_freq, sampling_rate, filter_order, len(numeric_cols),
+        )
         
     except Exception as e:
-        print(f"Error applying low-pass filter: {str(e)}")
+        logger.warning("Error applying low-pass filter: %s", e)
         raise
     
     return result
\ No newline at end of file
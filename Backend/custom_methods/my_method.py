@@ -4,6 +4,11 @@
 import pandas as pd
 import numpy as np
 
+from custom_methods.scaler_engine import apply_scaler, fit_scaler, subset_scaler
+from telemetry import get_logger
+
+logger = get_logger("custom_methods.zscore")
+
 def process_data(df, params):
     """
     Performs z-score normalization on numeric columns.
@@ -17,6 +22,8 @@ def process_data(df, params):
         - columns: list of specific columns to normalize (default: all numeric)
         - suffix: string to append to normalized column names (default: '_norm')
         - inplace: whether to replace original columns or create new ones (default: False)
+        - fitted: scaler parameters from a previous run (result.attrs['zscore_params']);
+          when given, they are applied instead of refitting on this data
     
     Returns:
     --------
@@ -28,7 +35,7 @@ def process_data(df, params):
     
     # Get parameters with defaults
     columns = params.get('columns', None)
-    print('columns:', columns)
+    logger.debug("Requested columns: %s", columns)
     suffix = params.get('suffix', '_norm')
     inplace = params.get('inplace', True)
     
@@ -40,22 +47,28 @@ def process_data(df, params):
         numeric_cols = result.select_dtypes(include=[np.number]).columns.tolist()
         columns = [col for col in columns if col in numeric_cols]
     
-    # Normalize each column
-    for col in columns:
-        # Calculate mean and std
-        mean_val = result[col].mean()
-        std_val = result[col].std()
-        
-        if std_val > 0:  # Avoid division by zero
-            # Create normalized values
-            normalized = (result[col] - mean_val) / std_val
-            print('normalized:', normalized)
-            
-            # Either replace original or create new column
-            if inplace:
-                result[col] = normalized
-            else:
-                result[f"{col}{suffix}"] = normalized
+    fitted = params.get('fitted')
+    if fitted:
+        # Reuse the statistics of an earlier batch to avoid leaking this batch into them
+        columns = [col for col in fitted['columns'] if col in columns]
+        scaler = subset_scaler(fitted, columns)
+    else:
+        scaler = fit_scaler(result[columns], method='zscore', columns=columns)
+
+    # Normalize all columns in one pass; zero-variance columns are left untouched
+    columns = [col for col in columns if col not in scaler['skipped']]
+    scaler = subset_scaler(scaler, columns)
+    if columns:
+        normalized = apply_scaler(result[columns], scaler)
+        logger.debug("Normalized %s columns over %s rows", len(columns), len(normalized))
+
+        # Either replace original or create new columns
+        if inplace:
+            result[columns] = normalized
+        else:
+            result[[f"{col}{suffix}" for col in columns]] = normalized
+
+    result.attrs['zscore_params'] = scaler
     
     # Return the processed dataframe
     return result
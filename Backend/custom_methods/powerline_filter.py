@@ -0,0 +1,89 @@
+# Powerline Notch Filter Preprocessing Method
+# This method removes mains interference (50/60 Hz and harmonics) from signal data
+# Compatible with the Breath Analysis Platform.
+
+import pandas as pd
+import numpy as np
+
+from custom_methods.filter_engine import design_notch, filter_matrix
+
+def process_data(df, params):
+    """
+    Apply a powerline notch filter to numeric columns in the dataframe.
+
+    This method removes the mains frequency and its harmonics from every
+    selected channel at once, using a cascade of IIR notch filters applied
+    forward and backward (zero phase).
+
+    Parameters:
+    -----------
+    df : pandas.DataFrame
+        The input dataframe containing signal data to filter
+    params : dict
+        Filter parameters:
+        - 'powerline': float, mains frequency in Hz, 50 or 60 (default: 50)
+        - 'sampling_rate': float, sampling rate in Hz (default: 1000.0)
+        - 'harmonics': int, number of harmonics to remove including the fundamental
+          (default: all harmonics below the Nyquist frequency)
+        - 'quality_factor': float, notch quality factor, higher is narrower (default: 30)
+        - 'columns': list, specific columns to filter (default: all numeric columns)
+        - 'add_suffix': bool, whether to add '_notch' suffix to new columns (default: True)
+
+    Returns:
+    --------
+    pandas.DataFrame
+        The dataframe with filtered signal columns
+    """
+    result = df.copy()
+    # The UI sends select values as strings (e.g. powerline "50"), so numbers are converted here
+    powerline = float(params.get('powerline', 50))
+    sampling_rate = float(params.get('sampling_rate', 1000.0))
+    harmonics = params.get('harmonics', None)
+    harmonics = None if harmonics in (None, '') else int(harmonics)
+    quality_factor = float(params.get('quality_factor', 30))
+    target_columns = params.get('columns', None)
+    add_suffix = params.get('add_suffix', True)
+
+    # Parameter validation
+    if powerline <= 0:
+        raise ValueError("Powerline frequency must be positive")
+    if sampling_rate <= 0:
+        raise ValueError("Sampling rate must be positive")
+    if powerline >= sampling_rate / 2:
+        raise ValueError("Powerline frequency must be less than Nyquist frequency (sampling_rate/2)")
+    if harmonics is not None and harmonics <= 0:
+        raise ValueError("Number of harmonics must be positive")
+    if quality_factor <= 0:
+        raise ValueError("Quality factor must be positive")
+
+    # Determine numeric columns
+    if target_columns is None:
+        numeric_cols = result.select_dtypes(include=[np.number]).columns.tolist()
+    else:
+        numeric_cols = [col for col in target_columns if col in result.columns and pd.api.types.is_numeric_dtype(result[col])]
+
+    if not numeric_cols:
+        return result
+
+    # Design the notch cascade once (cached across calls and sessions with the same rig settings)
+    sos = design_notch(powerline, sampling_rate, harmonics=harmonics, quality_factor=quality_factor)
+
+    # Filter all numeric columns in one pass; columns too short to filter are skipped
+    filtered, valid = filter_matrix(result[numeric_cols].to_numpy(dtype=float), sos)
+    filtered_cols = [col for col, ok in zip(numeric_cols, valid) if ok]
+    if filtered_cols:
+        new_names = [f"{col}_notch" if add_suffix else col for col in filtered_cols]
+        result[new_names] = filtered[:, valid]
+
+    # Attach metadata
+    info = {
+        'powerline_hz': powerline,
+        'sampling_rate_hz': sampling_rate,
+        'notch_frequencies_hz': [powerline * (i + 1) for i in range(len(sos))],
+        'quality_factor': quality_factor,
+        'filtered_columns': filtered_cols
+    }
+    if hasattr(result, 'attrs'):
+        result.attrs['powerline_filter_info'] = info
+
+    return result
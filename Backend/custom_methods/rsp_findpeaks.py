@@ -11,6 +11,7 @@ def rsp_findpeaks(
     amplitude_min=0.3,
     peak_distance=0.8,
     peak_prominence=0.5,
+    chunk_size=None,
 ):
     """**Extract extrema in a respiration (RSP) signal**
 
@@ -38,6 +39,13 @@ def rsp_findpeaks(
         seconds.
     peak_prominence: float
         Only applies if method is ``"scipy"``. Minimal prominence between peaks. Default is 0.5.
+    chunk_size : int
+        Only applies if method is ``"khodadad2018"`` or ``"biosppy"``. If provided, zero crossings
+        are detected block by block (blocks of ``chunk_size`` samples overlapping by one sample)
+        instead of over the whole signal at once, which bounds the size of the temporary boolean
+        arrays for very long recordings. Extrema lying across a block boundary are searched over
+        the original signal, so the result is identical to the single-shot call. Default is
+        ``None`` (single block).
 
     Returns
     -------
@@ -75,14 +83,15 @@ def rsp_findpeaks(
             except NameError:
                 rsp_cleaned = rsp_cleaned["RSP"]
 
-    cleaned = np.array(rsp_cleaned)
+    # Chunked processing only reads from the signal, so avoid a full copy of it
+    cleaned = np.array(rsp_cleaned) if chunk_size is None else np.asarray(rsp_cleaned)
 
     # Find peaks
     method = method.lower()  # remove capitalised letters
     if method in ["khodadad", "khodadad2018"]:
-        info = _rsp_findpeaks_khodadad(cleaned, amplitude_min=amplitude_min)
+        info = _rsp_findpeaks_khodadad(cleaned, amplitude_min=amplitude_min, chunk_size=chunk_size)
     elif method == "biosppy":
-        info = _rsp_findpeaks_biosppy(cleaned, sampling_rate=sampling_rate)
+        info = _rsp_findpeaks_biosppy(cleaned, sampling_rate=sampling_rate, chunk_size=chunk_size)
     elif method == "scipy":
         info = _rsp_findpeaks_scipy(
             cleaned,
@@ -101,10 +110,10 @@ def rsp_findpeaks(
 # =============================================================================
 # Methods
 # =============================================================================
-def _rsp_findpeaks_biosppy(rsp_cleaned, sampling_rate):
+def _rsp_findpeaks_biosppy(rsp_cleaned, sampling_rate, chunk_size=None):
     """https://github.com/PIA-Group/BioSPPy/blob/master/biosppy/signals/resp.py"""
 
-    extrema = _rsp_findpeaks_extrema(rsp_cleaned)
+    extrema = _rsp_findpeaks_extrema(rsp_cleaned, chunk_size=chunk_size)
     extrema, amplitudes = _rsp_findpeaks_outliers(rsp_cleaned, extrema, amplitude_min=0)
 
     peaks, troughs = _rsp_findpeaks_sanitize(extrema, amplitudes)
@@ -120,10 +129,10 @@ def _rsp_findpeaks_biosppy(rsp_cleaned, sampling_rate):
     return info
 
 
-def _rsp_findpeaks_khodadad(rsp_cleaned, amplitude_min=0.3):
+def _rsp_findpeaks_khodadad(rsp_cleaned, amplitude_min=0.3, chunk_size=None):
     """https://iopscience.iop.org/article/10.1088/1361-6579/aad7e6/meta"""
 
-    extrema = _rsp_findpeaks_extrema(rsp_cleaned)
+    extrema = _rsp_findpeaks_extrema(rsp_cleaned, chunk_size=chunk_size)
     extrema, amplitudes = _rsp_findpeaks_outliers(rsp_cleaned, extrema, amplitude_min=amplitude_min)
     peaks, troughs = _rsp_findpeaks_sanitize(extrema, amplitudes)
 
@@ -156,13 +165,10 @@ def _rsp_findpeaks_scipy(rsp_cleaned, sampling_rate, peak_distance=0.8, peak_pro
 # =============================================================================
 
 
-def _rsp_findpeaks_extrema(rsp_cleaned):
+def _rsp_findpeaks_extrema(rsp_cleaned, chunk_size=None):
     # Detect zero crossings (note that these are zero crossings in the raw
     # signal, not in its gradient).
-    greater = rsp_cleaned > 0
-    smaller = rsp_cleaned < 0
-    risex = np.where(np.bitwise_and(smaller[:-1], greater[1:]))[0]
-    fallx = np.where(np.bitwise_and(greater[:-1], smaller[1:]))[0]
+    risex, fallx = _rsp_findpeaks_crossings(rsp_cleaned, chunk_size=chunk_size)
 
     # Return empty if no zero crossings found
     if risex.size == 0 or fallx.size == 0:
@@ -206,6 +212,29 @@ def _rsp_findpeaks_extrema(rsp_cleaned):
     return extrema
 
 
+def _rsp_findpeaks_crossings(rsp_cleaned, chunk_size=None):
+    n = len(rsp_cleaned)
+    if chunk_size is None or chunk_size >= n:
+        chunk_size = max(n - 1, 1)
+    chunk_size = int(chunk_size)
+    if chunk_size < 1:
+        raise ValueError("NeuroKit error: rsp_findpeaks(): 'chunk_size' should be a positive integer.")
+
+    # Blocks overlap by one sample so that a crossing between the last sample
+    # of a block and the first sample of the next one is not missed. Each pair
+    # (i, i + 1) belongs to exactly one block, so no crossing is counted twice.
+    risex = [np.asarray([], dtype=int)]
+    fallx = [np.asarray([], dtype=int)]
+    for start in range(0, n - 1, chunk_size):
+        block = rsp_cleaned[start : start + chunk_size + 1]
+        greater = block > 0
+        smaller = block < 0
+        risex.append(np.where(np.bitwise_and(smaller[:-1], greater[1:]))[0] + start)
+        fallx.append(np.where(np.bitwise_and(greater[:-1], smaller[1:]))[0] + start)
+
+    return np.concatenate(risex), np.concatenate(fallx)
+
+
 def _rsp_findpeaks_outliers(rsp_cleaned, extrema, amplitude_min=0.3):
 
     # Only consider those extrema that have a minimum vertical distance to
@@ -5,7 +5,14 @@ from .rsp_findpeaks import rsp_findpeaks
 from .rsp_fixpeaks import rsp_fixpeaks
 
 
-def rsp_peaks(rsp_cleaned, sampling_rate=1000, method="khodadad2018", **kwargs):
+def rsp_peaks(
+    rsp_cleaned,
+    sampling_rate=1000,
+    method="khodadad2018",
+    chunk_size=None,
+    sparse=None,
+    **kwargs,
+):
     """**Identify extrema in a respiration (RSP) signal**
 
     This function runs :func:`.rsp_findpeaks` and :func:`.rsp_fixpeaks` to identify and process
@@ -27,6 +34,14 @@ def rsp_peaks(rsp_cleaned, sampling_rate=1000, method="khodadad2018", **kwargs):
     method : str
         The processing pipeline to apply. Can be one of ``"khodadad2018"`` (default), ``"biosppy"``
         or ``"scipy"``.
+    chunk_size : int
+        If provided, the signal is scanned in overlapping blocks of ``chunk_size`` samples (see
+        :func:`.rsp_findpeaks`). The detected extrema are identical to the single-shot call. Useful
+        for very long recordings (e.g., overnight polysomnography). Defaults to ``None``.
+    sparse : bool
+        If ``True``, the dense ``peak_signal`` DataFrame is not built and ``None`` is returned in
+        its place; the peak and trough indices remain available in ``info``. Defaults to ``None``,
+        which means ``True`` when ``chunk_size`` is provided and ``False`` otherwise.
     **kwargs
         Other arguments to be passed to the different peak finding methods. See
         :func:`.rsp_findpeaks`.
@@ -41,7 +56,7 @@ def rsp_peaks(rsp_cleaned, sampling_rate=1000, method="khodadad2018", **kwargs):
         A DataFrame of same length as the input signal in which occurrences of peaks (exhalation
         onsets) and troughs (inhalation onsets) are marked as "1" in lists of zeros with the same
         length as :func:`.rsp_cleaned`. Accessible with the keys ``"RSP_Peaks"`` and
-        ``"RSP_Troughs"`` respectively.
+        ``"RSP_Troughs"`` respectively. ``None`` if ``sparse`` is ``True``.
 
 
     See Also
@@ -72,11 +87,19 @@ def rsp_peaks(rsp_cleaned, sampling_rate=1000, method="khodadad2018", **kwargs):
       Physiological measurement, 39(9), 094001.
 
     """
-    info = rsp_findpeaks(rsp_cleaned, sampling_rate=sampling_rate, method=method, **kwargs)
-    info = rsp_fixpeaks(info)
-    peak_signal = signal_formatpeaks(
-        info, desired_length=len(rsp_cleaned), peak_indices=info["RSP_Peaks"]
+    if sparse is None:
+        sparse = chunk_size is not None
+
+    info = rsp_findpeaks(
+        rsp_cleaned, sampling_rate=sampling_rate, method=method, chunk_size=chunk_size, **kwargs
     )
+    info = rsp_fixpeaks(info)
+    if sparse:
+        peak_signal = None
+    else:
+        peak_signal = signal_formatpeaks(
+            info, desired_length=len(rsp_cleaned), peak_indices=info["RSP_Peaks"]
+        )
 
     info["sampling_rate"] = sampling_rate  # Add sampling rate in dict info
 
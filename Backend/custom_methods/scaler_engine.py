@@ -0,0 +1,160 @@
+# -*- coding: utf-8 -*-
+"""
+Vectorized column scaling with reusable fitted parameters.
+
+Used by the ``normalize`` step of ``/preprocess`` and by the z-score preprocessing
+methods. Statistics for every column are computed in one pass over the
+``(samples, columns)`` matrix and the transform is a single broadcast
+``(data - center) / scale``. The fitted parameters are plain JSON so they can be
+returned to the client and sent back to scale new data without refitting.
+"""
+import warnings
+
+import numpy as np
+
+from telemetry import get_logger
+
+logger = get_logger("custom_methods.scaler")
+
+SCALER_METHODS = ["minmax", "zscore", "robust"]
+
+
+def fit_scaler(data, method="minmax", columns=None):
+    """
+    Compute scaling parameters for every column of a matrix.
+
+    Parameters:
+    -----------
+    data : pandas.DataFrame or numpy.ndarray
+        Matrix of shape (samples, columns). NaNs are ignored.
+    method : str
+        'minmax' (to [0, 1]), 'zscore' (zero mean, unit sample std) or 'robust'
+        (median and interquartile range).
+    columns : list
+        Column names, stored in the fitted parameters. Defaults to the DataFrame
+        columns, or to positional indices for arrays.
+
+    Returns:
+    --------
+    dict
+        Fitted parameters with keys 'method', 'columns', 'center', 'scale' and
+        'skipped' (columns left unchanged because their spread is zero or undefined).
+    """
+    if method not in SCALER_METHODS:
+        raise ValueError(f"Unknown normalization method '{method}', expected one of {SCALER_METHODS}")
+    if columns is None:
+        columns = data.columns.tolist() if hasattr(data, "columns") else list(range(np.shape(data)[1]))
+    values = _scaler_matrix(data)
+
+    # All-NaN columns produce "empty slice" warnings; they are reported through 'skipped'
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", category=RuntimeWarning)
+        if method == "minmax":
+            center = np.nanmin(values, axis=0)
+            scale = np.nanmax(values, axis=0) - center
+        elif method == "zscore":
+            center = np.nanmean(values, axis=0)
+            scale = np.nanstd(values, axis=0, ddof=1)
+        else:
+            q1, center, q3 = np.nanpercentile(values, [25, 50, 75], axis=0)
+            scale = q3 - q1
+
+    # Columns without spread are left as they are, as the per-column code always did
+    skipped = ~(np.isfinite(scale) & (scale > 0)) | ~np.isfinite(center)
+    center = np.where(skipped, 0.0, center)
+    scale = np.where(skipped, 1.0, scale)
+
+    return {
+        "method": method,
+        "columns": list(columns),
+        "center": center.tolist(),
+        "scale": scale.tolist(),
+        "skipped": [col for col, skip in zip(columns, skipped) if skip],
+    }
+
+
+def apply_scaler(data, params):
+    """
+    Scale a matrix with previously fitted parameters.
+
+    Parameters:
+    -----------
+    data : pandas.DataFrame or numpy.ndarray
+        Matrix whose columns are in the same order as ``params['columns']``.
+    params : dict
+        Output of :func:`fit_scaler`.
+
+    Returns:
+    --------
+    numpy.ndarray
+        Scaled float matrix with the same shape as ``data``.
+    """
+    values = _scaler_matrix(data)
+    center = np.asarray(params["center"], dtype=float)
+    scale = np.asarray(params["scale"], dtype=float)
+    if values.shape[1] != len(center):
+        raise ValueError(
+            f"Scaler was fitted on {len(center)} columns but data has {values.shape[1]}"
+        )
+    return (values - center) / scale
+
+
+def scale_frame(df, params=None, method="minmax", columns=None):
+    """
+    Fit (unless ``params`` is given) and apply a scaler to DataFrame columns in place.
+
+    Parameters:
+    -----------
+    df : pandas.DataFrame
+        Data to scale; modified in place.
+    params : dict
+        Previously fitted parameters. Only the columns present in both ``df`` and
+        ``params['columns']`` are scaled.
+    method : str
+        Scaling method used when fitting.
+    columns : list
+        Columns to fit on (default: all numeric columns).
+
+    Returns:
+    --------
+    dict
+        The fitted parameters that were used.
+    """
+    if params is None:
+        if columns is None:
+            columns = df.select_dtypes(include=["number"]).columns.tolist()
+        params = fit_scaler(df[columns], method=method, columns=columns)
+    else:
+        missing = [col for col in params["columns"] if col not in df.columns]
+        if missing:
+            logger.warning("Fitted scaler columns not found in data, skipping: %s", missing[:10])
+        params = subset_scaler(params, [col for col in params["columns"] if col in df.columns])
+        columns = params["columns"]
+
+    if columns:
+        df[columns] = apply_scaler(df[columns], params)
+    return params
+
+
+def subset_scaler(params, columns):
+    """Restrict fitted parameters to ``columns`` (in that order)."""
+    position = {col: i for i, col in enumerate(params["columns"])}
+    index = [position[col] for col in columns]
+    return {
+        "method": params["method"],
+        "columns": list(columns),
+        "center": [params["center"][i] for i in index],
+        "scale": [params["scale"][i] for i in index],
+        "skipped": [col for col in params.get("skipped", []) if col in columns],
+    }
+
+
+# =============================================================================
+# Internals
+# =============================================================================
+def _scaler_matrix(data):
+    values = data.to_numpy(dtype=float) if hasattr(data, "to_numpy") else np.asarray(data, dtype=float)
+    if values.ndim == 1:
+        values = values[:, np.newaxis]
+    return values
+
@@ -6,6 +6,7 @@ import numpy as np
 import scipy.signal
 
 from custom_methods.misc import NeuroKitWarning
+from .filter_engine import design_filter, filter_matrix
 from .signal_interpolate import signal_interpolate
 
 
@@ -31,7 +32,9 @@ def signal_filter(
     Parameters
     ----------
     signal : Union[list, np.array, pd.Series]
-        The signal (i.e., a time series) in the form of a vector of values.
+        The signal (i.e., a time series) in the form of a vector of values. For ``"butterworth"``
+        and ``"bessel"``, a 2-D ``(samples, channels)`` array is also accepted and all channels
+        are filtered in a single pass.
     sampling_rate : int
         The sampling frequency of the signal (in Hz, i.e., samples/second).
     lowcut : float
@@ -144,6 +147,15 @@ def signal_filter(
     """
     method = method.lower()
 
+    if np.ndim(signal) > 1 and method in ["butter", "butterworth", "bessel"]:
+        if lowcut is None and highcut is None:
+            raise ValueError("NeuroKit error: signal_filter(): you need to specify a 'lowcut' or a 'highcut'.")
+        freqs, filter_type = _signal_filter_sanitize(lowcut=lowcut, highcut=highcut, sampling_rate=sampling_rate)
+        design = "bessel" if method == "bessel" else "butter"
+        sos = design_filter(design, order, freqs, sampling_rate, btype=filter_type)
+        filtered, _ = filter_matrix(signal, sos)
+        return filtered
+
     signal_sanitized, missing = _signal_filter_missing(signal)
 
     if method in ["sg", "savgol", "savitzky-golay"]:
@@ -245,7 +257,7 @@ def _signal_filter_fir(signal, sampling_rate=1000, lowcut=None, highcut=None, wi
 def _signal_filter_butterworth(signal, sampling_rate=1000, lowcut=None, highcut=None, order=5):
     """Filter a signal using IIR Butterworth SOS method."""
     freqs, filter_type = _signal_filter_sanitize(lowcut=lowcut, highcut=highcut, sampling_rate=sampling_rate)
-    sos = scipy.signal.butter(order, freqs, btype=filter_type, output="sos", fs=sampling_rate)
+    sos = design_filter("butter", order, freqs, sampling_rate, btype=filter_type)
     filtered = scipy.signal.sosfiltfilt(sos, signal)
     return filtered
 
@@ -269,7 +281,7 @@ def _signal_filter_butterworth_zi(signal, sampling_rate=1000, lowcut=None, highc
 
     freqs, filter_type = _signal_filter_sanitize(lowcut=lowcut, highcut=highcut, sampling_rate=sampling_rate)
 
-    sos = scipy.signal.butter(order, freqs, btype=filter_type, output="sos", fs=sampling_rate)
+    sos = design_filter("butter", order, freqs, sampling_rate, btype=filter_type)
 
     zi_coeff = scipy.signal.sosfilt_zi(sos)
     zi = zi_coeff * np.mean(signal)
@@ -285,7 +297,7 @@ def _signal_filter_butterworth_zi(signal, sampling_rate=1000, lowcut=None, highc
 def _signal_filter_bessel(signal, sampling_rate=1000, lowcut=None, highcut=None, order=5):
     freqs, filter_type = _signal_filter_sanitize(lowcut=lowcut, highcut=highcut, sampling_rate=sampling_rate)
 
-    sos = scipy.signal.bessel(order, freqs, btype=filter_type, output="sos", fs=sampling_rate)
+    sos = design_filter("bessel", order, freqs, sampling_rate, btype=filter_type)
     filtered = scipy.signal.sosfiltfilt(sos, signal)
     return filtered
 
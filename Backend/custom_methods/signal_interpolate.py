@@ -1,4 +1,5 @@
 # -*- coding: utf-8 -*-
+import functools
 from warnings import warn
 
 import numpy as np
@@ -7,6 +8,10 @@ import scipy.interpolate
 
 from custom_methods.misc import NeuroKitWarning
 
+# Number of new samples evaluated at once by the spline interpolators, which bounds the size of
+# their temporary arrays when interpolating to millions of samples.
+_INTERPOLATE_CHUNK_SIZE = 2**18
+
 
 def signal_interpolate(
     x_values, y_values=None, x_new=None, method="quadratic", fill_value=None
@@ -103,14 +108,19 @@ def signal_interpolate(
         x_new = np.squeeze(x_new.values)
     if isinstance(y_values, pd.Series):
         y_values = np.squeeze(y_values.values)
+    x_values = np.asarray(x_values)
+    y_values = np.asarray(y_values)
 
     if len(x_values) != len(y_values):
         raise ValueError("x_values and y_values must be of the same length.")
 
+    # Whether x_new is ascending; None until needed (np.linspace grids are by construction)
+    x_new_sorted = None
     if isinstance(x_new, int):
         if len(x_values) == x_new:
             return y_values
         x_new = np.linspace(x_values[0], x_values[-1], x_new)
+        x_new_sorted = x_values[0] <= x_values[-1]
     else:
         # if x_values is identical to x_new, no need for interpolation
         if np.array_equal(x_values, x_new):
@@ -128,32 +138,26 @@ def signal_interpolate(
     if len(x_values) == 1:
         return np.ones(len(x_new)) * y_values[0]
 
-    if method == "monotone_cubic":
-        interpolation_function = scipy.interpolate.PchipInterpolator(
-            x_values, y_values, extrapolate=True
-        )
-    elif method == "akima":
-        interpolation_function = scipy.interpolate.Akima1DInterpolator(
-            x_values, y_values
-        )
-    else:
-        if fill_value is None:
-            fill_value = ([y_values[0]], [y_values[-1]])
-        interpolation_function = scipy.interpolate.interp1d(
-            x_values,
-            y_values,
-            kind=method,
-            bounds_error=False,
-            fill_value=fill_value,
-        )
+    x_new = np.asarray(x_new)
 
-    interpolated = interpolation_function(x_new)
+    if method == "linear" and fill_value != "extrapolate":
+        interpolated = _signal_interpolate_linear(x_values, y_values, x_new, fill_value)
+        if interpolated is not None:
+            return interpolated
+
+    interpolation_function = _signal_interpolate_function(
+        x_values, y_values, method=method, fill_value=fill_value
+    )
+    interpolated = _signal_interpolate_evaluate(interpolation_function, x_new)
 
     if method == "monotone_cubic" and fill_value != "extrapolate":
+        if x_new_sorted is None:
+            # Checked once here rather than in each of the two lookups below
+            x_new_sorted = _signal_interpolate_is_sorted(x_new)
         # Find the index of the new x value that is closest to the first original x value
-        first_index = np.argmin(np.abs(x_new - x_values[0]))
+        first_index = _signal_interpolate_closest(x_new, x_values[0], x_new_sorted)
         # Find the index of the new x value that is closest to the last original x value
-        last_index = np.argmin(np.abs(x_new - x_values[-1]))
+        last_index = _signal_interpolate_closest(x_new, x_values[-1], x_new_sorted)
 
         if fill_value is None:
             # Swap out the cubic extrapolation of out-of-bounds segments generated by
@@ -200,3 +204,119 @@ def _signal_interpolate_average_duplicates(x_values, y_values):
     unique_x, indices = np.unique(x_values, return_inverse=True)
     mean_y = np.bincount(indices, weights=y_values) / np.bincount(indices)
     return unique_x, mean_y
+
+
+def _signal_interpolate_linear(x_values, y_values, x_new, fill_value=None):
+    """Linear interpolation with ``np.interp``, which avoids building an ``interp1d`` object.
+
+    Returns ``None`` if ``fill_value`` cannot be expressed as constant left/right values, in which
+    case the caller falls back to ``scipy.interpolate.interp1d``.
+    """
+    if fill_value is None:
+        fill_value = (y_values[0], y_values[-1])
+    elif not isinstance(fill_value, tuple):
+        fill_value = (fill_value, fill_value)
+    try:
+        left = np.asarray(fill_value[0]).item()
+        right = np.asarray(fill_value[1]).item()
+    except (TypeError, ValueError, IndexError):
+        return None
+
+    # np.interp needs increasing knots; interp1d sorts them itself
+    if np.any(x_values[1:] < x_values[:-1]):
+        order = np.argsort(x_values, kind="mergesort")
+        x_values, y_values = x_values[order], y_values[order]
+
+    return np.interp(x_new, x_values, y_values, left=left, right=right)
+
+
+def _signal_interpolate_function(x_values, y_values, method="quadratic", fill_value=None):
+    """Build (or reuse) the interpolation function for the given knots."""
+    try:
+        hash(fill_value)
+    except TypeError:
+        fill_value = _signal_interpolate_hashable(fill_value)
+    try:
+        return _signal_interpolate_function_cached(
+            method,
+            x_values.tobytes(),
+            y_values.tobytes(),
+            x_values.dtype.str,
+            y_values.dtype.str,
+            fill_value,
+        )
+    except TypeError:
+        # Object arrays or unhashable fill values cannot be cached
+        return _signal_interpolate_function_build(x_values, y_values, method, fill_value)
+
+
+@functools.lru_cache(maxsize=32)
+def _signal_interpolate_function_cached(method, x_bytes, y_bytes, x_dtype, y_dtype, fill_value):
+    # Knots are keyed by content, so repeated calls with identical peaks (e.g. rate and period of
+    # the same recording, or the same payload sent twice) reuse the fitted interpolator.
+    x_values = np.frombuffer(x_bytes, dtype=x_dtype)
+    y_values = np.frombuffer(y_bytes, dtype=y_dtype)
+    return _signal_interpolate_function_build(x_values, y_values, method, fill_value)
+
+
+def _signal_interpolate_function_build(x_values, y_values, method="quadratic", fill_value=None):
+    if method == "monotone_cubic":
+        return scipy.interpolate.PchipInterpolator(x_values, y_values, extrapolate=True)
+    if method == "akima":
+        return scipy.interpolate.Akima1DInterpolator(x_values, y_values)
+    if fill_value is None:
+        fill_value = ([y_values[0]], [y_values[-1]])
+    return scipy.interpolate.interp1d(
+        x_values,
+        y_values,
+        kind=method,
+        bounds_error=False,
+        fill_value=fill_value,
+    )
+
+
+def _signal_interpolate_hashable(fill_value):
+    if isinstance(fill_value, (list, tuple, np.ndarray)):
+        return tuple(_signal_interpolate_hashable(v) for v in fill_value)
+    return fill_value
+
+
+def _signal_interpolate_evaluate(interpolation_function, x_new, chunk_size=_INTERPOLATE_CHUNK_SIZE):
+    """Evaluate the interpolation function over ``x_new`` in fixed-size chunks."""
+    if x_new.ndim != 1 or len(x_new) <= chunk_size:
+        return interpolation_function(x_new)
+
+    first = interpolation_function(x_new[:chunk_size])
+    interpolated = np.empty(len(x_new), dtype=first.dtype)
+    interpolated[:chunk_size] = first
+    for start in range(chunk_size, len(x_new), chunk_size):
+        interpolated[start : start + chunk_size] = interpolation_function(
+            x_new[start : start + chunk_size]
+        )
+    return interpolated
+
+
+def _signal_interpolate_is_sorted(x_new):
+    """Whether ``x_new`` is in ascending order (one O(n) pass)."""
+    return len(x_new) >= 2 and x_new[0] <= x_new[-1] and not np.any(x_new[1:] < x_new[:-1])
+
+
+def _signal_interpolate_closest(x_new, value, is_sorted=None):
+    """Index of the first element of ``x_new`` closest to ``value``.
+
+    Uses a binary search when ``x_new`` is sorted (the usual case, e.g. ``np.arange`` or
+    ``np.linspace`` grids), and a full scan otherwise. Pass ``is_sorted`` when it is
+    already known to skip the sortedness check.
+    """
+    if is_sorted is None:
+        is_sorted = _signal_interpolate_is_sorted(x_new)
+    if not is_sorted or len(x_new) < 2:
+        return int(np.argmin(np.abs(x_new - value)))
+
+    index = int(np.searchsorted(x_new, value, side="left"))
+    if index == len(x_new):
+        index -= 1
+    elif index > 0 and np.abs(x_new[index - 1] - value) <= np.abs(x_new[index] - value):
+        index -= 1
+    # Return the first occurrence in case of duplicated grid values, as np.argmin would
+    return int(np.searchsorted(x_new, x_new[index], side="left"))
@@ -1,4 +1,8 @@
 # -*- coding: utf-8 -*-
+import functools
+import math
+from fractions import Fraction
+
 import numpy as np
 import pandas as pd
 import scipy.ndimage
@@ -11,6 +15,7 @@ def signal_resample(
     sampling_rate=None,
     desired_sampling_rate=None,
     method="interpolation",
+    axis=0,
 ):
     """**Resample a continuous signal to a different length or sampling rate**
 
@@ -19,8 +24,9 @@ def signal_resample(
 
     Parameters
     ----------
-    signal :  Union[list, np.array, pd.Series]
-        The signal (i.e., a time series) in the form of a vector of values.
+    signal :  Union[list, np.array, pd.Series, pd.DataFrame]
+        The signal (i.e., a time series) in the form of a vector of values, or a 2-D array of
+        channels (resampled along ``axis``).
     desired_length : int
         The desired length of the signal.
     sampling_rate : int
@@ -34,7 +40,12 @@ def signal_resample(
         ``scipy.signal.resample()``) for the Fourier method. ``"FFT"`` is the most accurate
         (if the signal is periodic), but becomes exponentially slower as the signal length
         increases. In contrast, ``"interpolation"`` is the fastest, followed by ``"numpy"``,
-        ``"poly"`` and ``"pandas"``.
+        ``"poly"`` and ``"pandas"``. For ``"poly"``, the up/down factors are picked automatically
+        as the reduced ratio of the two sampling rates (or of the two lengths, approximated with a
+        bounded denominator), so that the polyphase filter stays short for arbitrary rate pairs.
+    axis : int
+        The axis along which to resample if ``signal`` is 2-D (e.g., ``(samples, channels)``).
+        Defaults to ``0``.
 
     Returns
     -------
@@ -43,7 +54,7 @@ def signal_resample(
 
     See Also
     --------
-    signal_interpolate
+    signal_interpolate, StreamingResampler
 
     Examples
     --------
@@ -104,18 +115,36 @@ def signal_resample(
                                  sampling_rate=1000, desired_sampling_rate=500)
 
     """
+    length = np.shape(signal)[axis] if np.ndim(signal) > 1 else len(signal)
     if desired_length is None:
-        desired_length = int(np.round(len(signal) * desired_sampling_rate / sampling_rate))
+        desired_length = int(np.round(length * desired_sampling_rate / sampling_rate))
 
     # Sanity checks
-    if len(signal) == desired_length:
+    if length == desired_length:
         return signal
 
     # Resample
-    if method.lower() == "fft":
+    if np.ndim(signal) > 1:
+        signal = np.asarray(signal)
+        if method.lower() == "fft":
+            resampled = _resample_fft(signal, desired_length, axis=axis)
+        elif method.lower() == "poly":
+            resampled = _resample_poly(
+                signal, desired_length, sampling_rate, desired_sampling_rate, axis=axis
+            )
+        elif method.lower() in ["numpy", "pandas"]:
+            resampled = np.apply_along_axis(
+                _resample_numpy if method.lower() == "numpy" else _resample_pandas,
+                axis,
+                signal,
+                desired_length,
+            )
+        else:
+            resampled = _resample_interpolation(signal, desired_length, axis=axis)
+    elif method.lower() == "fft":
         resampled = _resample_fft(signal, desired_length)
     elif method.lower() == "poly":
-        resampled = _resample_poly(signal, desired_length)
+        resampled = _resample_poly(signal, desired_length, sampling_rate, desired_sampling_rate)
     elif method.lower() == "numpy":
         resampled = _resample_numpy(signal, desired_length)
     elif method.lower() == "pandas":
@@ -126,6 +155,119 @@ def signal_resample(
     return resampled
 
 
+class StreamingResampler:
+    """**Stateful polyphase resampler for chunked signals**
+
+    Resample a signal that arrives in consecutive chunks (e.g., blocks read from a long recording)
+    without holding it in memory. The same anti-aliasing filter as ``scipy.signal.resample_poly()``
+    is used, and the concatenation of all chunks returned by :meth:`process` and :meth:`flush` is
+    equal to ``scipy.signal.resample_poly()`` on the whole signal (which has
+    ``ceil(n * up / down)`` samples; ``signal_resample(..., method="poly")`` rounds the length
+    and may return one sample less).
+
+    Parameters
+    ----------
+    sampling_rate : int
+        The original sampling frequency (in Hz, i.e., samples/second).
+    desired_sampling_rate : int
+        The desired (output) sampling frequency (in Hz, i.e., samples/second).
+    axis : int
+        The axis along which chunks are concatenated if they are 2-D (e.g., ``(samples,
+        channels)``). Defaults to ``0``.
+    n_channels : int
+        Number of channels of 2-D input. Only used to shape the empty result of :meth:`flush`
+        when no chunk was pushed; otherwise the shape follows the chunks.
+
+    See Also
+    --------
+    signal_resample
+
+    Examples
+    --------
+    .. ipython:: python
+
+      import numpy as np
+
+      signal = np.random.randn(25000, 4)  # 10 s of 4-channel EMG at 2500 Hz
+      resampler = StreamingResampler(sampling_rate=2500, desired_sampling_rate=1000)
+      chunks = [resampler.process(chunk) for chunk in np.array_split(signal, 7)]
+      resampled = np.concatenate(chunks + [resampler.flush()])
+
+    """
+
+    def __init__(self, sampling_rate, desired_sampling_rate, axis=0, n_channels=None):
+        self.up, self.down = _resample_factors(sampling_rate, desired_sampling_rate)
+        self.axis = axis
+        self.n_channels = n_channels
+        self._filter = self.up * _resample_poly_filter(self.up, self.down)
+        self._half_len = (len(self._filter) - 1) // 2
+        self._buffer = None  # Inputs still needed by upcoming outputs
+        self._buffer_start = 0  # Index (in the whole signal) of the first buffered input
+        self._n_in = 0  # Number of inputs received so far
+        self._n_out = 0  # Number of outputs returned so far
+
+    def process(self, chunk):
+        """Push a chunk of input samples and return the output samples that are now final."""
+        chunk = np.asarray(chunk)
+        if self._buffer is None:
+            self._buffer = chunk[_resample_take(chunk.ndim, self.axis, slice(0, 0))]
+        self._buffer = np.concatenate([self._buffer, chunk], axis=self.axis)
+        self._n_in += chunk.shape[self.axis]
+
+        # An output only depends on inputs up to its position in the upsampled signal
+        last = (self._n_in * self.up - 1 - self._half_len) // self.down
+        return self._emit(last + 1)
+
+    def flush(self):
+        """Return the remaining output samples, treating the signal as zero after its end."""
+        if self._buffer is None:
+            if self.n_channels is None:
+                return np.array([])
+            return np.zeros((0, self.n_channels) if self.axis == 0 else (self.n_channels, 0))
+        n_total = -(-self._n_in * self.up // self.down)
+        padding = list(self._buffer.shape)
+        padding[self.axis] = len(self._filter) // self.up + 1
+        self._buffer = np.concatenate(
+            [self._buffer, np.zeros(padding, dtype=self._buffer.dtype)], axis=self.axis
+        )
+        return self._emit(n_total)
+
+    def _emit(self, stop):
+        start = self._n_out
+        if stop <= start:
+            return self._buffer[_resample_take(self._buffer.ndim, self.axis, slice(0, 0))]
+
+        # Range of inputs contributing to outputs [start, stop)
+        first_input = max(0, -(-(start * self.down + self._half_len - len(self._filter) + 1) // self.up))
+        last_input = ((stop - 1) * self.down + self._half_len) // self.up
+        segment = self._buffer[
+            _resample_take(
+                self._buffer.ndim,
+                self.axis,
+                slice(first_input - self._buffer_start, last_input - self._buffer_start + 1),
+            )
+        ]
+
+        # Shift the filter so that the first output falls on a decimated sample
+        shift = (first_input * self.up - self._half_len - start * self.down) % self.down
+        h = np.concatenate([np.zeros(shift), self._filter])
+        offset = (start * self.down + self._half_len + shift - first_input * self.up) // self.down
+        filtered = scipy.signal.upfirdn(h, segment, self.up, self.down, axis=self.axis)
+        output = filtered[_resample_take(filtered.ndim, self.axis, slice(offset, offset + stop - start))]
+
+        # Drop the inputs that no upcoming output depends on
+        keep_from = max(
+            self._buffer_start,
+            -(-(stop * self.down + self._half_len - len(self._filter) + 1) // self.up),
+        )
+        self._buffer = self._buffer[
+            _resample_take(self._buffer.ndim, self.axis, slice(keep_from - self._buffer_start, None))
+        ]
+        self._buffer_start = keep_from
+        self._n_out = stop
+        return output
+
+
 # =============================================================================
 # Methods
 # =============================================================================
@@ -140,18 +282,35 @@ def _resample_numpy(signal, desired_length):
     return resampled_signal
 
 
-def _resample_interpolation(signal, desired_length):
+def _resample_interpolation(signal, desired_length, axis=0):
+    if np.ndim(signal) > 1:
+        zoom = [1.0] * np.ndim(signal)
+        zoom[axis] = desired_length / np.shape(signal)[axis]
+        return scipy.ndimage.zoom(signal, zoom)
     resampled_signal = scipy.ndimage.zoom(signal, desired_length / len(signal))
     return resampled_signal
 
 
-def _resample_fft(signal, desired_length):
-    resampled_signal = scipy.signal.resample(signal, desired_length)
+def _resample_fft(signal, desired_length, axis=0):
+    resampled_signal = scipy.signal.resample(signal, desired_length, axis=axis)
     return resampled_signal
 
 
-def _resample_poly(signal, desired_length):
-    resampled_signal = scipy.signal.resample_poly(signal, desired_length, len(signal))
+def _resample_poly(
+    signal, desired_length, sampling_rate=None, desired_sampling_rate=None, axis=0
+):
+    length = np.shape(signal)[axis]
+    if sampling_rate is not None and desired_sampling_rate is not None:
+        up, down = _resample_factors(sampling_rate, desired_sampling_rate)
+    else:
+        # Lengths are integers, so their exact ratio is used: an approximated one would stretch
+        # the time scale and the padding in _resample_sanitize would hide it
+        up, down = _resample_factors(length, desired_length, max_denominator=None)
+    resampled_signal = scipy.signal.resample_poly(
+        signal, up, down, axis=axis, window=_resample_poly_filter(up, down)
+    )
+    if resampled_signal.shape[axis] != desired_length:
+        resampled_signal = _resample_sanitize(resampled_signal, desired_length, axis=axis)
     return resampled_signal
 
 
@@ -177,8 +336,20 @@ def _resample_pandas(signal, desired_length):
 # =============================================================================
 
 
-def _resample_sanitize(resampled_signal, desired_length):
+def _resample_sanitize(resampled_signal, desired_length, axis=0):
     # Adjust extremities
+    if np.ndim(resampled_signal) > 1:
+        diff = resampled_signal.shape[axis] - desired_length
+        if diff < 0:
+            last = resampled_signal[_resample_take(resampled_signal.ndim, axis, slice(-1, None))]
+            resampled_signal = np.concatenate(
+                [resampled_signal, np.repeat(last, np.abs(diff), axis=axis)], axis=axis
+            )
+        elif diff > 0:
+            resampled_signal = resampled_signal[
+                _resample_take(resampled_signal.ndim, axis, slice(0, desired_length))
+            ]
+        return resampled_signal
     diff = len(resampled_signal) - desired_length
     if diff < 0:
         resampled_signal = np.concatenate(
@@ -187,3 +358,46 @@ def _resample_sanitize(resampled_signal, desired_length):
     elif diff > 0:
         resampled_signal = resampled_signal[0:desired_length]
     return resampled_signal
+
+
+def _resample_factors(sampling_rate, desired_sampling_rate, max_denominator=1000):
+    """Reduced up/down factors for a rate (or length) pair.
+
+    Rates such as 2500 -> 100 Hz reduce exactly (1/25). Rate ratios that do not reduce to small
+    integers are approximated with a bounded denominator, since the polyphase filter length grows
+    linearly with ``max(up, down)``. With ``max_denominator=None`` the exact ratio of two integers
+    (e.g., signal lengths) is returned, reduced by their greatest common divisor.
+    """
+    if max_denominator is None:
+        if sampling_rate <= 0 or desired_sampling_rate <= 0:
+            raise ValueError("NeuroKit error: signal_resample(): lengths must be positive.")
+        divisor = math.gcd(int(sampling_rate), int(desired_sampling_rate))
+        return int(desired_sampling_rate) // divisor, int(sampling_rate) // divisor
+    ratio = Fraction(desired_sampling_rate).limit_denominator(max_denominator) / Fraction(
+        sampling_rate
+    ).limit_denominator(max_denominator)
+    ratio = ratio.limit_denominator(max_denominator)
+    if ratio <= 0:
+        raise ValueError("NeuroKit error: signal_resample(): sampling rates must be positive.")
+    return ratio.numerator, ratio.denominator
+
+
+@functools.lru_cache(maxsize=32)
+def _resample_poly_filter(up, down, window=("kaiser", 5.0)):
+    """Anti-aliasing FIR filter designed as in ``scipy.signal.resample_poly()``."""
+    max_rate = max(up, down)
+    if max_rate == 1:
+        # Equal rates: the identity filter
+        h = np.ones(1)
+        h.setflags(write=False)
+        return h
+    half_len = 10 * max_rate
+    h = scipy.signal.firwin(2 * half_len + 1, 1.0 / max_rate, window=window)
+    h.setflags(write=False)
+    return h
+
+
+def _resample_take(ndim, axis, index):
+    take = [slice(None)] * ndim
+    take[axis] = index
+    return tuple(take)
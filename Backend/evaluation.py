@@ -1,9 +1,16 @@
-from fastapi import FastAPI, UploadFile, Form
+from fastapi import FastAPI, UploadFile, Form, Request
 from fastapi.middleware.cors import CORSMiddleware
 import pandas as pd
 import numpy as np
 import json
-from typing import Dict, List, Any
+import logging
+from typing import Dict, List, Any, Optional
+
+from response_cache import cache_key, cached_response, normalize_config
+from telemetry import StageTimer, get_logger, instrument
+from workers import run_in_process
+
+logger = get_logger("evaluation")
 
 app = FastAPI()
 
@@ -13,18 +20,34 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+# Request latency/size metrics and GET /metrics
+instrument(app)
 
 @app.post("/evaluation")
 async def evaluate_features(
+    request: Request,
     methods: str = Form(...),
     features: UploadFile = Form(...),
     weights: str = Form(None)
 ):
+    # Scoring runs in the worker process pool to keep the event loop free
+    content = await features.read()
+    key = cache_key("evaluation", normalize_config(methods), content, normalize_config(weights or "{}"))
+    return await cached_response(
+        request, key, lambda: run_in_process(run_evaluation, methods, content, weights),
+        endpoint="evaluation",
+    )
+
+
+def run_evaluation(methods: str, content: bytes, weights: Optional[str]) -> Dict[str, Any]:
+    """Score the uploaded features with the requested methods (runs in a worker process)."""
+    timer = StageTimer("evaluation")
+    timer.start("parse")
     try:
         # Parse methods
         try:
             method_list = json.loads(methods)
-            print(f"Methods requested: {method_list}")
+            logger.debug("Methods requested: %s", method_list)
         except json.JSONDecodeError:
             return {"error": "Invalid JSON in methods parameter"}
         # Parse optional weights JSON mapping method->weight
@@ -42,11 +65,10 @@ async def evaluate_features(
 
         # Parse feature data
         try:
-            content = await features.read()
             feature_data_json = json.loads(content.decode("utf-8"))
-            print(f"Raw feature data type: {type(feature_data_json)}")
+            logger.debug("Raw feature data type: %s", type(feature_data_json))
             if isinstance(feature_data_json, dict):
-                print(f"Keys in feature data: {feature_data_json.keys()}")
+                logger.debug("Keys in feature data: %s", feature_data_json.keys())
         except json.JSONDecodeError:
             return {"error": "Invalid JSON in feature data"}
         
@@ -55,58 +77,57 @@ async def evaluate_features(
             # Case 1: {features: [...]}
             if "features" in feature_data_json:
                 feature_data = feature_data_json["features"]
-                print("Extracted features from 'features' key")
+                logger.debug("Extracted features from 'features' key")
             # Case 2: {feature_extraction: {featureExtraction: [...]}} 
             elif "feature_extraction" in feature_data_json:
                 if isinstance(feature_data_json["feature_extraction"], dict) and "featureExtraction" in feature_data_json["feature_extraction"]:
                     feature_data = feature_data_json["feature_extraction"]["featureExtraction"]
-                    print("Extracted features from 'feature_extraction.featureExtraction'")
+                    logger.debug("Extracted features from 'feature_extraction.featureExtraction'")
                 else:
                     feature_data = feature_data_json["feature_extraction"]
-                    print("Extracted features from 'feature_extraction'")
+                    logger.debug("Extracted features from 'feature_extraction'")
             else:
                 # Use the whole object if no known keys are found
                 feature_data = feature_data_json
-                print("Using entire data object as features")
+                logger.debug("Using entire data object as features")
         else:
             feature_data = feature_data_json
-            print("Feature data is not a dict, using as-is")
+            logger.debug("Feature data is not a dict, using as-is")
             
         # Validate feature data
         if not isinstance(feature_data, list):
-            print(f"Feature data is not a list: {type(feature_data)}")
+            logger.debug("Feature data is not a list: %s", type(feature_data))
             return {"error": "Feature data must be a list of records"}
             
         if len(feature_data) == 0:
             return {"error": "Feature data is empty"}
             
         # Print a sample of feature data for debugging
-        print(f"Sample feature data (first record): {feature_data[0]}")
+        logger.debug("Sample feature data (first record): %s", feature_data[0])
         
         # DEBUG: Check the actual values in the first record
         if len(feature_data) > 0:
             first_record = feature_data[0]
-            print("DEBUG: Detailed first record analysis:")
+            logger.debug("Detailed first record analysis:")
             for key, val in first_record.items():
-                print(f"  Feature '{key}': value={val}, type={type(val)}")
+                logger.debug("  Feature '%s': value=%s, type=%s", key, val, type(val))
                 if isinstance(val, (int, float)):
-                    print(f"    -> Numeric value: {val}")
+                    logger.debug("    -> Numeric value: %s", val)
                 elif val == 0 or val == 0.0:
-                    print(f"    -> WARNING: Value is zero!")
+                    logger.debug("    -> Value is zero!")
                 else:
-                    print(f"    -> Non-numeric or unusual value")
+                    logger.debug("    -> Non-numeric or unusual value")
         
         # Convert to DataFrame
         try:
             df = pd.DataFrame(feature_data)
-            print(f"DataFrame columns: {df.columns.tolist()}")
-            print(f"DataFrame shape (rows, cols): {df.shape}")
+            logger.debug("DataFrame columns: %s", df.columns.tolist())
+            logger.debug("DataFrame shape (rows, cols): %s", df.shape)
             
-            # DEBUG: Check DataFrame values
-            print("DEBUG: DataFrame first few rows:")
-            print(df.head())
-            print("DEBUG: DataFrame describe:")
-            print(df.describe())
+            # DEBUG: Check DataFrame values (describe() scans every column, so only when enabled)
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug("DataFrame first few rows:\n%s", df.head())
+                logger.debug("DataFrame describe:\n%s", df.describe())
         except Exception as e:
             return {"error": f"Failed to create DataFrame: {str(e)}"}
             
@@ -115,11 +136,11 @@ async def evaluate_features(
             return {"error": "DataFrame is empty after conversion"}
             
         # ID removal logic removed, keep columns as-is
-        print(f"DataFrame columns: {df.columns.tolist()}")
+        logger.debug("DataFrame columns: %s", df.columns.tolist())
         
         # Identify numeric columns
         numeric_cols = df.select_dtypes(include=[np.number]).columns.tolist()
-        print(f"Numeric columns: {numeric_cols}")
+        logger.debug("Numeric columns: %s", numeric_cols)
         
         if not numeric_cols:
             return {"error": "No numeric columns found for evaluation"}
@@ -129,7 +150,8 @@ async def evaluate_features(
         
         # Evaluate features using selected methods
         if "variance" in method_list:
-            print("Calculating variance (population, ddof=0) ...")
+            timer.start("variance")
+            logger.debug("Calculating variance (population, ddof=0) ...")
             var = df[numeric_cols].var(ddof=0)
             # Normalize variance scores to a 0-1 range
             var_min, var_max = var.min(), var.max()
@@ -144,7 +166,8 @@ async def evaluate_features(
                     scores.append({"name": name, "score": float(score)})
                     
         if "correlation" in method_list:
-            print("Calculating correlation...")
+            timer.start("correlation")
+            logger.debug("Calculating correlation...")
             # For unsupervised correlation, calculate the mean absolute correlation of each feature with all others
             corr = df[numeric_cols].corr().abs()
             # Compute mean corr per feature
@@ -164,7 +187,8 @@ async def evaluate_features(
                 scores.append({"name": name, "score": float(score)})
                     
         if "kurtosis" in method_list:
-            print("Calculating kurtosis...")
+            timer.start("kurtosis")
+            logger.debug("Calculating kurtosis...")
             # Kurtosis measures peakedness of distribution (absolute values)
             kurt_vals = df[numeric_cols].kurtosis().abs().fillna(0)
             # Min-max normalize
@@ -178,7 +202,8 @@ async def evaluate_features(
                 scores.append({"name": name, "score": float(score)})
                     
         if "skewness" in method_list:
-            print("Calculating skewness...")
+            timer.start("skewness")
+            logger.debug("Calculating skewness...")
             # Skewness measures asymmetry of distribution (absolute values)
             skew_vals = df[numeric_cols].skew().abs().fillna(0)
             # Min-max normalize
@@ -191,6 +216,7 @@ async def evaluate_features(
             for name, score in skew_norm.items():
                 scores.append({"name": name, "score": float(score)})
         
+        timer.start("rank")
         # Check if we collected any scores
         if not scores:
             return {"error": "No feature scores were calculated"}
@@ -205,12 +231,12 @@ async def evaluate_features(
         # Sort in descending order (higher score = more important)
         ranked = ranked.sort_values("score", ascending=False)
         
-        print(f"Returning {len(ranked)} ranked features")
+        logger.info("Returning %s ranked features", len(ranked))
+        timer.stop()
         return {"rankedFeatures": ranked.to_dict(orient="records")}
 
     except Exception as e:
-        import traceback
-        print(traceback.format_exc())
+        logger.exception("Unexpected error in evaluation")
         return {"error": f"Unexpected error: {str(e)}"}
 
 def detect_id_columns(df):
@@ -266,7 +292,7 @@ def detect_id_columns(df):
             # Make decision: Include strong indicators of ID columns
             # High uniqueness in sample OR monotonic behavior OR very high distinctness overall
             if uniqueness_ratio > 0.95 or is_monotonic or full_uniqueness > 0.90:
-                print(f"Column {col} excluded: uniqueness_ratio={uniqueness_ratio:.2f}, is_monotonic={is_monotonic}, full_uniqueness={full_uniqueness:.2f}")
+                logger.debug("Column %s excluded: uniqueness_ratio=%.2f, is_monotonic=%s, full_uniqueness=%.2f", col, uniqueness_ratio, is_monotonic, full_uniqueness)
                 id_columns.append(col)
                 continue
           # SECOND PRIORITY: Check for sequential or patterned values
@@ -288,13 +314,13 @@ def detect_id_columns(df):
                         if len(diffs) > 2:
                             # If all differences are the same (perfect sequence)
                             if len(diffs.unique()) == 1:
-                                print(f"Column {col} excluded: contains perfect sequence with step {diffs.iloc[0]}")
+                                logger.debug("Column %s excluded: contains perfect sequence with step %s", col, diffs.iloc[0])
                                 id_columns.append(col)
                                 continue
                             
                             # If differences have low variance (almost a sequence)
                             if diffs.std() / diffs.mean() < 0.1 and diffs.nunique() < len(diffs) * 0.3:
-                                print(f"Column {col} excluded: contains near-sequence values")
+                                logger.debug("Column %s excluded: contains near-sequence values", col)
                                 id_columns.append(col)
                                 continue
             except:
@@ -326,7 +352,7 @@ def detect_id_columns(df):
                     
                     # If uniqueness ratios are close, likely related columns
                     if abs(col_uniqueness - id_uniqueness) < 0.1:
-                        print(f"Column {col} excluded: similar to existing ID column {existing_id} (name similarity: {similarity:.2f})")
+                        logger.debug("Column %s excluded: similar to existing ID column %s (name similarity: %.2f)", col, existing_id, similarity)
                         id_columns.append(col)
                         continue
                 except:
@@ -338,8 +364,8 @@ def detect_id_columns(df):
         
         # Only use name-based detection as a fallback
         if any(pattern in col_lower for pattern in id_patterns):
-            print(f"Column {col} excluded based on name pattern")
+            logger.debug("Column %s excluded based on name pattern", col)
             id_columns.append(col)
     
-    print(f"Detected {len(id_columns)} ID columns to exclude: {id_columns}")
+    logger.debug("Detected %s ID columns to exclude: %s", len(id_columns), id_columns)
     return id_columns
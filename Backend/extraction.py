@@ -1,4 +1,4 @@
-from fastapi import FastAPI, UploadFile, File, Form, HTTPException
+from fastapi import FastAPI, UploadFile, File, Form, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
 from typing import List, Dict, Any
@@ -34,11 +34,17 @@ from sklearn.feature_selection import SelectKBest, f_classif, f_regression, chi2
 from sklearn.preprocessing import PolynomialFeatures
 from sklearn.manifold import TSNE, Isomap
 from sklearn.decomposition import KernelPCA, TruncatedSVD, FastICA
-import traceback
+import logging
 import os
 import importlib.util
 import importlib
 
+from response_cache import cache_key, cached_response, normalize_config
+from telemetry import StageTimer, get_logger, instrument
+from workers import run_in_process
+
+logger = get_logger("extraction")
+
 app = FastAPI()
 
 # Configure CORS
@@ -49,6 +55,8 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+# Request latency/size metrics and GET /metrics
+instrument(app)
 
 
 class ExtractionConfig(BaseModel):
@@ -58,15 +66,26 @@ class ExtractionConfig(BaseModel):
 
 
 @app.post("/extraction")
-async def extraction(file: UploadFile = File(...), config: str = Form(...)):
+async def extraction(request: Request, file: UploadFile = File(...), config: str = Form(...)):
+    # Read the upload here; the extraction itself runs in the worker process pool
+    content = await file.read()
+    key = cache_key("extraction", content, normalize_config(config))
+    return await cached_response(
+        request, key, lambda: run_in_process(run_extraction, content, file.filename, config),
+        endpoint="extraction",
+    )
+
+
+def run_extraction(content: bytes, filename: str, config: str) -> Dict[str, Any]:
+    """Extract features from an uploaded JSON/CSV payload (runs in a worker process)."""
     try:
-        print("Starting feature extraction")
-        print(f"Received file: {file.filename}")
-        print(f"Received config: {config}")
+        # Time each stage (parse, built-in methods, extractors, plots) for /metrics
+        timer = StageTimer("extraction")
+        timer.start("parse")
+        logger.info("Starting feature extraction")
+        logger.debug("Received file: %s", filename)
+        logger.debug("Received config: %s", config)
 
-        # Read the uploaded file into a DataFrame
-        content = await file.read()
-        
         # Initialize variables
         df = None
         featureNameMapping = {}
@@ -80,7 +99,7 @@ async def extraction(file: UploadFile = File(...), config: str = Form(...)):
                 # If direct array provided, load it
                 if isinstance(data, list):
                     df = pd.DataFrame(data)
-                    print("Loaded DataFrame from JSON array payload")
+                    logger.debug("Loaded DataFrame from JSON array payload")
                     featureNameMapping = {}
                 else:
                     # Extract DataFrame payload; support both 'processedData' and 'data' keys
@@ -92,23 +111,23 @@ async def extraction(file: UploadFile = File(...), config: str = Form(...)):
                         payload = None
                     if isinstance(payload, list):
                         df = pd.DataFrame(payload)
-                        print("Loaded DataFrame from payload list")
+                        logger.debug("Loaded DataFrame from payload list")
                     elif isinstance(payload, dict):
                         df = pd.json_normalize(payload)
-                        print("Loaded DataFrame from payload dict using json_normalize")
+                        logger.debug("Loaded DataFrame from payload dict using json_normalize")
                     # Get feature name mapping if available
                     featureNameMapping = data.get("featureNameMapping", {}) if isinstance(data, dict) else {}
             except (json.JSONDecodeError, UnicodeDecodeError):
-                print("Content is not valid JSON, trying CSV format...")
+                logger.debug("Content is not valid JSON, trying CSV format...")
                 # If not valid JSON, try reading as CSV
                 try:
                     df = pd.read_csv(io.BytesIO(content))
-                    print(f"Loaded CSV data with {len(df)} rows and {len(df.columns)} columns")
+                    logger.debug("Loaded CSV data with %s rows and %s columns", len(df), len(df.columns))
                 except Exception as csv_error:
                     # Try with different separator if comma doesn't work
                     try:
                         df = pd.read_csv(io.BytesIO(content), sep=';')
-                        print(f"Loaded CSV data (with semicolon separator) with {len(df)} rows and {len(df.columns)} columns")
+                        logger.debug("Loaded CSV data (with semicolon separator) with %s rows and %s columns", len(df), len(df.columns))
                     except Exception as e:
                         raise ValueError(f"Failed to parse as CSV: {str(e)}")
             
@@ -117,11 +136,11 @@ async def extraction(file: UploadFile = File(...), config: str = Form(...)):
                 raise ValueError("Could not extract data from the provided file")
                 
         except Exception as e:
-            print(f"Error reading file: {e}")
+            logger.error("Error reading file: %s", e)
             raise HTTPException(status_code=400, detail=f"Invalid file format: {str(e)}")
             
-        print(f"Data shape: {df.shape}")
-        print(f"Columns: {df.columns.tolist()[:10]}...")
+        logger.debug("Data shape: %s", df.shape)
+        logger.debug("Columns: %s...", df.columns.tolist()[:10])
         # print(f"Feature Name Mapping: {featureNameMapping}")
 
         # Parse the config JSON
@@ -138,7 +157,7 @@ async def extraction(file: UploadFile = File(...), config: str = Form(...)):
 
         # Filter to include only selected features that are numeric
         if not features:
-            print("No features specified. Defaulting to all numeric columns.")
+            logger.debug("No features specified. Defaulting to all numeric columns.")
             numeric_features = numeric_cols
         else:
             numeric_features = [col for col in features if col in numeric_cols]
@@ -146,7 +165,7 @@ async def extraction(file: UploadFile = File(...), config: str = Form(...)):
         if not numeric_features:
             return {"error": "No numeric features selected for extraction"}
 
-        print(f"Using {len(numeric_features)} numeric features for extraction")
+        logger.debug("Using %s numeric features for extraction", len(numeric_features))
         # Save original features for mapping composite features
         original_features = numeric_features.copy()
 
@@ -160,12 +179,13 @@ async def extraction(file: UploadFile = File(...), config: str = Form(...)):
         preview_list = []
         # Loop through selected methods
         for method in methods:
-            print(f"Applying {method} method")
+            timer.start(method)
+            logger.debug("Applying %s method", method)
 
             if method == "pca":
                 # Principal Component Analysis
                 n_components = min(settings.get("pcaComponents", 2), len(numeric_features))
-                print(f"PCA with {n_components} components")
+                logger.debug("PCA with %s components", n_components)
 
                 pca = PCA(n_components=n_components)
                 pca_result = pca.fit_transform(X)
@@ -186,13 +206,13 @@ async def extraction(file: UploadFile = File(...), config: str = Form(...)):
                 # Kernel PCA
                 kernel = settings.get("kernel", "rbf")  # Default kernel is RBF
                 n_components = settings.get("pcaComponents", 2)
-                print(f"Kernel PCA with {n_components} components and kernel={kernel}")
+                logger.debug("Kernel PCA with %s components and kernel=%s", n_components, kernel)
 
                 kpca = KernelPCA(n_components=n_components, kernel=kernel)
                 try:
                     kpca_result = kpca.fit_transform(X)
                 except Exception as e:
-                    print(f"Kernel PCA skipped due to error: {e}")
+                    logger.warning("Kernel PCA skipped due to error: %s", e)
                     continue
 
                 kpca_cols = [f"KPCA{i+1}" for i in range(n_components)]
@@ -209,7 +229,7 @@ async def extraction(file: UploadFile = File(...), config: str = Form(...)):
             elif method == "truncatedSVD":
                 # Truncated SVD
                 n_components = settings.get("pcaComponents", 2)
-                print(f"Truncated SVD with {n_components} components")
+                logger.debug("Truncated SVD with %s components", n_components)
 
                 svd = TruncatedSVD(n_components=n_components)
                 svd_result = svd.fit_transform(X)
@@ -228,7 +248,7 @@ async def extraction(file: UploadFile = File(...), config: str = Form(...)):
             elif method == "fastICA":
                 # Independent Component Analysis
                 n_components = settings.get("pcaComponents", 2)
-                print(f"Fast ICA with {n_components} components")
+                logger.debug("Fast ICA with %s components", n_components)
 
                 ica = FastICA(n_components=n_components)
                 ica_result = ica.fit_transform(X)
@@ -247,18 +267,18 @@ async def extraction(file: UploadFile = File(...), config: str = Form(...)):
             elif method == "tsne":
                 # t-SNE
                 n_components = settings.get("pcaComponents", 2)
-                print(f"t-SNE with {n_components} components")
+                logger.debug("t-SNE with %s components", n_components)
 
                 # Determine safe perplexity for small datasets
                 n_samples = X.shape[0]
                 default_perp = settings.get("perplexity", 30)
                 perp = min(default_perp, max(1, n_samples - 1))
-                print(f"t-SNE with perplexity={perp} on {n_samples} samples")
+                logger.debug("t-SNE with perplexity=%s on %s samples", perp, n_samples)
                 tsne = TSNE(n_components=n_components, perplexity=perp)
                 try:
                     tsne_result = tsne.fit_transform(X)
                 except Exception as e:
-                    print(f"t-SNE skipped due to error: {e}")
+                    logger.warning("t-SNE skipped due to error: %s", e)
                     continue
 
                 tsne_cols = [f"tSNE{i+1}" for i in range(n_components)]
@@ -276,7 +296,7 @@ async def extraction(file: UploadFile = File(...), config: str = Form(...)):
                 # Isomap
                 n_components = settings.get("pcaComponents", 2)
                 n_neighbors = settings.get("n_neighbors", 5)
-                print(f"Isomap with {n_components} components and {n_neighbors} neighbors")
+                logger.debug("Isomap with %s components and %s neighbors", n_components, n_neighbors)
 
                 isomap = Isomap(n_components=n_components, n_neighbors=n_neighbors)
                 isomap_result = isomap.fit_transform(X)
@@ -292,6 +312,7 @@ async def extraction(file: UploadFile = File(...), config: str = Form(...)):
                     for i, col in enumerate(isomap_cols):
                         preview_list.append({"feature": col, "value": float(row[i])})
 
+        timer.start("assemble")
         # Handle any remaining NaN values
         X = X.fillna(0)
         # Initialize containers for custom methods
@@ -305,6 +326,7 @@ async def extraction(file: UploadFile = File(...), config: str = Form(...)):
 
         # If AR features requested, run custom AR extractor and return feature/value pairs
         if any(isinstance(m, str) and 'ar_features' in m.lower() for m in methods):
+            timer.start("ar_features")
             # Dynamically load ar_features module
             spec = importlib.util.spec_from_file_location(
                 "custom_methods.ar_features",
@@ -321,7 +343,7 @@ async def extraction(file: UploadFile = File(...), config: str = Form(...)):
             ar_targets = [col for col in ar_targets if col in numeric_features]
             # If none, skip AR extraction
             if not ar_targets:
-                print("No AR channels selected, skipping AR extraction")
+                logger.debug("No AR channels selected, skipping AR extraction")
             else:
                 lags = settings.get('lags', 6)
                 for col in ar_targets:
@@ -362,8 +384,8 @@ async def extraction(file: UploadFile = File(...), config: str = Form(...)):
                 # Add AR preview to the main preview list
                 preview_list.extend(ar_preview_list)
 
-        print(f"Feature extraction complete. Final shape: {X.shape}")
-        print(f"Updated Feature Name Mapping: {featureNameMapping}")
+        logger.info("Feature extraction complete. Final shape: %s", X.shape)
+        logger.debug("Updated Feature Name Mapping: %s", featureNameMapping)
 
         # Prepare combined preview/processed lists for custom methods
         processed_list = []
@@ -371,14 +393,15 @@ async def extraction(file: UploadFile = File(...), config: str = Form(...)):
         # Handle Dominant Frequency extraction if requested
         # Handle Dominant Frequency extraction if requested
         if any(isinstance(m, str) and 'dominant' in m.lower() for m in methods):
-            print("--- Dominant Frequency branch entered ---")
+            timer.start("dominant_frequency")
+            logger.debug("--- Dominant Frequency branch entered ---")
              # Determine which channels to process for Dominant Frequency
             dom_targets = config.get('channels', []) or numeric_features
-            print(f"Dominant frequency channel targets: {dom_targets}")
+            logger.debug("Dominant frequency channel targets: %s", dom_targets)
              # Filter only numeric features
             dom_targets = [col for col in dom_targets if col in numeric_features]
-            print(f"Filtered dom_targets: {dom_targets}")
-            print(f"Dominant frequency targets: {dom_targets}")
+            logger.debug("Filtered dom_targets: %s", dom_targets)
+            logger.debug("Dominant frequency targets: %s", dom_targets)
             # Dynamically load dominant_frequency custom method
             spec_dom = importlib.util.spec_from_file_location(
                 "custom_methods.dominant_frequency",
@@ -396,29 +419,30 @@ async def extraction(file: UploadFile = File(...), config: str = Form(...)):
             df_input = df[dom_targets].copy()
             # Removed detrending: pass raw channel data directly
             dom_df = process_dom(df_input, settings)
-            print(f"Dominant frequency raw df: {dom_df}")
+            logger.debug("Dominant frequency raw df: %s", dom_df)
              # Build preview list
             preview_dom = []
             for feat, val in dom_df.to_dict(orient='records')[0].items():
-                print(f"DF feature {feat} raw value {val} (type: {type(val)})")
+                logger.debug("DF feature %s raw value %s (type: %s)", feat, val, type(val))
                 # More robust value conversion
                 try:
                     if val is None or (isinstance(val, float) and np.isnan(val)):
                         safe_val = 0.0
-                        print(f"  -> Converted None/NaN to 0.0")
+                        logger.debug("  -> Converted None/NaN to 0.0")
                     else:
                         safe_val = float(val)
-                        print(f"  -> Converted to float: {safe_val}")
+                        logger.debug("  -> Converted to float: %s", safe_val)
                 except (ValueError, TypeError) as e:
-                    print(f"  -> Error converting {val}: {e}, defaulting to 0.0")
+                    logger.debug("  -> Error converting %s: %s, defaulting to 0.0", val, e)
                     safe_val = 0.0
                 preview_dom.append({"feature": feat, "value": safe_val})
-            print(f"DF preview_dom: {preview_dom}")
+            logger.debug("DF preview_dom: %s", preview_dom)
              # Accumulate DF previews instead of returning early
             preview_list.extend(preview_dom)
 
         # If AR features requested, run custom AR extractor and return feature/value pairs
         if any(isinstance(m, str) and 'ar_features' in m.lower() for m in methods):
+            timer.start("ar_features")
             # Dynamically load ar_features module
             spec = importlib.util.spec_from_file_location(
                 "custom_methods.ar_features",
@@ -435,7 +459,7 @@ async def extraction(file: UploadFile = File(...), config: str = Form(...)):
             ar_targets = [col for col in ar_targets if col in numeric_features]
             # If none, skip AR extraction
             if not ar_targets:
-                print("No AR channels selected, skipping AR extraction")
+                logger.debug("No AR channels selected, skipping AR extraction")
             else:
                 lags = settings.get('lags', 6)
                 for col in ar_targets:
@@ -455,6 +479,7 @@ async def extraction(file: UploadFile = File(...), config: str = Form(...)):
 
         # Preview frequency-domain features if requested
         if any(isinstance(m, str) and 'frequency_domain' in m.lower() for m in methods):
+            timer.start("frequency_domain_features")
             spec_freq = importlib.util.spec_from_file_location(
                 "frequency_domain_features",
                 os.path.join(os.path.dirname(__file__), "custom_methods", "frequency_domain_features.py")
@@ -477,6 +502,7 @@ async def extraction(file: UploadFile = File(...), config: str = Form(...)):
 
         # Preview time-domain features if requested
         if any(isinstance(m, str) and 'time_domain' in m.lower() for m in methods):
+            timer.start("time_domain_features")
             spec_td = importlib.util.spec_from_file_location(
                 "custom_methods.time_domain_features",
                 os.path.join(os.path.dirname(__file__), "custom_methods", "time_domain_features.py")
@@ -494,13 +520,13 @@ async def extraction(file: UploadFile = File(...), config: str = Form(...)):
                 # Add emg_columns parameter for time-domain processing
                 td_settings = settings.copy()
                 td_settings['emg_columns'] = td_targets
-                print(f"Time-domain settings: {td_settings}")
+                logger.debug("Time-domain settings: %s", td_settings)
                 
                 td_df = process_td(df_input, td_settings)
                 
-                print(f"Time-domain method returned DataFrame with shape: {td_df.shape}")
-                print(f"TD columns: {list(td_df.columns)}")
-                print(f"TD trials (rows): {len(td_df)}")
+                logger.debug("Time-domain method returned DataFrame with shape: %s", td_df.shape)
+                logger.debug("TD columns: %s", list(td_df.columns))
+                logger.debug("TD trials (rows): %s", len(td_df))
                 
                 # Instead of using only first trial, use all trials to create multiple records
                 if len(td_df) > 1:
@@ -509,23 +535,23 @@ async def extraction(file: UploadFile = File(...), config: str = Form(...)):
                     for trial_idx in range(len(td_df)):
                         trial_record = {}
                         for feat, val in td_df.iloc[trial_idx].to_dict().items():
-                            print(f"TD trial {trial_idx} feature {feat} raw value {val} (type: {type(val)})")
+                            logger.debug("TD trial %s feature %s raw value %s (type: %s)", trial_idx, feat, val, type(val))
                             try:
                                 if val is None or (isinstance(val, float) and np.isnan(val)):
                                     safe_val = 0.0
-                                    print(f"  -> TD: Converted None/NaN to 0.0")
+                                    logger.debug("  -> TD: Converted None/NaN to 0.0")
                                 else:
                                     safe_val = float(val)
-                                    print(f"  -> TD: Converted to float: {safe_val}")
+                                    logger.debug("  -> TD: Converted to float: %s", safe_val)
                             except (ValueError, TypeError) as e:
-                                print(f"  -> TD: Error converting {val}: {e}, defaulting to 0.0")
+                                logger.debug("  -> TD: Error converting %s: %s, defaulting to 0.0", val, e)
                                 safe_val = 0.0
                             trial_record[feat] = safe_val
                         td_records.append(trial_record)
                     
                     # Store the multi-trial records for later use in processedData
                     processed_td_records = td_records
-                    print(f"Created {len(td_records)} time-domain trial records")
+                    logger.debug("Created %s time-domain trial records", len(td_records))
                     
                     # For preview, just show features from first trial
                     first_trial = td_records[0] if td_records else {}
@@ -534,16 +560,16 @@ async def extraction(file: UploadFile = File(...), config: str = Form(...)):
                 else:
                     # Single trial: use the original logic
                     for feat, val in td_df.to_dict(orient='records')[0].items():
-                        print(f"TD feature {feat} raw value {val} (type: {type(val)})")
+                        logger.debug("TD feature %s raw value %s (type: %s)", feat, val, type(val))
                         try:
                             if val is None or (isinstance(val, float) and np.isnan(val)):
                                 safe_val = 0.0
-                                print(f"  -> TD: Converted None/NaN to 0.0")
+                                logger.debug("  -> TD: Converted None/NaN to 0.0")
                             else:
                                 safe_val = float(val)
-                                print(f"  -> TD: Converted to float: {safe_val}")
+                                logger.debug("  -> TD: Converted to float: %s", safe_val)
                         except (ValueError, TypeError) as e:
-                            print(f"  -> TD: Error converting {val}: {e}, defaulting to 0.0")
+                            logger.debug("  -> TD: Error converting %s: %s, defaulting to 0.0", val, e)
                             safe_val = 0.0
                         preview_list.append({"feature": feat, "value": safe_val})
                     processed_td_records = []  # No multi-trial records
@@ -555,16 +581,16 @@ async def extraction(file: UploadFile = File(...), config: str = Form(...)):
                     names = [k.split(f'_{col}_')[-1] for k in channel_feats.keys()]
                     values = []
                     for v in channel_feats.values():
-                        print(f"    TD channel value {v} (type: {type(v)})")
+                        logger.debug("    TD channel value %s (type: %s)", v, type(v))
                         try:
                             if v is None or (isinstance(v, float) and np.isnan(v)):
                                 converted_val = 0.0
-                                print(f"      -> Channel: Converted None/NaN to 0.0")
+                                logger.debug("      -> Channel: Converted None/NaN to 0.0")
                             else:
                                 converted_val = float(v)
-                                print(f"      -> Channel: Converted to float: {converted_val}")
+                                logger.debug("      -> Channel: Converted to float: %s", converted_val)
                         except (ValueError, TypeError) as e:
-                            print(f"      -> Channel: Error converting {v}: {e}, defaulting to 0.0")
+                            logger.debug("      -> Channel: Error converting %s: %s, defaulting to 0.0", v, e)
                             converted_val = 0.0
                         values.append(converted_val)
                     td_results[col] = (names, values)
@@ -573,6 +599,7 @@ async def extraction(file: UploadFile = File(...), config: str = Form(...)):
 
         # Preview entropy features if requested
         if any(isinstance(m, str) and 'entropy_features' in m.lower() for m in methods):
+            timer.start("entropy_features")
             spec_ent = importlib.util.spec_from_file_location(
                 "custom_methods.entropy_features",
                 os.path.join(os.path.dirname(__file__), "custom_methods", "entropy_features.py")
@@ -591,16 +618,16 @@ async def extraction(file: UploadFile = File(...), config: str = Form(...)):
                     # More robust value conversion for entropy features
                     clean_feats = []
                     for f in feats:
-                        print(f"Entropy raw feature value {f} (type: {type(f)})")
+                        logger.debug("Entropy raw feature value %s (type: %s)", f, type(f))
                         try:
                             if f is None or (isinstance(f, float) and np.isnan(f)):
                                 converted_val = 0.0
-                                print(f"  -> Entropy: Converted None/NaN to 0.0")
+                                logger.debug("  -> Entropy: Converted None/NaN to 0.0")
                             else:
                                 converted_val = float(f)
-                                print(f"  -> Entropy: Converted to float: {converted_val}")
+                                logger.debug("  -> Entropy: Converted to float: %s", converted_val)
                         except (ValueError, TypeError) as e:
-                            print(f"  -> Entropy: Error converting {f}: {e}, defaulting to 0.0")
+                            logger.debug("  -> Entropy: Error converting %s: %s, defaulting to 0.0", f, e)
                             converted_val = 0.0
                         clean_feats.append(converted_val)
                     for name, val in zip(names, clean_feats):
@@ -611,6 +638,7 @@ async def extraction(file: UploadFile = File(...), config: str = Form(...)):
 
         # Preview wavelet features if requested
         if any(isinstance(m, str) and 'wavelet' in m.lower() for m in methods):
+            timer.start("wavelet_features")
             spec_wav = importlib.util.spec_from_file_location(
                 "custom_methods.wavelet_features",
                 os.path.join(os.path.dirname(__file__), "custom_methods", "wavelet_features.py")
@@ -631,16 +659,16 @@ async def extraction(file: UploadFile = File(...), config: str = Form(...)):
                     # More robust value conversion for wavelet features
                     clean_feats = []
                     for f in feats:
-                        print(f"Wavelet raw feature value {f} (type: {type(f)})")
+                        logger.debug("Wavelet raw feature value %s (type: %s)", f, type(f))
                         try:
                             if f is None or (isinstance(f, float) and np.isnan(f)):
                                 converted_val = 0.0
-                                print(f"  -> Wavelet: Converted None/NaN to 0.0")
+                                logger.debug("  -> Wavelet: Converted None/NaN to 0.0")
                             else:
                                 converted_val = float(f)
-                                print(f"  -> Wavelet: Converted to float: {converted_val}")
+                                logger.debug("  -> Wavelet: Converted to float: %s", converted_val)
                         except (ValueError, TypeError) as e:
-                            print(f"  -> Wavelet: Error converting {f}: {e}, defaulting to 0.0")
+                            logger.debug("  -> Wavelet: Error converting %s: %s, defaulting to 0.0", f, e)
                             converted_val = 0.0
                         clean_feats.append(converted_val)
                     for name, val in zip(names, clean_feats):
@@ -666,6 +694,7 @@ async def extraction(file: UploadFile = File(...), config: str = Form(...)):
                     "time_domain_features","entropy_features","wavelet_features"}
             if base.lower() in skip:
                 continue
+            timer.start(f"custom:{base}")
             # Dynamically load the custom helper module with correct package context
             try:
                 spec = importlib.util.spec_from_file_location(
@@ -679,7 +708,7 @@ async def extraction(file: UploadFile = File(...), config: str = Form(...)):
                 spec.loader.exec_module(custom_mod)
                 func = getattr(custom_mod, 'process_data', None)
             except Exception as e:
-                print(f"Custom import failed for {base}: {e}")
+                logger.warning("Custom import failed for %s: %s", base, e)
                 continue
             # Run custom process_data and append preview entries if available
             if func:
@@ -697,6 +726,7 @@ async def extraction(file: UploadFile = File(...), config: str = Form(...)):
                                 safe_val = 0.0
                         preview_list.append({"feature": feat, "value": safe_val})
 
+        timer.start("assemble")
         # Move any list-valued preview entries (e.g. respiratory_rates) to the front so they show up immediately
         list_entries = [item for item in preview_list if isinstance(item.get('value'), (list, np.ndarray))]
         scalar_entries = [item for item in preview_list if not isinstance(item.get('value'), (list, np.ndarray))]
@@ -704,35 +734,36 @@ async def extraction(file: UploadFile = File(...), config: str = Form(...)):
 
         # DEBUG: log combined preview_list (first 5 entries only)
         # DEBUG: always dump full previewList including any list-valued entries
-        print(f"DEBUG full preview_list ({len(preview_list)} entries): {preview_list}")
+        logger.debug("full preview_list (%s entries): %s", len(preview_list), preview_list)
         # DEBUG: explicitly dump full lists (e.g. respiratory_rates) for easier inspection
-        for item in preview_list:
-            val = item.get('value')
-            if isinstance(val, list):
-                print(f"DEBUG full list for {item.get('feature')}: {val}")
+        if logger.isEnabledFor(logging.DEBUG):
+            for item in preview_list:
+                val = item.get('value')
+                if isinstance(val, list):
+                    logger.debug("full list for %s: %s", item.get('feature'), val)
 
         # DEBUG: log what methods were actually used and preview list content
-        print(f"Methods received: {methods}")
-        print(f"Preview list length: {len(preview_list)}")
+        logger.debug("Methods received: %s", methods)
+        logger.debug("Preview list length: %s", len(preview_list))
         if preview_list:
-            print(f"Sample preview items: {preview_list[:3]}")
+            logger.debug("Sample preview items: %s", preview_list[:3])
         
         # General approach: construct processedData based on what was actually produced
         if ar_results:
             # AR methods: use windowed feature records
             response_processed = processed_ar_records
-            print("Using AR windowed feature records as processedData")
+            logger.debug("Using AR windowed feature records as processedData")
         elif processed_td_records:
             # Time-domain methods with multiple trials: use trial records
             response_processed = processed_td_records
-            print(f"Using time-domain trial records as processedData ({len(processed_td_records)} trials)")
+            logger.debug("Using time-domain trial records as processedData (%s trials)", len(processed_td_records))
         elif any(method in ['pca', 'kernelPCA', 'truncatedSVD', 'fastICA', 'tsne', 'isomap'] for method in methods):
             # Built-in dimensionality reduction methods: use transformed data
             response_processed = X.to_dict(orient='records')
-            print(f"Using transformed data from built-in methods as processedData")
-            print(f"Transformed DataFrame shape: {X.shape}")
-            print(f"processedData contains {len(response_processed)} feature records")
-            print(f"Feature columns: {list(X.columns)}")
+            logger.debug("Using transformed data from built-in methods as processedData")
+            logger.debug("Transformed DataFrame shape: %s", X.shape)
+            logger.debug("processedData contains %s feature records", len(response_processed))
+            logger.debug("Feature columns: %s", list(X.columns))
         elif preview_list and len(preview_list) > 0:
             # If we have a preview list with feature data, construct feature records
             # This is the general case for any custom feature extraction method
@@ -749,9 +780,9 @@ async def extraction(file: UploadFile = File(...), config: str = Form(...)):
             
             if feature_count > 0:
                 # DEBUG: Show sample preview items to check values before building feature record
-                print(f"DEBUG: Building feature record from {feature_count} preview items")
+                logger.debug("Building feature record from %s preview items", feature_count)
                 for i, item in enumerate(preview_list[:5]):  # Show first 5
-                    print(f"  Preview item {i}: {item}")
+                    logger.debug("  Preview item %s: %s", i, item)
                 
                 # Build feature record(s) from preview list
                 feature_record = {}
@@ -761,29 +792,29 @@ async def extraction(file: UploadFile = File(...), config: str = Form(...)):
                 
                 if feature_record:
                     response_processed = [feature_record]
-                    print(f"Constructed feature record from {feature_count} extracted features")
-                    print(f"Feature record keys: {list(feature_record.keys())[:10]}...")  # Show first 10 keys
+                    logger.debug("Constructed feature record from %s extracted features", feature_count)
+                    logger.debug("Feature record keys: %s...", list(feature_record.keys())[:10])  # Show first 10 keys
                     # DEBUG: Show actual values to check if they're being zeroed
                     sample_values = {k: v for i, (k, v) in enumerate(feature_record.items()) if i < 5}
-                    print(f"Sample feature values: {sample_values}")
+                    logger.debug("Sample feature values: %s", sample_values)
                 else:
                     # Fallback to original data if feature construction failed
                     response_processed = X.to_dict(orient='records')
-                    print("Fallback: using original data as no valid features could be constructed")
+                    logger.debug("Fallback: using original data as no valid features could be constructed")
             else:
                 # Preview list doesn't contain valid extracted features, use original data
                 response_processed = X.to_dict(orient='records')
-                print("Preview list doesn't contain valid extracted features, using original data")
+                logger.debug("Preview list doesn't contain valid extracted features, using original data")
         else:
             # Default: use original data (no methods applied or no preview data)
             response_processed = X.to_dict(orient='records')
-            print("Using original data as processedData (no feature extraction applied or no preview data)")
+            logger.debug("Using original data as processedData (no feature extraction applied or no preview data)")
 
-        print(f"Final response_processed type: {type(response_processed)}")
-        print(f"Final response_processed length: {len(response_processed) if isinstance(response_processed, list) else 'N/A'}")
+        logger.debug("Final response_processed type: %s", type(response_processed))
+        logger.debug("Final response_processed length: %s", len(response_processed) if isinstance(response_processed, list) else 'N/A')
         if isinstance(response_processed, list) and len(response_processed) > 0:
             sample_keys = list(response_processed[0].keys())
-            print(f"Sample response_processed record keys ({len(sample_keys)} total): {sample_keys[:10]}")
+            logger.debug("Sample response_processed record keys (%s total): %s", len(sample_keys), sample_keys[:10])
         
         
         
@@ -798,6 +829,7 @@ async def extraction(file: UploadFile = File(...), config: str = Form(...)):
                 "featureNameMapping": featureNameMapping,
             }
 
+            timer.start("plot")
             # Only generate sparklines for built-in extraction methods
             built_in = {"pca","kernelPCA","truncatedSVD","fastICA","tsne","isomap"}
             if any(m in built_in for m in methods):
@@ -892,9 +924,11 @@ async def extraction(file: UploadFile = File(...), config: str = Form(...)):
                     wav_plots[ch] = f"data:image/png;base64,{base64.b64encode(buf.read()).decode('utf-8')}"
                     plt.close(fig)
                 response['wavPlots'] = wav_plots
+            timer.stop()
             return response
 
         # Default return: no custom features selected
+        timer.stop()
         return {
             "message": "Feature extraction completed successfully",
             "preview": [],  # No AR features to preview
@@ -903,6 +937,5 @@ async def extraction(file: UploadFile = File(...), config: str = Form(...)):
         }
 
     except Exception as e:
-        print(f"Error in feature extraction: {str(e)}")
-        traceback.print_exc()
+        logger.exception("Error in feature extraction: %s", e)
         raise HTTPException(status_code=500, detail=f"Error in feature extraction: {str(e)}")
\ No newline at end of file
@@ -0,0 +1,353 @@
+"""
+Out-of-core training on feature streams with ``partial_fit``.
+
+Feature tables that do not fit in one request (or in memory) are sent in batches to an
+incremental session instead of /classification:
+
+- ``POST /incremental`` creates a session for 'minibatch_kmeans', 'birch' (clustering)
+  or 'sgd' (SGDClassifier with logistic loss; needs ``target`` and the full list of
+  ``classes`` up front),
+- ``POST /incremental/{session_id}/batches`` streams feature records as NDJSON (one
+  JSON object per line) or sends a JSON list. Rows are parsed while the body arrives,
+  grouped into batches of INCREMENTAL_BATCH_ROWS and applied one at a time: the
+  ``StandardScaler`` and the model are updated with ``partial_fit``, so only one batch
+  is held in memory,
+- ``GET /incremental/{session_id}`` reports progress,
+- ``POST /incremental/{session_id}/finalize`` stores the model in the model registry,
+  so ``POST /predict`` can use it.
+
+The session state (model, scaler, counters) is checkpointed to INCREMENTAL_MODEL_DIR
+after every INCREMENTAL_CHECKPOINT_EVERY batches and at the end of each upload, so an
+interrupted upload or a server restart resumes from the last checkpoint.
+"""
+import copy
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+import uuid
+from typing import Any, Dict, List, Optional
+
+import joblib
+import numpy as np
+import pandas as pd
+from fastapi import APIRouter, Form, HTTPException, Request
+from sklearn.cluster import Birch, MiniBatchKMeans
+from sklearn.linear_model import SGDClassifier
+from sklearn.preprocessing import StandardScaler
+
+import model_registry
+from preprocess_pipeline import StepCache
+from telemetry import get_logger
+from workers import run_in_thread
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+INCREMENTAL_MODEL_DIR = os.environ.get("INCREMENTAL_MODEL_DIR", os.path.join(BACKEND_DIR, ".incremental"))
+INCREMENTAL_BATCH_ROWS = int(os.environ.get("INCREMENTAL_BATCH_ROWS", "5000"))
+INCREMENTAL_CHECKPOINT_EVERY = int(os.environ.get("INCREMENTAL_CHECKPOINT_EVERY", "1"))
+# Sessions kept loaded in memory
+INCREMENTAL_CACHE_SIZE = int(os.environ.get("INCREMENTAL_CACHE_SIZE", "8"))
+INCREMENTAL_CACHE_MB = float(os.environ.get("INCREMENTAL_CACHE_MB", "256"))
+
+INCREMENTAL_MODELS = ("minibatch_kmeans", "birch", "sgd")
+
+router = APIRouter()
+logger = get_logger("incremental")
+
+_sessions = StepCache(INCREMENTAL_CACHE_SIZE, max_bytes=int(INCREMENTAL_CACHE_MB * 2 ** 20))
+
+
+class IncrementalSession:
+    """A model trained batch by batch, with its scaler, feature columns and counters."""
+
+    def __init__(self, session_id: str, model_type: str, model, features: Optional[List[str]],
+                 target: Optional[str] = None, classes: Optional[list] = None):
+        self.session_id = session_id
+        self.model_type = model_type
+        self.model = model
+        self.scaler = StandardScaler()
+        self.features = features
+        self.target = target
+        self.classes = classes
+        self.rows_seen = 0
+        self.batches = 0
+        self.last_batch_score = None
+        self.created = time.time()
+        self.updated = None
+        self.checkpointed = None
+        self.lock = threading.Lock()
+
+    def partial_fit(self, records: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """
+        Update the scaler and the model with one batch of feature records.
+
+        Before the update the batch is scored with the current model (accuracy for
+        'sgd', mean squared distance to the nearest center for 'minibatch_kmeans'),
+        which tracks how well the model generalizes to data it has not seen yet.
+        """
+        df = pd.DataFrame(records)
+        with self.lock:
+            if self.features is None:
+                # The first batch fixes the feature columns
+                numeric = df.select_dtypes(include=[np.number]).columns
+                self.features = [c for c in numeric if c != self.target]
+                if not self.features:
+                    raise HTTPException(status_code=400, detail="No numeric feature columns in the first batch")
+            missing = [c for c in self.features if c not in df.columns]
+            if missing:
+                raise HTTPException(status_code=400, detail=f"Batch is missing feature columns: {missing}")
+            X = df[self.features].to_numpy(dtype=float)
+            if np.isnan(X).any():
+                raise HTTPException(status_code=400, detail="Batch contains missing feature values")
+            if self.model_type == "sgd":
+                if self.target not in df.columns:
+                    raise HTTPException(status_code=400, detail=f"Batch is missing the target column '{self.target}'")
+                y = df[self.target].to_numpy()
+                unknown = set(np.unique(y).tolist()) - set(self.classes)
+                if unknown:
+                    raise HTTPException(status_code=400, detail=f"Unknown classes {sorted(map(str, unknown))}, declared {self.classes}")
+            if self.model_type == "minibatch_kmeans" and not self.batches and len(X) < self.model.n_clusters:
+                raise HTTPException(
+                    status_code=400,
+                    detail=f"The first batch has {len(X)} rows, 'minibatch_kmeans' needs at least n_clusters={self.model.n_clusters}",
+                )
+
+            # A rejected batch must not change the state: the scaler update is kept only
+            # once the model has accepted the batch
+            scaler = copy.deepcopy(self.scaler)
+            scaler.partial_fit(X)
+            X_scaled = scaler.transform(X)
+            if self.model_type == "sgd":
+                if self.batches:
+                    self.last_batch_score = float((self.model.predict(X_scaled) == y).mean())
+                self.model.partial_fit(X_scaled, y, classes=np.asarray(self.classes))
+            else:
+                if self.batches and self.model_type == "minibatch_kmeans":
+                    self.last_batch_score = float(-self.model.score(X_scaled) / len(X_scaled))
+                self.model.partial_fit(X_scaled)
+            self.scaler = scaler
+            self.rows_seen += len(X)
+            self.batches += 1
+            self.updated = time.time()
+            return self.status()
+
+    def status(self) -> Dict[str, Any]:
+        status = {
+            "sessionId": self.session_id,
+            "modelType": self.model_type,
+            "features": self.features,
+            "target": self.target,
+            "classes": self.classes,
+            "rowsSeen": self.rows_seen,
+            "batches": self.batches,
+            "lastBatchScore": self.last_batch_score,
+            "createdAt": self.created,
+            "updatedAt": self.updated,
+            "checkpointedAt": self.checkpointed,
+        }
+        if self.model_type == "minibatch_kmeans" and self.batches:
+            status["numCenters"] = len(self.model.cluster_centers_)
+        elif self.model_type == "birch" and self.batches:
+            # Birch's global clustering groups its CF-tree subclusters into the final clusters
+            status["numCenters"] = len(np.unique(self.model.subcluster_labels_))
+            status["numSubclusters"] = len(self.model.subcluster_centers_)
+        return status
+
+    def checkpoint(self):
+        """Write the session to disk, replacing the previous checkpoint atomically."""
+        with self.lock:
+            self.checkpointed = time.time()
+            os.makedirs(INCREMENTAL_MODEL_DIR, exist_ok=True)
+            descriptor, path = tempfile.mkstemp(prefix=".checkpoint-", dir=INCREMENTAL_MODEL_DIR)
+            try:
+                with os.fdopen(descriptor, "wb") as f:
+                    joblib.dump({k: v for k, v in self.__dict__.items() if k != "lock"}, f)
+                os.replace(path, _session_path(self.session_id))
+            except BaseException:
+                if os.path.exists(path):
+                    os.remove(path)
+                raise
+
+    def register(self) -> str:
+        """Store the current model and scaler in the model registry; returns the model ID."""
+        with self.lock:
+            return model_registry.save_model(self.model, self.scaler, self.features, {
+                "modelType": self.model_type,
+                "target": self.target,
+                "numTrain": self.rows_seen,
+                "incrementalSession": self.session_id,
+                "batches": self.batches,
+            })
+
+    @classmethod
+    def load(cls, session_id: str) -> "IncrementalSession":
+        """Session from memory, or from its last checkpoint."""
+        session = _sessions.get(session_id)
+        if session is not None:
+            return session
+        path = _session_path(session_id)
+        if not os.path.exists(path):
+            raise HTTPException(status_code=404, detail=f"Incremental session '{session_id}' not found")
+        session = cls.__new__(cls)
+        session.__dict__.update(joblib.load(path))
+        session.lock = threading.Lock()
+        _sessions.put(session_id, session)
+        return session
+
+
+def new_model(model_type: str, n_clusters: int = 3, threshold: float = 0.5):
+    """Unfitted estimator supporting ``partial_fit`` for an incremental model type."""
+    if model_type == "minibatch_kmeans":
+        return MiniBatchKMeans(n_clusters=n_clusters, random_state=42, n_init=3)
+    if model_type == "birch":
+        return Birch(n_clusters=n_clusters, threshold=threshold)
+    if model_type == "sgd":
+        return SGDClassifier(loss="log_loss", random_state=42)
+    raise HTTPException(
+        status_code=400, detail=f"Unknown incremental model '{model_type}', use one of {list(INCREMENTAL_MODELS)}"
+    )
+
+
+@router.post("/incremental")
+async def create_session(
+    model_type: str = Form(...),
+    n_clusters: int = Form(3),
+    threshold: float = Form(0.5),
+    target: str = Form(None),
+    classes: str = Form(None),
+    features: str = Form(None),
+):
+    """
+    Create an incremental training session.
+
+    ``classes`` (JSON list) and ``target`` are required for 'sgd'; ``features`` (JSON
+    list) fixes the feature columns, otherwise the numeric columns of the first batch
+    are used. ``threshold`` is the Birch subcluster radius on standardized features.
+    """
+    model_type = model_type.lower()
+    model = new_model(model_type, n_clusters, threshold)
+    class_list = _json_list(classes, "classes")
+    if model_type == "sgd" and (not target or not class_list or len(class_list) < 2):
+        raise HTTPException(status_code=400, detail="'sgd' needs a target column and a JSON list of at least two classes")
+    session = IncrementalSession(
+        uuid.uuid4().hex, model_type, model, _json_list(features, "features"),
+        target=target if model_type == "sgd" else None, classes=class_list if model_type == "sgd" else None,
+    )
+    await run_in_thread(session.checkpoint)
+    _sessions.put(session.session_id, session)
+    return session.status()
+
+
+@router.post("/incremental/{session_id}/batches")
+async def upload_batches(session_id: str, request: Request):
+    """
+    Apply feature records to a session.
+
+    The body is NDJSON (``application/x-ndjson``, one record per line, parsed as it
+    arrives) or a JSON list of records. If a batch is rejected, the batches before it
+    remain applied and checkpointed; the error reports how many rows were applied.
+    """
+    session = IncrementalSession.load(session_id)
+    applied_rows = 0
+    applied_batches = 0
+    try:
+        async for batch in _record_batches(request, INCREMENTAL_BATCH_ROWS):
+            # partial_fit is CPU-bound; the thread keeps the session shared with other requests
+            await run_in_thread(session.partial_fit, batch)
+            applied_rows += len(batch)
+            applied_batches += 1
+            if applied_batches % INCREMENTAL_CHECKPOINT_EVERY == 0:
+                await run_in_thread(session.checkpoint)
+    except HTTPException as e:
+        if applied_batches:
+            await run_in_thread(session.checkpoint)
+        raise HTTPException(status_code=e.status_code, detail=f"{e.detail} (applied {applied_rows} rows before the error)")
+    except ValueError as e:
+        if applied_batches:
+            await run_in_thread(session.checkpoint)
+        raise HTTPException(status_code=400, detail=f"{e} (applied {applied_rows} rows before the error)")
+    if applied_batches % INCREMENTAL_CHECKPOINT_EVERY:
+        await run_in_thread(session.checkpoint)
+    logger.debug("Session %s: applied %s rows in %s batches", session_id, applied_rows, applied_batches)
+    return {**session.status(), "appliedRows": applied_rows, "appliedBatches": applied_batches}
+
+
+@router.get("/incremental/{session_id}")
+async def get_session(session_id: str):
+    """Progress of an incremental session."""
+    return IncrementalSession.load(session_id).status()
+
+
+@router.post("/incremental/{session_id}/finalize")
+async def finalize_session(session_id: str):
+    """Store the current model of a session in the model registry for ``/predict``."""
+    session = IncrementalSession.load(session_id)
+    if not session.batches:
+        raise HTTPException(status_code=400, detail="The session has not been trained on any batch")
+    model_id = await run_in_thread(session.register)
+    return {**session.status(), "modelId": model_id}
+
+
+@router.delete("/incremental/{session_id}")
+async def delete_session(session_id: str):
+    """Remove a session and its checkpoint."""
+    path = _session_path(session_id)
+    if not os.path.exists(path):
+        raise HTTPException(status_code=404, detail=f"Incremental session '{session_id}' not found")
+    os.remove(path)
+    _sessions.pop(session_id)
+    return {"sessionId": session_id, "deleted": True}
+
+
+# =============================================================================
+# Internals
+# =============================================================================
+def _session_path(session_id):
+    if not re.fullmatch(r"[0-9a-f]{32}", session_id or ""):
+        raise HTTPException(status_code=400, detail="Invalid session ID")
+    return os.path.join(INCREMENTAL_MODEL_DIR, f"{session_id}.joblib")
+
+
+def _json_list(value, name):
+    if not value:
+        return None
+    try:
+        parsed = json.loads(value)
+    except json.JSONDecodeError:
+        raise HTTPException(status_code=400, detail=f"'{name}' must be a JSON list")
+    if not isinstance(parsed, list):
+        raise HTTPException(status_code=400, detail=f"'{name}' must be a JSON list")
+    return parsed
+
+
+async def _record_batches(request, batch_rows):
+    # Yields lists of at most batch_rows records while the body is still arriving
+    content_type = request.headers.get("content-type", "")
+    if "ndjson" not in content_type and "jsonlines" not in content_type:
+        records = json.loads(await request.body())
+        if isinstance(records, dict):
+            records = records.get("features", [])
+        if not isinstance(records, list):
+            raise ValueError("Expected a JSON list of feature records")
+        for start in range(0, len(records), batch_rows):
+            yield records[start:start + batch_rows]
+        return
+
+    pending = b""
+    batch = []
+    async for chunk in request.stream():
+        pending += chunk
+        lines = pending.split(b"\n")
+        pending = lines.pop()
+        for line in lines:
+            if line.strip():
+                batch.append(json.loads(line))
+                if len(batch) >= batch_rows:
+                    yield batch
+                    batch = []
+    if pending.strip():
+        batch.append(json.loads(pending))
+    if batch:
+        yield batch
@@ -0,0 +1,460 @@
+"""
+Background jobs for long-running analyses.
+
+Heavy operations (t-SNE/Isomap extraction, profiling reports, SVM training, large
+preprocessing runs) can exceed proxy timeouts as plain HTTP calls. The endpoints in
+this router accept the same inputs as the synchronous endpoints, return a job ID
+immediately and run the work on the worker pools in the background:
+
+- ``POST /jobs/{kind}`` submits a job (kinds: preprocess, extraction, classification,
+  evaluation, eda)
+- ``GET /jobs/{job_id}`` reports status, progress and stage timings
+- ``GET /jobs/{job_id}/result`` returns the result of a finished job
+- ``POST /jobs/{job_id}/cancel`` cancels a queued or running job
+- ``GET /jobs`` lists recent jobs
+
+Each kind belongs to a queue with its own concurrency limit (JOBS_QUEUE_LIMITS,
+e.g. "heavy=1,default=2"). Job records and results are stored in SQLite
+(JOBS_DB_PATH) so finished results survive restarts; jobs that were still queued or
+running when the server stopped are marked as interrupted on startup. Only the newest
+JOBS_MAX_FINISHED finished jobs are kept, and with JOBS_MAX_AGE_DAYS set none older
+than that; SQLite access and result serialization run on the thread pool.
+
+A result that is an error response (status >= 400) or an ``{"error": ...}`` dict, the
+convention of the analysis functions for invalid input, fails the job.
+
+Limits:
+
+- ``progress`` marks stages, not work done: 0.1 once the computation starts, 0.9
+  while the result is stored and 1.0 when it is complete. The pool functions do not
+  report their own progress; ``stages`` gives the timings.
+- A computation already running in a worker process cannot be interrupted. Cancelling
+  it marks the job cancelled right away and discards the result, but the job keeps
+  its queue slot until the worker finishes, so cancelled work does not let more jobs
+  run than the queue limit allows. Coroutine jobs (e.g. cross-validation) are
+  cancelled at their next await and pool tasks they have not started are dropped;
+  their slot is likewise held until the pool tasks already running are done.
+"""
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Any, Dict, List, Optional
+
+from fastapi import APIRouter, File, Form, HTTPException, Request, UploadFile
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import Response
+
+import classification
+import model_search
+import workers
+from telemetry import get_logger
+from workers import run_in_process, run_in_thread
+
+logger = get_logger("jobs")
+
+JOBS_DB_PATH = os.environ.get(
+    "JOBS_DB_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "jobs.sqlite3")
+)
+# Finished jobs (with their results) kept in JOBS_DB_PATH; 0 disables either limit
+JOBS_MAX_FINISHED = int(os.environ.get("JOBS_MAX_FINISHED", "500"))
+JOBS_MAX_AGE_DAYS = float(os.environ.get("JOBS_MAX_AGE_DAYS", "0"))
+
+# Concurrent jobs per queue, overridable as "queue=limit,queue=limit"
+DEFAULT_QUEUE_LIMITS = {"heavy": 1, "default": 2}
+
+# Queue of each job kind
+JOB_QUEUES = {
+    "preprocess": "default",
+    "classification": "default",
+    "evaluation": "default",
+    "extraction": "heavy",
+    "eda": "heavy",
+}
+
+FINISHED_STATUSES = ("completed", "failed", "cancelled")
+
+router = APIRouter()
+
+
+def parse_queue_limits(value: Optional[str]) -> Dict[str, int]:
+    """Parse JOBS_QUEUE_LIMITS ("heavy=1,default=2") on top of the defaults."""
+    limits = dict(DEFAULT_QUEUE_LIMITS)
+    for item in (value or "").split(","):
+        if "=" in item:
+            name, limit = item.split("=", 1)
+            limits[name.strip()] = max(1, int(limit))
+    return limits
+
+
+class JobStore:
+    """SQLite persistence for job records and results."""
+
+    def __init__(self, path: str = JOBS_DB_PATH):
+        self.path = path
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.row_factory = sqlite3.Row
+        with self.lock, self.connection:
+            self.connection.execute(
+                """
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id TEXT PRIMARY KEY,
+                    kind TEXT NOT NULL,
+                    queue TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    progress REAL NOT NULL DEFAULT 0,
+                    stage TEXT,
+                    stages TEXT NOT NULL DEFAULT '[]',
+                    error TEXT,
+                    result TEXT,
+                    created REAL NOT NULL,
+                    started REAL,
+                    finished REAL
+                )
+                """
+            )
+
+    def create(self, job_id: str, kind: str, queue: str) -> None:
+        with self.lock, self.connection:
+            self.connection.execute(
+                "INSERT INTO jobs (id, kind, queue, status, stage, created) VALUES (?, ?, ?, 'queued', 'queued', ?)",
+                (job_id, kind, queue, time.time()),
+            )
+
+    def update(self, job_id: str, **fields) -> None:
+        if "stages" in fields:
+            fields["stages"] = json.dumps(fields["stages"])
+        columns = ", ".join(f"{name} = ?" for name in fields)
+        with self.lock, self.connection:
+            self.connection.execute(f"UPDATE jobs SET {columns} WHERE id = ?", (*fields.values(), job_id))
+
+    def get(self, job_id: str, with_result: bool = False) -> Optional[Dict[str, Any]]:
+        columns = "*" if with_result else "id, kind, queue, status, progress, stage, stages, error, created, started, finished"
+        with self.lock:
+            row = self.connection.execute(f"SELECT {columns} FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return self._row(row) if row is not None else None
+
+    def list(self, status: Optional[str] = None, limit: int = 50) -> List[Dict[str, Any]]:
+        query = "SELECT id, kind, queue, status, progress, stage, stages, error, created, started, finished FROM jobs"
+        args: List[Any] = []
+        if status:
+            query += " WHERE status = ?"
+            args.append(status)
+        query += " ORDER BY created DESC LIMIT ?"
+        args.append(limit)
+        with self.lock:
+            rows = self.connection.execute(query, args).fetchall()
+        return [self._row(row) for row in rows]
+
+    def mark_interrupted(self) -> int:
+        """Fail jobs left queued/running by a previous server process."""
+        with self.lock, self.connection:
+            cursor = self.connection.execute(
+                "UPDATE jobs SET status = 'failed', error = 'Interrupted by server restart', finished = ? "
+                "WHERE status IN ('queued', 'running')",
+                (time.time(),),
+            )
+        return cursor.rowcount
+
+    def prune(self, max_finished: int = JOBS_MAX_FINISHED, max_age_days: float = JOBS_MAX_AGE_DAYS) -> int:
+        """Delete finished jobs beyond the newest ``max_finished`` or older than ``max_age_days``."""
+        finished = ", ".join(f"'{status}'" for status in FINISHED_STATUSES)
+        deleted = 0
+        with self.lock, self.connection:
+            if max_finished > 0:
+                deleted += self.connection.execute(
+                    f"DELETE FROM jobs WHERE status IN ({finished}) AND id NOT IN "
+                    f"(SELECT id FROM jobs WHERE status IN ({finished}) ORDER BY finished DESC LIMIT ?)",
+                    (max_finished,),
+                ).rowcount
+            if max_age_days > 0:
+                deleted += self.connection.execute(
+                    f"DELETE FROM jobs WHERE status IN ({finished}) AND finished < ?",
+                    (time.time() - max_age_days * 86400,),
+                ).rowcount
+        return deleted
+
+    @staticmethod
+    def _row(row: sqlite3.Row) -> Dict[str, Any]:
+        job = dict(row)
+        job["stages"] = json.loads(job["stages"] or "[]")
+        if "result" in job:
+            job["result"] = json.loads(job["result"]) if job["result"] is not None else None
+        return job
+
+
+class JobManager:
+    """Runs submitted jobs with per-queue concurrency limits."""
+
+    def __init__(self, store: JobStore, queue_limits: Dict[str, int]):
+        self.store = store
+        self.queue_limits = queue_limits
+        self.semaphores: Dict[str, asyncio.Semaphore] = {}
+        self.tasks: Dict[str, asyncio.Task] = {}
+
+    async def submit(self, kind: str, func, *args, in_process: bool = True) -> str:
+        """
+        Register a job and schedule ``func(*args)`` on the worker pools; coroutine
+        functions are awaited on the event loop instead.
+        """
+        job_id = uuid.uuid4().hex
+        queue = JOB_QUEUES.get(kind, "default")
+        await run_in_thread(self.store.create, job_id, kind, queue)
+        task = asyncio.create_task(self._run(job_id, queue, func, args, in_process))
+        self.tasks[job_id] = task
+        task.add_done_callback(lambda _: self.tasks.pop(job_id, None))
+        return job_id
+
+    async def cancel(self, job_id: str) -> bool:
+        """Cancel a job; returns False if it had already finished."""
+        task = self.tasks.get(job_id)
+        if task is None or task.done():
+            return False
+        # A computation already running in a worker cannot be interrupted; its result is
+        # discarded and the job keeps its queue slot until the worker is done
+        task.cancel()
+        job = await run_in_thread(self.store.get, job_id)
+        if job is not None and job["status"] == "queued":
+            # A task cancelled before it started never reaches its own cancellation handler
+            await self._update(job_id, status="cancelled", stage=None, finished=time.time())
+        return True
+
+    async def _run(self, job_id, queue, func, args, in_process):
+        stages = [{"name": "queued", "started": time.time()}]
+        semaphore = self.semaphores.setdefault(
+            queue, asyncio.Semaphore(self.queue_limits.get(queue, DEFAULT_QUEUE_LIMITS["default"]))
+        )
+        try:
+            async with semaphore:
+                started = time.time()
+                stages = self._next_stage(stages, "compute", started)
+                await self._update(job_id, status="running", stage="compute", progress=0.1,
+                                   started=started, stages=stages)
+
+                futures = set()
+                work = asyncio.ensure_future(_compute(futures, func, args, in_process))
+                try:
+                    result = await asyncio.shield(work)
+                except asyncio.CancelledError:
+                    await self._update(job_id, status="cancelled", stage=None, finished=time.time(),
+                                       stages=self._next_stage(stages, None, time.time()))
+                    # Coroutines stop at their next await and pool tasks not started yet are
+                    # dropped; running workers cannot be stopped, so hold the queue slot until
+                    # they are done
+                    work.cancel()
+                    await asyncio.wait([work])
+                    running = [asyncio.wrap_future(future) for future in futures if not future.done()]
+                    if running:
+                        await asyncio.wait(running)
+                    raise
+
+                stages = self._next_stage(stages, "store", time.time())
+                await self._update(job_id, stage="store", progress=0.9, stages=stages)
+                serialized = await run_in_thread(_serialize, result)
+
+                finished = time.time()
+                stages = self._next_stage(stages, None, finished)
+                await self._update(job_id, status="completed", stage=None, progress=1.0,
+                                   stages=stages, result=serialized, finished=finished)
+        except asyncio.CancelledError:
+            await self._update(job_id, status="cancelled", stages=self._next_stage(stages, None, time.time()),
+                               finished=time.time())
+        except HTTPException as e:
+            await self._update(job_id, status="failed", error=str(e.detail),
+                               stages=self._next_stage(stages, None, time.time()), finished=time.time())
+        except Exception as e:
+            logger.warning("Job %s failed: %s", job_id, e)
+            await self._update(job_id, status="failed", error=str(e),
+                               stages=self._next_stage(stages, None, time.time()), finished=time.time())
+        pruned = await run_in_thread(self.store.prune)
+        if pruned:
+            logger.debug("Pruned %s finished jobs", pruned)
+
+    async def _update(self, job_id, **fields):
+        await run_in_thread(self.store.update, job_id, **fields)
+
+    @staticmethod
+    def _next_stage(stages, name, now):
+        # Close the current stage and open the next one
+        stages = [dict(stage) for stage in stages]
+        if stages and "finished" not in stages[-1]:
+            stages[-1]["finished"] = now
+            stages[-1]["duration"] = now - stages[-1]["started"]
+        if name is not None:
+            stages.append({"name": name, "started": now})
+        return stages
+
+
+async def _compute(futures, func, args, in_process):
+    # Pool tasks submitted from here (including those of coroutine jobs) land in ``futures``
+    workers.pool_futures.set(futures)
+    if asyncio.iscoroutinefunction(func):
+        # Coroutines orchestrate their own pool calls (e.g. cross-validation folds)
+        return await func(*args)
+    runner = run_in_process if in_process else run_in_thread
+    return await runner(func, *args)
+
+
+def _serialize(result):
+    return json.dumps(jsonable_encoder(_response_content(result)))
+
+
+def _response_content(result):
+    # Synchronous helpers may return a ready JSONResponse (e.g. /preprocess) or (content, status)
+    if isinstance(result, Response):
+        content = json.loads(result.body)
+        if result.status_code >= 400:
+            detail = content.get("error", content.get("detail", str(content))) if isinstance(content, dict) else str(content)
+            raise HTTPException(status_code=result.status_code, detail=detail)
+        return content
+    if isinstance(result, tuple) and len(result) == 2 and isinstance(result[1], int):
+        if result[1] >= 400:
+            raise HTTPException(status_code=result[1], detail=result[0].get("error", str(result[0])))
+        return result[0]
+    if isinstance(result, dict) and "error" in result:
+        raise HTTPException(status_code=400, detail=str(result["error"]))
+    return result
+
+
+job_manager: Optional[JobManager] = None
+
+
+def get_job_manager() -> JobManager:
+    global job_manager
+    if job_manager is None:
+        job_manager = JobManager(JobStore(), parse_queue_limits(os.environ.get("JOBS_QUEUE_LIMITS")))
+    return job_manager
+
+
+def recover_jobs() -> None:
+    """Mark jobs interrupted by a previous shutdown; call once at startup."""
+    store = get_job_manager().store
+    count = store.mark_interrupted()
+    if count:
+        logger.warning("Marked %s interrupted jobs as failed", count)
+    store.prune()
+
+
+# =============================================================================
+# Submission endpoints
+# =============================================================================
+@router.post("/jobs/preprocess")
+async def submit_preprocess(request: Request):
+    """Submit a /preprocess request (same JSON body) as a background job."""
+    from preprocess import run_preprocess
+
+    payload = await request.json()
+    # Runs on a thread so it shares the in-process preprocessing step cache
+    job_id = await get_job_manager().submit("preprocess", run_preprocess, payload, in_process=False)
+    return {"jobId": job_id, "status": "queued"}
+
+
+@router.post("/jobs/extraction")
+async def submit_extraction(file: UploadFile = File(...), config: str = Form(...)):
+    """Submit a feature extraction (same form fields as /extraction) as a background job."""
+    from extraction import run_extraction
+
+    content = await file.read()
+    job_id = await get_job_manager().submit("extraction", run_extraction, content, file.filename, config)
+    return {"jobId": job_id, "status": "queued"}
+
+
+@router.post("/jobs/classification")
+async def submit_classification(
+    model_type: str = Form(...),
+    features: UploadFile = File(...),
+    target: str = Form(None),
+    n_clusters: str = Form(None),
+    k_min: int = Form(classification.AUTO_K_RANGE[0]),
+    k_max: int = Form(classification.AUTO_K_RANGE[1]),
+    sample_size: int = Form(None),
+    validation: str = Form("holdout"),
+    cv_folds: int = Form(model_search.CV_FOLDS),
+    svm_solver: str = Form("auto"),
+    calibrate: bool = Form(False),
+    visualization: str = Form("points"),
+    grid_size: int = Form(classification.DENSITY_GRID_SIZE),
+    linkage: str = Form("ward"),
+    n_neighbors: int = Form(classification.HIERARCHICAL_NEIGHBORS),
+    importance: str = Form("model"),
+    n_repeats: int = Form(model_search.PERMUTATION_REPEATS)
+):
+    """Submit a classification run (same form fields as /classification) as a background job."""
+    content = await features.read()
+    job_id = await get_job_manager().submit(
+        "classification", classification.classify, content, model_type, target, n_clusters, (k_min, k_max), sample_size,
+        validation, cv_folds, svm_solver, calibrate, visualization, grid_size,
+        linkage, n_neighbors, importance, n_repeats,
+    )
+    return {"jobId": job_id, "status": "queued"}
+
+
+@router.post("/jobs/evaluation")
+async def submit_evaluation(
+    methods: str = Form(...),
+    features: UploadFile = Form(...),
+    weights: str = Form(None)
+):
+    """Submit a feature evaluation (same form fields as /evaluation) as a background job."""
+    from evaluation import run_evaluation
+
+    content = await features.read()
+    job_id = await get_job_manager().submit("evaluation", run_evaluation, methods, content, weights)
+    return {"jobId": job_id, "status": "queued"}
+
+
+@router.post("/jobs/eda")
+async def submit_eda(file: UploadFile = File(...)):
+    """Submit a profiling report (same upload as /viz/eda/combined) as a background job."""
+    from vizreport import build_eda_report
+
+    content = await file.read()
+    job_id = await get_job_manager().submit("eda", build_eda_report, content)
+    return {"jobId": job_id, "status": "queued"}
+
+
+# =============================================================================
+# Status endpoints
+# =============================================================================
+@router.get("/jobs")
+async def list_jobs(status: Optional[str] = None, limit: int = 50):
+    """List recent jobs, newest first."""
+    return {"jobs": await run_in_thread(get_job_manager().store.list, status=status, limit=limit)}
+
+
+@router.get("/jobs/{job_id}")
+async def job_status(job_id: str):
+    """Status, progress and stage timings of a job."""
+    job = await run_in_thread(get_job_manager().store.get, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job {job_id} not found")
+    return job
+
+
+@router.get("/jobs/{job_id}/result")
+async def job_result(job_id: str):
+    """Result of a completed job."""
+    job = await run_in_thread(get_job_manager().store.get, job_id, with_result=True)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job {job_id} not found")
+    if job["status"] == "failed":
+        raise HTTPException(status_code=500, detail=f"Job failed: {job['error']}")
+    if job["status"] != "completed":
+        raise HTTPException(status_code=409, detail=f"Job is {job['status']}")
+    return job["result"]
+
+
+@router.post("/jobs/{job_id}/cancel")
+async def cancel_job(job_id: str):
+    """Cancel a queued or running job."""
+    manager = get_job_manager()
+    job = await run_in_thread(manager.store.get, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job {job_id} not found")
+    if job["status"] in FINISHED_STATUSES or not await manager.cancel(job_id):
+        return {"jobId": job_id, "status": job["status"], "cancelled": False}
+    return {"jobId": job_id, "status": "cancelling", "cancelled": True}
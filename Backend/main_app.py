@@ -7,8 +7,14 @@ import sys
 
 
 # Import the routers
+import jobs
 import method_handler
 import preprocess
+import response_cache
+import telemetry
+import workers
+
+logger = telemetry.get_logger("main")
 
 # Create the main FastAPI app
 app = FastAPI(title="Breath Analysis Platform API")
@@ -22,8 +28,13 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Request metrics, X-Request-ID and GET /metrics
+telemetry.instrument(app)
+
 # Include the routers
 app.include_router(method_handler.router)
+app.include_router(jobs.router)
+app.include_router(response_cache.router)
 
 # Mount vizreport endpoints
 from vizreport import app as viz_app
@@ -50,8 +61,15 @@ async def preprocess_endpoint(request: Request):
 # Add startup event to initialize
 @app.on_event("startup")
 async def startup_event():
-    print(f"API server started. Custom methods directory: {method_handler.CUSTOM_METHOD_DIR}")
+    logger.info("API server started. Custom methods directory: %s", method_handler.CUSTOM_METHOD_DIR)
     # Count existing methods
     if os.path.exists(method_handler.CUSTOM_METHOD_DIR):
         method_files = [f for f in os.listdir(method_handler.CUSTOM_METHOD_DIR) if f.endswith('.py')]
-        print(f"Found {len(method_files)} existing custom methods")
+        logger.info("Found %s existing custom methods", len(method_files))
+    # Jobs that were still queued or running when the server stopped cannot resume
+    jobs.recover_jobs()
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    # Stop the worker pools used by the CPU-bound endpoints
+    workers.shutdown_pools()
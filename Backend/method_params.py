@@ -4,6 +4,10 @@ from fastapi.responses import JSONResponse
 import json
 import os
 
+from telemetry import get_logger
+
+logger = get_logger("method_params")
+
 app = FastAPI()
 app.add_middleware(
     CORSMiddleware,
@@ -26,18 +30,18 @@ async def get_method_params(method_name: str):
     
     metadata_path = os.path.join(CUSTOM_METHOD_DIR, method_name.replace('.py', '_metadata.json'))
     
-    print(f"Looking for metadata file: {metadata_path}")
+    logger.debug("Looking for metadata file: %s", metadata_path)
     
     if not os.path.exists(metadata_path):
-        print(f"Metadata file not found: {metadata_path}")
+        logger.debug("Metadata file not found: %s", metadata_path)
         return {"parameters": []}
     
     try:
         with open(metadata_path, 'r') as f:
             metadata = json.load(f)
             params = metadata.get("parameters", [])
-            print(f"Loaded parameters for {method_name}: {params}")
+            logger.debug("Loaded %s parameters for %s", len(params), method_name)
             return {"parameters": params}
     except Exception as e:
-        print(f"Error reading metadata for {method_name}: {str(e)}")
+        logger.warning("Error reading metadata for %s: %s", method_name, e)
         return {"error": f"Failed to read metadata: {str(e)}"}
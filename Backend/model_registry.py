@@ -0,0 +1,327 @@
+"""
+Registry of trained supervised models for batch prediction.
+
+Every supervised run of /classification stores its fitted model together with the
+``StandardScaler`` and the feature columns it was trained on, under a model ID
+returned as ``modelId``. Each model is a directory in MODEL_REGISTRY_DIR holding:
+
+- ``model.joblib``: the model, scaler, feature list and classes,
+- ``meta.json``: model type, target, metrics, training size, file size, library
+  versions and whether the model is pinned.
+
+Every ``save_model`` removes the least recently used models (trained or used by
+``/predict``) beyond MODEL_REGISTRY_MAX_MODELS and, when MODEL_REGISTRY_MAX_AGE_DAYS is
+set, those unused for longer than that; 0 disables either limit. Pinned models are
+never removed automatically.
+
+Models are loaded from disk on first use and kept in an in-process LRU
+(MODEL_REGISTRY_CACHE_SIZE models, MODEL_REGISTRY_CACHE_MB by ``model.joblib`` size),
+so any server process can predict with a model trained in another one:
+
+- ``GET /models`` lists stored models, ``GET /models/{model_id}`` returns metadata,
+  ``DELETE /models/{model_id}`` removes one, ``POST /models/{model_id}/pin`` pins or
+  unpins one,
+- ``POST /predict`` scores a feature batch (JSON records, or a ``.npy`` matrix with
+  the columns in the model's feature order) without retraining.
+"""
+import io
+import json
+import os
+import re
+import shutil
+import tempfile
+import time
+import uuid
+from typing import Any, Dict, List
+
+import joblib
+import numpy as np
+import pandas as pd
+import sklearn
+from fastapi import APIRouter, File, Form, HTTPException, UploadFile
+
+from preprocess_pipeline import StepCache
+from telemetry import get_logger, register_collector
+from workers import run_in_thread
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+MODEL_REGISTRY_DIR = os.environ.get("MODEL_REGISTRY_DIR", os.path.join(BACKEND_DIR, ".models"))
+MODEL_REGISTRY_CACHE_SIZE = int(os.environ.get("MODEL_REGISTRY_CACHE_SIZE", "8"))
+MODEL_REGISTRY_CACHE_MB = float(os.environ.get("MODEL_REGISTRY_CACHE_MB", "512"))
+MODEL_REGISTRY_MAX_MODELS = int(os.environ.get("MODEL_REGISTRY_MAX_MODELS", "50"))
+MODEL_REGISTRY_MAX_AGE_DAYS = float(os.environ.get("MODEL_REGISTRY_MAX_AGE_DAYS", "0"))
+
+NPY_MAGIC = b"\x93NUMPY"
+
+router = APIRouter()
+logger = get_logger("models")
+
+_loaded = StepCache(MODEL_REGISTRY_CACHE_SIZE, max_bytes=int(MODEL_REGISTRY_CACHE_MB * 2 ** 20))
+
+
+@register_collector
+def _model_cache_metrics():
+    with _loaded.lock:
+        hits, misses, entries = _loaded.hits, _loaded.misses, len(_loaded.entries)
+    return [
+        ("backend_model_cache_lookups_total", "counter", "Model registry lookups served from memory or disk.",
+         [({"result": "hit"}, hits), ({"result": "miss"}, misses)]),
+        ("backend_model_cache_entries", "gauge", "Trained models held in memory.",
+         [({}, entries)]),
+    ]
+
+
+def save_model(model, scaler, features: List[str], metadata: Dict[str, Any]) -> str:
+    """
+    Persist a fitted model with its scaler and feature columns.
+
+    Parameters:
+    -----------
+    model : estimator
+        Fitted scikit-learn classifier.
+    scaler : StandardScaler
+        Scaler fitted on the training features.
+    features : list
+        Feature columns in the order the model expects them.
+    metadata : dict
+        Extra metadata (model type, target, metrics, ...) stored in ``meta.json``.
+
+    Returns:
+    --------
+    str
+        The new model ID.
+    """
+    model_id = uuid.uuid4().hex
+    classes = getattr(model, "classes_", None)
+    meta = {
+        **metadata,
+        "modelId": model_id,
+        "features": list(features),
+        "classes": None if classes is None else np.asarray(classes).tolist(),
+        "createdAt": time.time(),
+        "sklearnVersion": sklearn.__version__,
+        "pinned": False,
+    }
+    os.makedirs(MODEL_REGISTRY_DIR, exist_ok=True)
+    # Written to a temporary directory first so readers never see a partial model
+    staging = tempfile.mkdtemp(prefix=".staging-", dir=MODEL_REGISTRY_DIR)
+    try:
+        joblib.dump(
+            {"model": model, "scaler": scaler, "features": list(features)},
+            os.path.join(staging, "model.joblib"),
+        )
+        meta["sizeBytes"] = os.path.getsize(os.path.join(staging, "model.joblib"))
+        with open(os.path.join(staging, "meta.json"), "w") as f:
+            json.dump(meta, f, default=str)
+        os.replace(staging, _model_dir(model_id))
+    except BaseException:
+        shutil.rmtree(staging, ignore_errors=True)
+        raise
+    logger.info("Stored %s model %s trained on %s features", meta.get("modelType"), model_id, len(features))
+    _prune(keep=model_id)
+    return model_id
+
+
+def load_model(model_id: str) -> Dict[str, Any]:
+    """Model, scaler, feature list and metadata of a stored model (cached in memory)."""
+    entry = _loaded.get(model_id)
+    if entry is not None:
+        return entry
+    directory = _model_dir(model_id)
+    if not os.path.isdir(directory):
+        raise HTTPException(status_code=404, detail=f"Model '{model_id}' not found")
+    path = os.path.join(directory, "model.joblib")
+    entry = joblib.load(path)
+    entry["meta"] = _read_meta(model_id)
+    trained_with = entry["meta"].get("sklearnVersion")
+    if trained_with and trained_with != sklearn.__version__:
+        logger.warning("Model %s was trained with scikit-learn %s, running %s", model_id, trained_with, sklearn.__version__)
+    # The pickle size tracks the model's arrays (e.g. forest trees), which the generic
+    # estimate does not reach
+    _loaded.put(model_id, entry, size=os.path.getsize(path))
+    return entry
+
+
+def predict(model_id: str, content: bytes) -> Dict[str, Any]:
+    """
+    Score a feature batch with a stored model.
+
+    Parameters:
+    -----------
+    model_id : str
+        ID returned by the supervised /classification run.
+    content : bytes
+        JSON records (a list, or an object with a 'features' list) containing at least
+        the model's feature columns, or a ``.npy`` matrix with exactly those columns.
+
+    Returns:
+    --------
+    dict
+        'modelId', 'predictions' and, for models that support it, 'probabilities'
+        (one row per sample, columns ordered as 'classes').
+    """
+    entry = load_model(model_id)
+    features = entry["features"]
+    X = _feature_matrix(content, features)
+    try:
+        X_scaled = entry["scaler"].transform(X)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid feature values: {e}")
+    _touch(model_id)
+    model = entry["model"]
+    result = {
+        "modelId": model_id,
+        "numSamples": len(X_scaled),
+        "predictions": np.asarray(model.predict(X_scaled)).tolist(),
+    }
+    if hasattr(model, "predict_proba"):
+        result["classes"] = np.asarray(model.classes_).tolist()
+        result["probabilities"] = model.predict_proba(X_scaled).round(6).tolist()
+    return result
+
+
+@router.get("/models")
+async def list_models():
+    """Metadata of all stored models, newest first."""
+    return {"models": _stored_models()}
+
+
+@router.get("/models/{model_id}")
+async def get_model(model_id: str):
+    """Metadata of one stored model."""
+    return _read_meta(model_id)
+
+
+@router.delete("/models/{model_id}")
+async def delete_model(model_id: str):
+    """Remove a stored model."""
+    directory = _model_dir(model_id)
+    if not os.path.isdir(directory):
+        raise HTTPException(status_code=404, detail=f"Model '{model_id}' not found")
+    shutil.rmtree(directory)
+    _loaded.pop(model_id)
+    return {"modelId": model_id, "deleted": True}
+
+
+@router.post("/models/{model_id}/pin")
+async def pin_model(model_id: str, pinned: bool = Form(True)):
+    """Pin a model so registry pruning never removes it (``pinned=false`` unpins it)."""
+    meta = _read_meta(model_id)
+    meta["pinned"] = pinned
+    await run_in_thread(_write_meta, model_id, meta)
+    # Loaded copies carry the old metadata
+    _loaded.pop(model_id)
+    return {"modelId": model_id, "pinned": pinned}
+
+
+@router.post("/predict")
+async def predict_batch(model_id: str = Form(...), features: UploadFile = File(...)):
+    """Score uploaded features with a stored model (see ``predict``)."""
+    content = await features.read()
+    # Runs on a thread so the loaded models are shared by all requests of this process
+    return await run_in_thread(predict, model_id, content)
+
+
+# =============================================================================
+# Internals
+# =============================================================================
+def _model_dir(model_id):
+    if not re.fullmatch(r"[0-9a-f]{32}", model_id or ""):
+        raise HTTPException(status_code=400, detail="Invalid model ID")
+    return os.path.join(MODEL_REGISTRY_DIR, model_id)
+
+
+def _stored_models():
+    models = []
+    if os.path.isdir(MODEL_REGISTRY_DIR):
+        for model_id in os.listdir(MODEL_REGISTRY_DIR):
+            if re.fullmatch(r"[0-9a-f]{32}", model_id):
+                meta = _read_meta(model_id, missing_ok=True)
+                if meta:
+                    try:
+                        meta["lastUsedAt"] = os.path.getmtime(_model_dir(model_id))
+                    except OSError:
+                        continue
+                    models.append(meta)
+    models.sort(key=lambda m: m.get("createdAt", 0), reverse=True)
+    return models
+
+
+def _touch(model_id):
+    # The model directory's mtime records its last use, without rewriting meta.json
+    try:
+        os.utime(_model_dir(model_id))
+    except OSError:
+        pass
+
+
+def _prune(keep=None):
+    """Remove unpinned models beyond MODEL_REGISTRY_MAX_MODELS or MODEL_REGISTRY_MAX_AGE_DAYS, least recently used first."""
+    if MODEL_REGISTRY_MAX_MODELS <= 0 and MODEL_REGISTRY_MAX_AGE_DAYS <= 0:
+        return
+    cutoff = time.time() - MODEL_REGISTRY_MAX_AGE_DAYS * 86400
+    models = sorted(_stored_models(), key=lambda m: m["lastUsedAt"], reverse=True)
+    # Pinned models do not count against the limit
+    unpinned = [meta for meta in models if not meta.get("pinned")]
+    for position, meta in enumerate(unpinned):
+        model_id = meta["modelId"]
+        too_many = 0 < MODEL_REGISTRY_MAX_MODELS <= position
+        too_old = MODEL_REGISTRY_MAX_AGE_DAYS > 0 and meta["lastUsedAt"] < cutoff
+        if model_id != keep and (too_many or too_old):
+            shutil.rmtree(_model_dir(model_id), ignore_errors=True)
+            _loaded.pop(model_id)
+            logger.info("Pruned model %s from the registry", model_id)
+
+
+def _read_meta(model_id, missing_ok=False):
+    try:
+        with open(os.path.join(_model_dir(model_id), "meta.json")) as f:
+            return json.load(f)
+    except (OSError, json.JSONDecodeError):
+        if missing_ok:
+            return None
+        raise HTTPException(status_code=404, detail=f"Model '{model_id}' not found")
+
+
+def _write_meta(model_id, meta):
+    directory = _model_dir(model_id)
+    descriptor, path = tempfile.mkstemp(prefix=".meta-", dir=directory)
+    try:
+        with os.fdopen(descriptor, "w") as f:
+            json.dump({k: v for k, v in meta.items() if k != "lastUsedAt"}, f, default=str)
+        os.replace(path, os.path.join(directory, "meta.json"))
+    except BaseException:
+        if os.path.exists(path):
+            os.remove(path)
+        raise
+
+
+def _feature_matrix(content, features):
+    if content.startswith(NPY_MAGIC):
+        try:
+            X = np.load(io.BytesIO(content), allow_pickle=False)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=f"Invalid .npy upload: {e}")
+        if X.ndim != 2 or X.shape[1] != len(features):
+            raise HTTPException(
+                status_code=400,
+                detail=f"Expected a 2-D array with {len(features)} columns ({', '.join(features)}), got shape {X.shape}",
+            )
+        return pd.DataFrame(X.astype(float, copy=False), columns=features)
+
+    try:
+        payload = json.loads(content.decode("utf-8"))
+    except (UnicodeDecodeError, json.JSONDecodeError):
+        raise HTTPException(status_code=400, detail="Features must be JSON records or a .npy array")
+    if isinstance(payload, dict):
+        payload = payload.get("features", payload.get("selectedFeatures"))
+    if not isinstance(payload, list) or not payload:
+        raise HTTPException(status_code=400, detail="No feature records in the upload")
+    df = pd.DataFrame(payload)
+    missing = [c for c in features if c not in df.columns]
+    if missing:
+        raise HTTPException(status_code=400, detail=f"Missing feature columns: {missing}")
+    try:
+        return df[features].astype(float)
+    except (TypeError, ValueError) as e:
+        raise HTTPException(status_code=400, detail=f"Feature columns must be numeric: {e}")
@@ -0,0 +1,484 @@
+"""
+Cross-validation and hyperparameter search for the supervised models.
+
+``cross_validate`` scores a model with stratified k-fold cross-validation. With
+``tune=True`` it first picks the hyperparameters by successive halving over the
+model's grid in SEARCH_GRIDS: every candidate is scored on all folds with a small
+share of the training rows, the best 1/HALVING_FACTOR continue with HALVING_FACTOR
+times more rows, and so on until the survivor uses the full folds. Poor
+configurations are dropped after the cheap rounds instead of being trained on all
+rows.
+
+Each (configuration, fold, rows) fit is a separate task on the worker process pool.
+The feature matrix is written once to ``.npy`` files (see ``write_dataset``) that
+the workers memory-map, and fold scores are cached by dataset fingerprint, so
+repeating a search or changing the fold count of another model only fits what is new.
+
+``permutation_importance`` measures, for any stored model, how much the weighted F1
+drops when one feature column is shuffled. The columns are split into batches that
+run as separate worker tasks, each column is shuffled ``n_repeats`` times for a mean
+and standard deviation, and at most PERMUTATION_MAX_ROWS rows are scored.
+``cross_validate(..., importance_repeats=n)`` does the same out of fold: on the full
+folds each fold model, right after it is scored, shuffles the columns of its own
+held-out rows, so the importances never come from training rows and no model is
+fitted twice.
+"""
+import asyncio
+import hashlib
+import itertools
+import json
+import math
+import os
+import shutil
+import tempfile
+import time
+from typing import Any, Dict, List
+
+import numpy as np
+import pandas as pd
+from sklearn.calibration import CalibratedClassifierCV
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.kernel_approximation import Nystroem
+from sklearn.linear_model import LogisticRegression, SGDClassifier
+from sklearn.metrics import accuracy_score, f1_score, precision_score, recall_score
+from sklearn.model_selection import StratifiedKFold
+from sklearn.pipeline import Pipeline, make_pipeline
+from sklearn.preprocessing import StandardScaler
+from sklearn.svm import SVC, LinearSVC
+
+import model_registry
+from preprocess_pipeline import StepCache
+from telemetry import get_logger, register_collector
+from workers import PROCESS_WORKERS, run_in_process
+
+CV_FOLDS = 5
+HALVING_FACTOR = 3
+# Training rows per fold in the first halving round (never less than this)
+MIN_RESOURCE_ROWS = 200
+# Metric the search ranks configurations by
+SELECTION_METRIC = "f1_score"
+METRICS = ("accuracy", "precision", "recall", "f1_score")
+FOLD_CACHE_SIZE = int(os.environ.get("CLASSIFICATION_FOLD_CACHE_SIZE", "4096"))
+
+# SVM solvers: 'exact' is SVC (O(n^2) memory, O(n^2)-O(n^3) time); the approximate ones
+# map the features with a Nystroem RBF kernel approximation and fit a linear SVM
+SVM_SOLVERS = ("auto", "exact", "nystroem", "sgd")
+# 'auto' uses the exact SVC up to this many training rows ...
+SVM_EXACT_MAX_ROWS = int(os.environ.get("CLASSIFICATION_SVM_EXACT_ROWS", "10000"))
+# ... Nystroem + LinearSVC up to this many, and Nystroem + SGD (hinge loss) above
+SVM_SGD_MIN_ROWS = int(os.environ.get("CLASSIFICATION_SVM_SGD_ROWS", "50000"))
+SVM_NYSTROEM_COMPONENTS = int(os.environ.get("CLASSIFICATION_SVM_COMPONENTS", "500"))
+
+PERMUTATION_REPEATS = 5
+MAX_PERMUTATION_REPEATS = 50
+# Rows scored per permutation; larger splits are subsampled
+PERMUTATION_MAX_ROWS = int(os.environ.get("CLASSIFICATION_PERMUTATION_ROWS", "10000"))
+
+SEARCH_GRIDS = {
+    "random_forest": {
+        "n_estimators": [100, 300],
+        "max_depth": [None, 10, 20],
+        "min_samples_leaf": [1, 5],
+    },
+    "svm": {
+        "C": [0.1, 1.0, 10.0],
+        "gamma": ["scale", 0.01, 0.1],
+    },
+    "logistic_regression": {
+        "C": [0.01, 0.1, 1.0, 10.0],
+    },
+}
+SEARCH_GRIDS["logistic"] = SEARCH_GRIDS["logistic_regression"]
+
+logger = get_logger("classification.search")
+
+_fold_cache = StepCache(FOLD_CACHE_SIZE)
+
+
+@register_collector
+def _fold_cache_metrics():
+    with _fold_cache.lock:
+        hits, misses, entries = _fold_cache.hits, _fold_cache.misses, len(_fold_cache.entries)
+    return [
+        ("backend_cv_fold_cache_lookups_total", "counter", "Cross-validation fold score cache lookups.",
+         [({"result": "hit"}, hits), ({"result": "miss"}, misses)]),
+        ("backend_cv_fold_cache_entries", "gauge", "Fold scores held in memory.",
+         [({}, entries)]),
+    ]
+
+
+def build_model(model_type: str, params: Dict[str, Any] = None, calibrate: bool = False,
+                svm_solver: str = "exact", n_rows: int = None):
+    """
+    Unfitted classifier for a supervised model type with the given hyperparameters.
+
+    Parameters:
+    -----------
+    calibrate : bool
+        Give SVMs calibrated probabilities (sigmoid calibration on 3 folds); the other
+        models always predict probabilities.
+    svm_solver : str
+        One of SVM_SOLVERS; 'auto' picks by ``n_rows`` (see ``resolve_svm_solver``).
+    n_rows : int
+        Number of training rows.
+    """
+    params = params or {}
+    if model_type == "svm":
+        solver = resolve_svm_solver(svm_solver, n_rows)
+        if solver == "exact":
+            model = SVC(kernel="rbf", random_state=42, **params)
+        else:
+            C = params.get("C", 1.0)
+            gamma = params.get("gamma", "scale")
+            # On standardized features gamma='scale' is 1 / n_features, Nystroem's default
+            feature_map = Nystroem(
+                kernel="rbf", gamma=None if gamma == "scale" else gamma,
+                # More landmarks than training rows adds no information, only cost
+                n_components=min(SVM_NYSTROEM_COMPONENTS, n_rows or SVM_NYSTROEM_COMPONENTS),
+                random_state=42,
+            )
+            if solver == "sgd":
+                # Same objective as LinearSVC's C for n training rows
+                linear = SGDClassifier(loss="hinge", alpha=1.0 / (C * max(n_rows or 1, 1)), random_state=42)
+            else:
+                linear = LinearSVC(C=C, dual="auto", random_state=42)
+            model = make_pipeline(feature_map, linear)
+        if calibrate:
+            model = CalibratedClassifierCV(model, method="sigmoid", cv=3, ensemble=False)
+        return model
+    if model_type in ("logistic_regression", "logistic"):
+        return LogisticRegression(max_iter=1000, random_state=42, **params)
+    return RandomForestClassifier(random_state=42, **{"n_estimators": 100, **params})
+
+
+def resolve_svm_solver(svm_solver: str = "auto", n_rows: int = None) -> str:
+    """The SVM solver used for ``n_rows`` training rows ('exact', 'nystroem' or 'sgd')."""
+    svm_solver = (svm_solver or "auto").lower()
+    if svm_solver not in SVM_SOLVERS:
+        raise ValueError(f"Unknown SVM solver '{svm_solver}', use one of {list(SVM_SOLVERS)}")
+    if svm_solver != "auto":
+        return svm_solver
+    if n_rows is None or n_rows <= SVM_EXACT_MAX_ROWS:
+        return "exact"
+    return "nystroem" if n_rows <= SVM_SGD_MIN_ROWS else "sgd"
+
+
+def solver_name(model) -> str:
+    """Short description of a built model, e.g. 'svc' or 'nystroem+linearsvc (calibrated)'."""
+    if isinstance(model, CalibratedClassifierCV):
+        return f"{solver_name(model.estimator)} (calibrated)"
+    if isinstance(model, Pipeline):
+        return "+".join(name for name, _ in model.steps)
+    return type(model).__name__.lower()
+
+
+def write_dataset(X: np.ndarray, y_codes: np.ndarray) -> Dict[str, Any]:
+    """
+    Write a feature matrix and integer class codes for the fold workers.
+
+    Returns:
+    --------
+    dict
+        'directory' (remove it with ``remove_dataset``), 'fingerprint' (content hash
+        used in the fold cache keys) and 'numRows'.
+    """
+    X = np.ascontiguousarray(X, dtype=np.float64)
+    y_codes = np.ascontiguousarray(y_codes, dtype=np.int64)
+    directory = tempfile.mkdtemp(prefix="cv-data-")
+    np.save(os.path.join(directory, "X.npy"), X)
+    np.save(os.path.join(directory, "y.npy"), y_codes)
+    digest = hashlib.sha256()
+    digest.update(str(X.shape).encode())
+    digest.update(X.tobytes())
+    digest.update(y_codes.tobytes())
+    return {"directory": directory, "fingerprint": digest.hexdigest(), "numRows": len(X)}
+
+
+def remove_dataset(dataset: Dict[str, Any]):
+    shutil.rmtree(dataset["directory"], ignore_errors=True)
+
+
+async def cross_validate(dataset: Dict[str, Any], model_type: str, n_folds: int = CV_FOLDS,
+                         tune: bool = False, svm_solver: str = "auto", features: List[str] = None,
+                         importance_repeats: int = 0) -> Dict[str, Any]:
+    """
+    Stratified k-fold cross-validation, optionally after a successive-halving search.
+
+    Parameters:
+    -----------
+    dataset : dict
+        Written by ``write_dataset``.
+    model_type : str
+        'random_forest', 'svm' or 'logistic_regression'.
+    n_folds : int
+        Number of folds (lowered to the size of the smallest class when needed).
+    tune : bool
+        Search SEARCH_GRIDS[model_type] instead of using the default hyperparameters.
+    svm_solver : str
+        SVM solver; 'auto' is resolved once for the full training folds so every
+        round uses the same one.
+    features : list
+        Column names, used to label the permutation importances.
+    importance_repeats : int
+        With a positive value, the fits on the full folds also measure permutation
+        importance on their held-out rows (``importance_repeats`` shuffles per column).
+
+    Returns:
+    --------
+    dict
+        'folds', 'bestParams', 'metrics' ({metric: {'mean', 'std'}}) and 'foldScores'
+        of the chosen configuration, 'rounds' of the search (rows per fold and the mean
+        and std score of every candidate), the 'solver' and the number of 'fits' and
+        'cachedFits'. With ``importance_repeats``, 'permutation' holds the chosen
+        configuration's importances as ``permutation_importance`` returns them, pooled
+        over the folds, with 'folds'.
+    """
+    y = np.load(os.path.join(dataset["directory"], "y.npy"))
+    smallest_class = int(np.bincount(y).min())
+    n_folds = min(int(n_folds), smallest_class)
+    if n_folds < 2:
+        raise ValueError("Cross-validation needs at least two samples of every class")
+    # Rows in the smallest training fold
+    full_rows = dataset["numRows"] - math.ceil(dataset["numRows"] / n_folds)
+    solver = resolve_svm_solver(svm_solver, full_rows) if model_type == "svm" else None
+    importance_repeats = int(min(max(importance_repeats, 0), MAX_PERMUTATION_REPEATS))
+
+    candidates = _expand_grid(SEARCH_GRIDS.get(model_type, {})) if tune else [{}]
+    n_rounds = math.ceil(math.log(len(candidates), HALVING_FACTOR)) if len(candidates) > 1 else 0
+    counts = {"fits": 0, "cachedFits": 0}
+    rounds = []
+    for round_index in range(n_rounds + 1):
+        rows = full_rows // HALVING_FACTOR ** (n_rounds - round_index)
+        rows = min(full_rows, max(rows, MIN_RESOURCE_ROWS))
+        # Only fits on the full folds are the ones whose importances can be reported
+        repeats = importance_repeats if rows == full_rows else 0
+        scores = await asyncio.gather(*[
+            _candidate_scores(dataset, model_type, params, n_folds, rows, solver, counts, repeats)
+            for params in candidates
+        ])
+        ranked = sorted(
+            zip(candidates, scores),
+            key=lambda item: np.mean([fold[SELECTION_METRIC] for fold in item[1]]),
+            reverse=True,
+        )
+        rounds.append({
+            "rows": rows,
+            "candidates": [
+                {
+                    "params": params,
+                    "mean": float(np.mean([fold[SELECTION_METRIC] for fold in folds])),
+                    "std": float(np.std([fold[SELECTION_METRIC] for fold in folds])),
+                }
+                for params, folds in ranked
+            ],
+        })
+        logger.debug("Round %s: %s candidates on %s rows", round_index, len(candidates), rows)
+        if round_index < n_rounds:
+            keep = max(1, math.ceil(len(candidates) / HALVING_FACTOR))
+            candidates = [params for params, _ in ranked[:keep]]
+        best_params, best_folds = ranked[0]
+
+    # Later rounds always end on full folds; a search cut short by MIN_RESOURCE_ROWS may not
+    if rounds[-1]["rows"] < full_rows:
+        best_folds = await _candidate_scores(
+            dataset, model_type, best_params, n_folds, full_rows, solver, counts, importance_repeats
+        )
+    logger.info(
+        "Cross-validated %s: %s folds, %s fits (%s cached), best %s",
+        model_type, n_folds, counts["fits"], counts["cachedFits"], best_params,
+    )
+    permutation = None
+    if importance_repeats:
+        permutation = _pool_permutations([fold["permutation"] for fold in best_folds], features)
+    # Cached fits may carry importances from an earlier request
+    best_folds = [{k: v for k, v in fold.items() if k != "permutation"} for fold in best_folds]
+    result = {
+        "folds": n_folds,
+        "bestParams": best_params,
+        "metrics": {
+            name: {
+                "mean": float(np.mean([fold[name] for fold in best_folds])),
+                "std": float(np.std([fold[name] for fold in best_folds])),
+            }
+            for name in METRICS
+        },
+        "foldScores": best_folds,
+        "selectionMetric": SELECTION_METRIC,
+        "solver": solver,
+        "rounds": rounds if tune else [],
+        **counts,
+    }
+    if permutation is not None:
+        result["permutation"] = permutation
+    return result
+
+
+def fit_fold(directory: str, model_type: str, params: Dict[str, Any], fold: int, n_folds: int,
+             rows: int, svm_solver: str = None, n_repeats: int = 0) -> Dict[str, Any]:
+    """
+    Fit one configuration on ``rows`` training rows of a fold and score the held-out rows
+    (runs in a worker process). With ``n_repeats`` the result also carries
+    'permutation': score drops of every column shuffled on the held-out rows.
+    """
+    X = np.load(os.path.join(directory, "X.npy"), mmap_mode="r")
+    y = np.load(os.path.join(directory, "y.npy"))
+    folds = StratifiedKFold(n_splits=n_folds, shuffle=True, random_state=42)
+    train_idx, test_idx = list(folds.split(np.zeros(len(y)), y))[fold]
+    if rows < len(train_idx):
+        # The same subset for every configuration, so rounds compare like with like
+        train_idx = np.sort(np.random.default_rng(fold).permutation(train_idx)[:rows])
+    scaler = StandardScaler()
+    X_train = scaler.fit_transform(X[train_idx])
+    X_test = scaler.transform(X[test_idx])
+    model = build_model(model_type, params, svm_solver=svm_solver, n_rows=len(train_idx))
+    model.fit(X_train, y[train_idx])
+    y_pred = model.predict(X_test)
+    y_test = y[test_idx]
+    scores = {
+        "accuracy": float(accuracy_score(y_test, y_pred)),
+        "precision": float(precision_score(y_test, y_pred, average="weighted", zero_division=0)),
+        "recall": float(recall_score(y_test, y_pred, average="weighted", zero_division=0)),
+        "f1_score": float(f1_score(y_test, y_pred, average="weighted", zero_division=0)),
+    }
+    if n_repeats:
+        start = time.perf_counter()
+        # The folds together score at most PERMUTATION_MAX_ROWS rows
+        max_rows = math.ceil(PERMUTATION_MAX_ROWS / n_folds)
+        rows_idx = np.arange(len(test_idx))
+        if len(rows_idx) > max_rows:
+            rows_idx = np.sort(np.random.default_rng(fold).choice(len(rows_idx), max_rows, replace=False))
+        scores["permutation"] = {
+            **_permutation_drops(model, X_test[rows_idx], y_test[rows_idx], range(X_test.shape[1]), n_repeats),
+            "nRepeats": n_repeats,
+            "seconds": time.perf_counter() - start,
+        }
+    return scores
+
+
+async def permutation_importance(model_id: str, dataset: Dict[str, Any], features: List[str], classes: list,
+                                 n_repeats: int = PERMUTATION_REPEATS) -> Dict[str, Any]:
+    """
+    Permutation feature importance of a stored model.
+
+    Parameters:
+    -----------
+    model_id : str
+        Model in the model registry; its scaler is applied to the rows.
+    dataset : dict
+        Rows to score, from ``write_dataset`` (unscaled features in ``features`` order
+        and class codes into ``classes``).
+    n_repeats : int
+        Shuffles per column.
+
+    Returns:
+    --------
+    dict
+        'metric', 'baseline' score, 'nRepeats', 'numRows' scored, 'seconds' and
+        'importances': feature -> {'mean', 'std'} drop of the score when the feature is
+        shuffled (near or below zero: the model does not rely on it).
+    """
+    n_repeats = int(min(max(n_repeats, 1), MAX_PERMUTATION_REPEATS))
+    start = time.perf_counter()
+    # A few batches per worker so a slow batch does not hold up the others
+    n_batches = min(len(features), max(PROCESS_WORKERS, 1) * 2)
+    batches = [batch.tolist() for batch in np.array_split(np.arange(len(features)), n_batches)]
+    parts = await asyncio.gather(*[
+        run_in_process(score_permutations, model_id, dataset["directory"], batch, classes, n_repeats)
+        for batch in batches
+    ])
+    drops = {column: values for part in parts for column, values in part["drops"].items()}
+    return {
+        "metric": SELECTION_METRIC,
+        "baseline": parts[0]["baseline"],
+        "nRepeats": n_repeats,
+        "numRows": parts[0]["numRows"],
+        "seconds": time.perf_counter() - start,
+        "importances": {
+            features[column]: {"mean": float(np.mean(drops[column])), "std": float(np.std(drops[column]))}
+            for column in range(len(features))
+        },
+    }
+
+
+def score_permutations(model_id: str, directory: str, columns: List[int], classes: list,
+                       n_repeats: int) -> Dict[str, Any]:
+    """Score drops when each of ``columns`` is shuffled ``n_repeats`` times (runs in a worker process)."""
+    entry = model_registry.load_model(model_id)
+    X = np.load(os.path.join(directory, "X.npy"), mmap_mode="r")
+    y_codes = np.load(os.path.join(directory, "y.npy"))
+    if len(y_codes) > PERMUTATION_MAX_ROWS:
+        # Every batch scores the same rows
+        rows = np.sort(np.random.default_rng(0).choice(len(y_codes), PERMUTATION_MAX_ROWS, replace=False))
+        X, y_codes = X[rows], y_codes[rows]
+    y = np.asarray(classes)[y_codes]
+    X = entry["scaler"].transform(pd.DataFrame(np.asarray(X), columns=entry["features"]))
+    return _permutation_drops(entry["model"], X, y, columns, n_repeats)
+
+
+# =============================================================================
+# Internals
+# =============================================================================
+def _score(model, X, y):
+    return float(f1_score(y, model.predict(X), average="weighted", zero_division=0))
+
+
+def _permutation_drops(model, X, y, columns, n_repeats):
+    baseline = _score(model, X, y)
+    drops = {}
+    for column in columns:
+        original = X[:, column].copy()
+        values = []
+        for repeat in range(n_repeats):
+            # Seeded per column and repeat, so results do not depend on the batching
+            X[:, column] = original[np.random.default_rng([column, repeat]).permutation(len(original))]
+            values.append(baseline - _score(model, X, y))
+        X[:, column] = original
+        drops[column] = values
+    return {"baseline": baseline, "numRows": len(y), "drops": drops}
+
+
+def _expand_grid(grid):
+    names = sorted(grid)
+    return [dict(zip(names, values)) for values in itertools.product(*(grid[name] for name in names))]
+
+
+def _pool_permutations(parts, features):
+    # Drops of all folds and repeats pooled per column
+    n_columns = len(parts[0]["drops"])
+    features = features or [str(column) for column in range(n_columns)]
+    return {
+        "metric": SELECTION_METRIC,
+        "baseline": float(np.mean([part["baseline"] for part in parts])),
+        "nRepeats": parts[0]["nRepeats"],
+        "numRows": int(sum(part["numRows"] for part in parts)),
+        "folds": len(parts),
+        "seconds": float(sum(part["seconds"] for part in parts)),
+        "importances": {
+            features[column]: {
+                "mean": float(np.mean([value for part in parts for value in part["drops"][column]])),
+                "std": float(np.std([value for part in parts for value in part["drops"][column]])),
+            }
+            for column in range(n_columns)
+        },
+    }
+
+
+async def _candidate_scores(dataset, model_type, params, n_folds, rows, solver, counts,
+                            n_repeats=0) -> List[Dict[str, Any]]:
+    async def fold_score(fold):
+        key = json.dumps(
+            [dataset["fingerprint"], model_type, params, fold, n_folds, rows, solver], sort_keys=True, default=str
+        )
+        cached = _fold_cache.get(key)
+        # A cached fit without the requested importances is fitted again
+        if cached is not None and (not n_repeats or cached.get("permutation", {}).get("nRepeats") == n_repeats):
+            counts["cachedFits"] += 1
+            return cached
+        score = await run_in_process(
+            fit_fold, dataset["directory"], model_type, params, fold, n_folds, rows, solver, n_repeats
+        )
+        counts["fits"] += 1
+        _fold_cache.put(key, score)
+        return score
+
+    return list(await asyncio.gather(*[fold_score(fold) for fold in range(n_folds)]))
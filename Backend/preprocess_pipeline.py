@@ -0,0 +1,363 @@
+"""
+Step plan and per-step cache for the /preprocess endpoint.
+
+The request's ``operations``/``settings`` are compiled into an ordered list of steps
+(missing -> encode -> normalize -> outliers -> custom methods). Each step's output is
+cached under a key chained from the input fingerprint and the configs of that step
+and all steps before it, so changing one setting (e.g. the outlier threshold) only
+reruns that step and the ones after it.
+"""
+import hashlib
+import json
+import os
+import sys
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from custom_methods.encoding_engine import encode_frame, plan_encoding
+from custom_methods.scaler_engine import scale_frame
+from telemetry import get_logger, register_collector, span
+
+logger = get_logger("preprocess.pipeline")
+
+# Number of step outputs kept in memory (each holds a full DataFrame)
+PIPELINE_CACHE_SIZE = int(os.environ.get("PREPROCESS_CACHE_SIZE", "16"))
+# Memory budget of the step outputs, in MB
+PIPELINE_CACHE_MAX_MB = float(os.environ.get("PREPROCESS_CACHE_MAX_MB", "512"))
+
+
+class StepCache:
+    """
+    Small thread-safe LRU cache of step outputs keyed by chained step hashes.
+
+    Entries are evicted, least recently used first, once there are more than
+    ``max_entries`` or their size exceeds ``max_bytes``. Sizes are estimated with
+    ``approx_nbytes`` unless ``put`` is given one (e.g. the file size of a stored
+    model). The newest entry is always kept, so one value larger than the budget still
+    serves the request that follows it.
+    """
+
+    def __init__(self, max_entries=PIPELINE_CACHE_SIZE, max_bytes=None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.sizes = {}
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return self.entries[key]
+            self.misses += 1
+            return None
+
+    def put(self, key, value, size=None):
+        if self.max_entries <= 0:
+            return
+        if size is None:
+            size = approx_nbytes(value) if self.max_bytes is not None else 0
+        with self.lock:
+            self.bytes += size - self.sizes.get(key, 0)
+            self.sizes[key] = size
+            self.entries[key] = value
+            self.entries.move_to_end(key)
+            while len(self.entries) > 1 and (
+                len(self.entries) > self.max_entries
+                or (self.max_bytes is not None and self.bytes > self.max_bytes)
+            ):
+                evicted, _ = self.entries.popitem(last=False)
+                self.bytes -= self.sizes.pop(evicted)
+
+    def pop(self, key):
+        with self.lock:
+            self.bytes -= self.sizes.pop(key, 0)
+            return self.entries.pop(key, None)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.sizes.clear()
+            self.bytes = 0
+
+
+def approx_nbytes(value, _depth=0):
+    """
+    Estimated memory held by a cache value: the buffers of DataFrames and arrays
+    (``memory_usage(deep=False)`` / ``nbytes``) plus, a few levels deep, the items of
+    containers and the attributes of objects (models, indexes, sessions).
+    """
+    if isinstance(value, pd.DataFrame):
+        return int(value.memory_usage(index=True, deep=False).sum())
+    if isinstance(value, pd.Series):
+        return int(value.memory_usage(index=True, deep=False))
+    if isinstance(value, np.ndarray):
+        return int(value.nbytes)
+    if isinstance(value, (bytes, bytearray, str)):
+        return len(value)
+    if _depth >= 4:
+        return sys.getsizeof(value)
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(approx_nbytes(v, _depth + 1) for v in value.values())
+    if isinstance(value, (list, tuple, set, frozenset)):
+        return sys.getsizeof(value) + sum(approx_nbytes(v, _depth + 1) for v in value)
+    if hasattr(value, "__dict__"):
+        return sys.getsizeof(value) + approx_nbytes(vars(value), _depth + 1)
+    return sys.getsizeof(value)
+
+
+step_cache = StepCache(max_bytes=int(PIPELINE_CACHE_MAX_MB * 2 ** 20))
+
+
+@register_collector
+def _step_cache_metrics():
+    with step_cache.lock:
+        hits, misses, entries = step_cache.hits, step_cache.misses, len(step_cache.entries)
+        size = step_cache.bytes
+    lookups = hits + misses
+    return [
+        ("backend_preprocess_step_cache_lookups_total", "counter", "Preprocess step cache lookups.",
+         [({"result": "hit"}, hits), ({"result": "miss"}, misses)]),
+        ("backend_preprocess_step_cache_hit_ratio", "gauge", "Share of preprocess steps served from the cache.",
+         [({}, hits / lookups if lookups else 0.0)]),
+        ("backend_preprocess_step_cache_entries", "gauge", "Step outputs held in memory.",
+         [({}, entries)]),
+        ("backend_preprocess_step_cache_bytes", "gauge", "Estimated memory held by cached step outputs.",
+         [({}, size)]),
+    ]
+
+
+def frame_fingerprint(df):
+    """Content hash of a DataFrame (values, index, column names and dtypes)."""
+    digest = hashlib.sha256()
+    digest.update(json.dumps([str(c) for c in df.columns]).encode())
+    digest.update(json.dumps([str(t) for t in df.dtypes]).encode())
+    digest.update(pd.util.hash_pandas_object(df, index=True).to_numpy().tobytes())
+    return digest.hexdigest()
+
+
+def compile_plan(operations, settings, custom_method_dir):
+    """
+    Turn the request config into an ordered list of (step, config) pairs.
+
+    Only the settings a step actually reads go into its config, so unrelated setting
+    changes do not invalidate it.
+    """
+    plan = []
+    if "missing" in operations:
+        plan.append(("missing", {"strategy": settings.get("missingValues", "mean")}))
+
+    if "encode" in operations:
+        # Handle encoding methods - can be string or list
+        encoding_method = settings.get("encodingMethod", "onehot")
+        if isinstance(encoding_method, str):
+            encoding_methods = [encoding_method]
+        elif isinstance(encoding_method, list):
+            encoding_methods = encoding_method
+        else:
+            encoding_methods = ["onehot"]  # Default fallback
+        plan.append(("encode", {"methods": encoding_methods}))
+
+    if "normalize" in operations:
+        plan.append(("normalize", {
+            "method": settings.get("normalizationMethod", "minmax"),
+            "params": settings.get("normalizationParams") or None,
+        }))
+
+    if "outliers" in operations:
+        plan.append(("outliers", {"threshold": settings.get("outlierThreshold", 1.5)}))
+
+    for method_name in settings.get("customMethods", []):
+        method_file = os.path.join(custom_method_dir, f"{method_name}")
+        if not method_file.endswith('.py'):
+            method_file += '.py'
+        plan.append(("custom", {
+            "method": method_name,
+            "file": method_file,
+            "params": settings.get(f"{method_name}_params", {}),
+            # Re-uploading a method must invalidate its cached output
+            "mtime": os.path.getmtime(method_file) if os.path.exists(method_file) else None,
+        }))
+    return plan
+
+
+def run_pipeline(df, plan, fingerprint, artifacts, cache=step_cache):
+    """
+    Run a compiled plan, reusing cached step outputs.
+
+    Parameters:
+    -----------
+    df : pandas.DataFrame
+        Input data (after column selection). Not modified.
+    plan : list
+        Output of :func:`compile_plan`.
+    fingerprint : str
+        Fingerprint of ``df``, e.g. from :func:`frame_fingerprint`.
+    artifacts : dict
+        Initial artifacts (``featureNameMapping``); steps add ``encodingDetails`` and
+        ``normalizationParams``.
+    cache : StepCache
+        Cache of step outputs.
+
+    Returns:
+    --------
+    tuple
+        (df, artifacts, executed) where ``executed`` lists the steps that were
+        actually computed rather than taken from the cache.
+    """
+    key = fingerprint
+    state = {"df": df, "artifacts": artifacts}
+    executed = []
+    for name, config in plan:
+        key = hashlib.sha256(
+            f"{key}|{name}|{json.dumps(config, sort_keys=True, default=str)}".encode()
+        ).hexdigest()
+        cached = cache.get(key)
+        if cached is not None:
+            logger.debug("Step '%s' reused from cache", name)
+            state = cached
+            continue
+
+        step_artifacts = dict(state["artifacts"])
+        stage = f"custom:{config['method']}" if name == "custom" else name
+        with span("preprocess", stage):
+            step_df = STEPS[name](state["df"], config, step_artifacts)
+        # Step outputs are shared through the cache and must not be modified afterwards
+        state = {"df": step_df, "artifacts": step_artifacts}
+        cache.put(key, state)
+        executed.append(name)
+    return state["df"], dict(state["artifacts"]), executed
+
+
+# =============================================================================
+# Steps
+# =============================================================================
+def _step_missing(df, config, artifacts):
+    # Handle missing values (before encoding)
+    df = df.copy()
+    numeric_cols = df.select_dtypes(include=["number"]).columns.tolist()
+    cat_cols = df.select_dtypes(include=["object", "category"]).columns.tolist()
+    strategy = config["strategy"]
+    if strategy == "mean":
+        df[numeric_cols] = df[numeric_cols].fillna(df[numeric_cols].mean())
+        for col in cat_cols:
+            if len(df[col].dropna()) > 0:
+                df[col] = df[col].fillna(df[col].mode().iloc[0])
+    elif strategy == "median":
+        df[numeric_cols] = df[numeric_cols].fillna(df[numeric_cols].median())
+        for col in cat_cols:
+            if len(df[col].dropna()) > 0:
+                df[col] = df[col].fillna(df[col].mode().iloc[0])
+    elif strategy == "mode":
+        for col in df.columns:
+            if len(df[col].dropna()) > 0:
+                df[col] = df[col].fillna(df[col].mode().iloc[0])
+    elif strategy == "remove":
+        df = df.dropna()
+    logger.debug("Handled missing values successfully")
+    return df
+
+
+def _step_encode(df, config, artifacts):
+    # Encode categorical variables
+    cat_cols = df.select_dtypes(include=["object", "category"]).columns.tolist()
+    encoding_methods = config["methods"]
+    logger.debug("Encoding categorical variables with %s columns: %s", len(cat_cols), cat_cols)
+    logger.debug("Normalized encoding methods: %s", encoding_methods)
+
+    # Profile every categorical column once and decide its encoding; only the
+    # chosen encoding is computed and one-hot blocks stay sparse
+    encoding_plan, encoding_profiles = plan_encoding(df, cat_cols, encoding_methods)
+    artifacts["encodingDetails"] = {}
+    if not encoding_plan:
+        return df
+
+    logger.debug("Encoding decisions: %s", encoding_plan)
+    if len(encoding_methods) == 2:
+        # Per-column choice keeps numeric columns, then one-hot blocks, then label columns
+        passthrough = df.select_dtypes(include=["number"]).columns.tolist()
+    else:
+        passthrough = None
+    df, encoding_details, encoded_columns = encode_frame(
+        df, encoding_plan, encoding_profiles, passthrough=passthrough
+    )
+    logger.debug("DataFrame shape after encoding: %s", df.shape)
+
+    # Update feature name mapping based on actual encoding decisions
+    feature_name_mapping = dict(artifacts["featureNameMapping"])
+    for col, new_cols in encoded_columns.items():
+        if encoding_plan[col] == "label" and len(encoding_methods) == 1:
+            feature_name_mapping[col] = [f"{col}_label_encoded"]
+        else:
+            feature_name_mapping[col] = new_cols
+    artifacts["featureNameMapping"] = feature_name_mapping
+    artifacts["encodingDetails"] = encoding_details
+    return df
+
+
+def _step_normalize(df, config, artifacts):
+    # Normalize numeric features (after encoding)
+    df = df.copy()
+    method = config["method"]
+    numeric_cols = df.select_dtypes(include=["number"]).columns.tolist()
+    logger.debug("Normalizing %s numeric columns with method: %s", len(numeric_cols), method)
+    try:
+        # Reuse scaler parameters fitted on an earlier batch instead of refitting
+        fitted_params = config["params"]
+        if fitted_params:
+            logger.debug("Applying fitted %s scaler to %s columns", fitted_params.get('method'), len(fitted_params.get('columns', [])))
+        normalization_params = scale_frame(df, params=fitted_params, method=method, columns=numeric_cols)
+        if normalization_params["skipped"]:
+            logger.warning("Cannot normalize columns with zero spread: %s", normalization_params['skipped'][:10])
+        artifacts["normalizationParams"] = normalization_params
+    except Exception as e:
+        logger.error("Error during normalization: %s", e)
+    logger.debug("Normalized numeric features successfully")
+    return df
+
+
+def _step_outliers(df, config, artifacts):
+    # Handle outliers (after all transformations)
+    numeric_cols = df.select_dtypes(include=["number"]).columns.tolist()
+    one_hot_cols = [col for col in numeric_cols if df[col].nunique() <= 2 and df[col].isin([0, 1]).all()]
+    outlier_cols = [col for col in numeric_cols if col not in one_hot_cols]
+    threshold = config["threshold"]
+    Q1 = df[outlier_cols].quantile(0.25)
+    Q3 = df[outlier_cols].quantile(0.75)
+    IQR = Q3 - Q1
+    mask = ~((df[outlier_cols] < (Q1 - threshold * IQR)) | (df[outlier_cols] > (Q3 + threshold * IQR))).any(axis=1)
+    logger.debug("Handled outliers successfully")
+    return df[mask]
+
+
+def _step_custom(df, config, artifacts):
+    # Apply a custom preprocessing method (e.g. filters)
+    from method_handler import MethodLoader
+
+    method_name = config["method"]
+    try:
+        method_func = MethodLoader.load_method(config["file"])
+        if method_func:
+            logger.debug("Applying custom method: %s with params: %s", method_name, config['params'])
+            # Methods may modify their input; the cached frame of the previous step must stay intact
+            return method_func(df.copy(), config["params"])
+        logger.warning("Failed to load custom method: %s", method_name)
+    except Exception as e:
+        logger.error("Error applying custom method %s: %s", method_name, str(e))
+    return df
+
+
+STEPS = {
+    "missing": _step_missing,
+    "encode": _step_encode,
+    "normalize": _step_normalize,
+    "outliers": _step_outliers,
+    "custom": _step_custom,
+}
@@ -0,0 +1,303 @@
+"""
+On-demand profiling of single requests.
+
+An admin adds ``X-Profile: cprofile`` (or ``sample``) to any request, or the
+``_profile=cprofile`` query parameter, together with ``X-Admin-Token``. Every call
+that request makes into the worker pools (``workers.run_in_process`` /
+``run_in_thread``, where the pandas/sklearn work happens) then runs under a profiler
+with ``tracemalloc`` tracing its peak memory:
+
+- ``cprofile`` writes a pstats file (open with ``python -m pstats`` or snakeviz),
+- ``sample`` samples the worker's stack every BACKEND_PROFILE_SAMPLE_INTERVAL seconds
+  and writes collapsed stacks (the input format of flamegraph.pl / speedscope).
+
+Results are stored under BACKEND_PROFILE_DIR keyed by request ID; the response carries
+``X-Profile-Id`` and ``GET /profiles/{request_id}`` returns the summary. Profiled
+requests bypass the response cache, and profiled calls in one process run one at a
+time, so timings are inflated but attributable.
+
+Profiling is disabled unless BACKEND_ADMIN_TOKEN is set.
+"""
+import contextvars
+import cProfile
+import hmac
+import io
+import json
+import os
+import pstats
+import re
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from urllib.parse import parse_qs
+
+from fastapi import APIRouter, Depends, HTTPException, Request
+from fastapi.responses import FileResponse, JSONResponse
+
+import telemetry
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+PROFILE_DIR = os.environ.get("BACKEND_PROFILE_DIR", os.path.join(BACKEND_DIR, ".profiles"))
+ADMIN_TOKEN = os.environ.get("BACKEND_ADMIN_TOKEN", "")
+SAMPLE_INTERVAL = float(os.environ.get("BACKEND_PROFILE_SAMPLE_INTERVAL", "0.005"))
+PROFILE_MODES = ("cprofile", "sample")
+# Number of functions listed in the text summary of a cProfile run
+TOP_FUNCTIONS = 30
+
+# Profiling mode of the request being handled (None when not profiled)
+active_profile = contextvars.ContextVar("active_profile", default=None)
+
+router = APIRouter()
+logger = telemetry.get_logger("profiling")
+
+# tracemalloc and the sampler are process-wide, so profiled calls do not overlap
+_profile_lock = threading.Lock()
+_call_counter = 0
+
+
+def is_admin(token) -> bool:
+    """True when ``token`` matches BACKEND_ADMIN_TOKEN (always False if it is unset)."""
+    return bool(ADMIN_TOKEN) and bool(token) and hmac.compare_digest(str(token), ADMIN_TOKEN)
+
+
+def require_admin(request: Request):
+    """FastAPI dependency restricting an endpoint to admins."""
+    if not is_admin(request.headers.get("x-admin-token")):
+        raise HTTPException(status_code=403, detail="Admin token required")
+
+
+def profile_call(request_id: str, mode: str, func, *args, **kwargs):
+    """
+    Run ``func(*args, **kwargs)`` under the profiler and store the result.
+
+    Parameters:
+    -----------
+    request_id : str
+        Request the call belongs to; results go to ``PROFILE_DIR/<request_id>/``.
+    mode : str
+        'cprofile' or 'sample'.
+    func : callable
+        Function to run; its return value is returned and exceptions propagate.
+    """
+    global _call_counter
+    with _profile_lock:
+        _call_counter += 1
+        name = f"{_call_counter:03d}-{os.getpid()}-{func.__name__}"
+        started_tracing = not tracemalloc.is_tracing()
+        if started_tracing:
+            tracemalloc.start()
+        tracemalloc.reset_peak()
+        profiler = _StackSampler(threading.get_ident()) if mode == "sample" else cProfile.Profile()
+        error = None
+        start = time.perf_counter()
+        profiler.enable()
+        try:
+            return func(*args, **kwargs)
+        except BaseException as e:
+            error = repr(e)
+            raise
+        finally:
+            profiler.disable()
+            elapsed = time.perf_counter() - start
+            peak = tracemalloc.get_traced_memory()[1]
+            if started_tracing:
+                tracemalloc.stop()
+            try:
+                _store_call(request_id, name, mode, func, profiler, elapsed, peak, error)
+            except OSError as e:
+                logger.warning("Could not store profile %s/%s: %s", request_id, name, e)
+
+
+class ProfilingMiddleware:
+    """
+    ASGI middleware that turns on profiling for requests asking for it.
+
+    Must run inside ``telemetry.MetricsMiddleware`` so the request ID is known.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or "backend.profile" in scope:
+            await self.app(scope, receive, send)
+            return
+        headers = dict(scope.get("headers") or [])
+        mode = headers.get(b"x-profile", b"").decode("latin-1").strip().lower()
+        if not mode:
+            query = parse_qs(scope.get("query_string", b"").decode("latin-1"))
+            mode = (query.get("_profile") or [""])[0].strip().lower()
+        scope["backend.profile"] = mode
+        if not mode:
+            await self.app(scope, receive, send)
+            return
+
+        if mode in ("1", "true", "yes"):
+            mode = "cprofile"
+        if mode not in PROFILE_MODES:
+            await _send_json(send, 400, {"detail": f"Unknown profile mode '{mode}', use one of {list(PROFILE_MODES)}"})
+            return
+        if not is_admin(headers.get(b"x-admin-token", b"").decode("latin-1")):
+            await _send_json(send, 403, {"detail": "Profiling requires an admin token"})
+            return
+
+        request_id = telemetry.request_id_var.get()
+        status = {"code": 500}
+
+        async def send_with_id(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+                message["headers"] = list(message.get("headers", [])) + [(b"x-profile-id", request_id.encode("latin-1"))]
+            await send(message)
+
+        token = active_profile.set(mode)
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_id)
+        finally:
+            active_profile.reset(token)
+            summary = {
+                "requestId": request_id,
+                "method": scope.get("method"),
+                "path": scope.get("path"),
+                "mode": mode,
+                "status": status["code"],
+                "wallSeconds": time.perf_counter() - start,
+                "createdAt": time.time(),
+            }
+            try:
+                _write_json(os.path.join(_request_dir(request_id), "summary.json"), summary)
+            except OSError as e:
+                logger.warning("Could not store profile summary %s: %s", request_id, e)
+            logger.info("Profiled %s %s as %s (%s)", scope.get("method"), scope.get("path"), request_id, mode)
+
+
+@router.get("/profiles", dependencies=[Depends(require_admin)])
+async def list_profiles():
+    """Stored profiles, newest first."""
+    profiles = []
+    if os.path.isdir(PROFILE_DIR):
+        for request_id in os.listdir(PROFILE_DIR):
+            summary = _read_json(os.path.join(PROFILE_DIR, request_id, "summary.json"))
+            if summary:
+                profiles.append(summary)
+    profiles.sort(key=lambda p: p.get("createdAt", 0), reverse=True)
+    return {"profiles": profiles}
+
+
+@router.get("/profiles/{request_id}", dependencies=[Depends(require_admin)])
+async def get_profile(request_id: str):
+    """Summary of one profiled request with the peak memory and top functions of each call."""
+    directory = _request_dir(request_id)
+    summary = _read_json(os.path.join(directory, "summary.json"))
+    if summary is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    calls = []
+    for name in sorted(os.listdir(directory)):
+        if name.endswith(".call.json"):
+            calls.append(_read_json(os.path.join(directory, name)))
+    summary["calls"] = [call for call in calls if call]
+    summary["peakMemoryBytes"] = max((c["peakMemoryBytes"] for c in summary["calls"]), default=0)
+    return JSONResponse(content=summary)
+
+
+@router.get("/profiles/{request_id}/{filename}", dependencies=[Depends(require_admin)])
+async def download_profile_file(request_id: str, filename: str):
+    """Download a stored pstats (.prof) or collapsed stack (.collapsed) file."""
+    if not re.fullmatch(r"[\w.-]+\.(prof|collapsed)", filename):
+        raise HTTPException(status_code=400, detail="Invalid profile file name")
+    path = os.path.join(_request_dir(request_id), filename)
+    if not os.path.exists(path):
+        raise HTTPException(status_code=404, detail="Profile file not found")
+    return FileResponse(path, filename=f"{request_id}-{filename}")
+
+
+# =============================================================================
+# Internals
+# =============================================================================
+class _StackSampler:
+    """Samples one thread's stack from a background thread; stacks are kept collapsed."""
+
+    def __init__(self, thread_id, interval=SAMPLE_INTERVAL):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def enable(self):
+        self._thread = threading.Thread(target=self._run, name="profile-sampler", daemon=True)
+        self._thread.start()
+
+    def disable(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}:{frame.f_lineno}")
+                frame = frame.f_back
+            if stack:
+                self.stacks[";".join(reversed(stack))] += 1
+
+
+def _store_call(request_id, name, mode, func, profiler, elapsed, peak, error):
+    directory = _request_dir(request_id)
+    os.makedirs(directory, exist_ok=True)
+    entry = {
+        "call": f"{func.__module__}.{func.__name__}",
+        "pid": os.getpid(),
+        "mode": mode,
+        "seconds": elapsed,
+        "peakMemoryBytes": peak,
+        "error": error,
+    }
+    if mode == "sample":
+        entry["file"] = f"{name}.collapsed"
+        entry["samples"] = sum(profiler.stacks.values())
+        with open(os.path.join(directory, entry["file"]), "w") as f:
+            for stack, count in profiler.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+    else:
+        entry["file"] = f"{name}.prof"
+        profiler.dump_stats(os.path.join(directory, entry["file"]))
+        text = io.StringIO()
+        pstats.Stats(profiler, stream=text).sort_stats("cumulative").print_stats(TOP_FUNCTIONS)
+        entry["top"] = text.getvalue()
+    _write_json(os.path.join(directory, f"{name}.call.json"), entry)
+
+
+def _request_dir(request_id):
+    if not re.fullmatch(r"[\w-]+", request_id or ""):
+        raise HTTPException(status_code=400, detail="Invalid request ID")
+    return os.path.join(PROFILE_DIR, request_id)
+
+
+def _write_json(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as f:
+        json.dump(data, f, default=str)
+
+
+def _read_json(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, json.JSONDecodeError):
+        return None
+
+
+async def _send_json(send, status_code, content):
+    body = json.dumps(content).encode()
+    await send({
+        "type": "http.response.start",
+        "status": status_code,
+        "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())],
+    })
+    await send({"type": "http.response.body", "body": body})
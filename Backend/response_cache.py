@@ -0,0 +1,310 @@
+"""
+Content-addressed cache for the JSON responses of deterministic endpoints.
+
+Responses of /preprocess, /extraction, /evaluation and the /viz plots are keyed by a
+hash of the request content (upload bytes or body) plus the normalized config, the
+state of the custom methods directory and a hash of the backend sources, so a deploy
+never serves responses computed by the previous code. Entries live in two tiers:
+
+- an in-process LRU bounded by entry count and bytes, and
+- an on-disk directory shared by all uvicorn workers, evicted oldest-first once it
+  exceeds its size budget. Endpoints read and write it on the thread pool
+  (``cached_response``), never on the event loop.
+
+Every cached endpoint answers with an ``ETag`` equal to the key; a request carrying
+that value in ``If-None-Match`` gets ``304 Not Modified`` without any work, and
+``GET /cache/{key}`` returns a stored response directly.
+
+Settings: RESPONSE_CACHE_DIR, RESPONSE_CACHE_MAX_BYTES (disk),
+RESPONSE_CACHE_MEMORY_BYTES, RESPONSE_CACHE_ENTRIES (0 disables the cache).
+"""
+import hashlib
+import json
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from typing import Optional
+
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, Response
+
+from profiling import active_profile
+from telemetry import register_collector, span
+from workers import run_in_thread
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+CUSTOM_METHODS_DIR = os.path.join(BACKEND_DIR, "custom_methods")
+
+RESPONSE_CACHE_DIR = os.environ.get("RESPONSE_CACHE_DIR", os.path.join(BACKEND_DIR, ".response_cache"))
+RESPONSE_CACHE_MAX_BYTES = int(os.environ.get("RESPONSE_CACHE_MAX_BYTES", str(1024 * 1024 * 1024)))
+RESPONSE_CACHE_MEMORY_BYTES = int(os.environ.get("RESPONSE_CACHE_MEMORY_BYTES", str(256 * 1024 * 1024)))
+RESPONSE_CACHE_ENTRIES = int(os.environ.get("RESPONSE_CACHE_ENTRIES", "32"))
+# Puts between full scans of the disk tier; in between its size is tracked by this process
+DISK_SCAN_EVERY = 64
+
+router = APIRouter()
+
+
+class ResponseCache:
+    """Two-tier (memory LRU + shared disk directory) store of response bodies."""
+
+    def __init__(
+        self,
+        directory: str = RESPONSE_CACHE_DIR,
+        max_disk_bytes: int = RESPONSE_CACHE_MAX_BYTES,
+        max_memory_bytes: int = RESPONSE_CACHE_MEMORY_BYTES,
+        max_entries: int = RESPONSE_CACHE_ENTRIES,
+    ):
+        self.directory = directory
+        self.max_disk_bytes = max_disk_bytes
+        self.max_memory_bytes = max_memory_bytes
+        self.max_entries = max_entries
+        self.memory = OrderedDict()
+        self.memory_bytes = 0
+        # Disk tier size as of the last scan plus what this process wrote since
+        self.disk_bytes = None
+        self.puts_since_scan = 0
+        self.lock = threading.Lock()
+        self.stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "not_modified": 0}
+        if self.enabled:
+            os.makedirs(directory, exist_ok=True)
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0
+
+    def get(self, key: str) -> Optional[bytes]:
+        if not self.enabled:
+            return None
+        body = self.get_memory(key)
+        return body if body is not None else self.get_disk(key)
+
+    async def get_async(self, key: str) -> Optional[bytes]:
+        """``get`` with the disk tier read on the thread pool."""
+        if not self.enabled:
+            return None
+        body = self.get_memory(key)
+        return body if body is not None else await run_in_thread(self.get_disk, key)
+
+    def get_memory(self, key: str) -> Optional[bytes]:
+        with self.lock:
+            body = self.memory.get(key)
+            if body is not None:
+                self.memory.move_to_end(key)
+                self.stats["memory_hits"] += 1
+            return body
+
+    def get_disk(self, key: str) -> Optional[bytes]:
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                body = f.read()
+            # Refresh the mtime so disk eviction is least-recently-used
+            os.utime(path)
+        except FileNotFoundError:
+            with self.lock:
+                self.stats["misses"] += 1
+            return None
+        with self.lock:
+            self.stats["disk_hits"] += 1
+        self._remember(key, body)
+        return body
+
+    def put(self, key: str, body: bytes) -> None:
+        if not self.enabled:
+            return
+        self._remember(key, body)
+        # Write atomically so other workers never read a partial file
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            f.write(body)
+        os.replace(tmp_path, self._path(key))
+        with self.lock:
+            self.puts_since_scan += 1
+            if self.disk_bytes is not None:
+                self.disk_bytes += len(body)
+            scan = (
+                self.disk_bytes is None
+                or self.disk_bytes > self.max_disk_bytes
+                or self.puts_since_scan >= DISK_SCAN_EVERY
+            )
+        if scan:
+            self._evict_disk()
+
+    def clear(self) -> None:
+        with self.lock:
+            self.memory.clear()
+            self.memory_bytes = 0
+            self.disk_bytes = None
+        for name in os.listdir(self.directory):
+            if name.endswith(".json"):
+                try:
+                    os.remove(os.path.join(self.directory, name))
+                except FileNotFoundError:
+                    pass
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.json")
+
+    def _remember(self, key: str, body: bytes) -> None:
+        if len(body) > self.max_memory_bytes:
+            return
+        with self.lock:
+            if key in self.memory:
+                self.memory_bytes -= len(self.memory.pop(key))
+            self.memory[key] = body
+            self.memory_bytes += len(body)
+            while self.memory and (
+                len(self.memory) > self.max_entries or self.memory_bytes > self.max_memory_bytes
+            ):
+                _, evicted = self.memory.popitem(last=False)
+                self.memory_bytes -= len(evicted)
+
+    def _evict_disk(self) -> None:
+        entries = []
+        total = 0
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith(".json"):
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+                total += stat.st_size
+        if total > self.max_disk_bytes:
+            for _, size, path in sorted(entries):
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+                total -= size
+                if total <= self.max_disk_bytes:
+                    break
+        with self.lock:
+            self.disk_bytes = total
+            self.puts_since_scan = 0
+
+
+response_cache = ResponseCache()
+
+
+@register_collector
+def _response_cache_metrics():
+    with response_cache.lock:
+        stats = dict(response_cache.stats)
+        entries, memory_bytes = len(response_cache.memory), response_cache.memory_bytes
+    hits = stats["memory_hits"] + stats["disk_hits"] + stats["not_modified"]
+    lookups = hits + stats["misses"]
+    return [
+        ("backend_response_cache_lookups_total", "counter", "Response cache lookups by outcome.",
+         [({"result": result}, value) for result, value in sorted(stats.items())]),
+        ("backend_response_cache_hit_ratio", "gauge", "Share of cacheable requests answered without recomputing.",
+         [({}, hits / lookups if lookups else 0.0)]),
+        ("backend_response_cache_memory_entries", "gauge", "Responses held in the in-memory tier.",
+         [({}, entries)]),
+        ("backend_response_cache_memory_bytes", "gauge", "Bytes held in the in-memory tier.",
+         [({}, memory_bytes)]),
+    ]
+
+
+def normalize_config(config) -> str:
+    """Canonical JSON for a config given as a JSON string or object."""
+    if isinstance(config, (str, bytes)):
+        try:
+            config = json.loads(config)
+        except (json.JSONDecodeError, UnicodeDecodeError):
+            return config.decode("utf-8", "replace") if isinstance(config, bytes) else config
+    return json.dumps(config, sort_keys=True, default=str)
+
+
+def custom_methods_version() -> str:
+    """Changes whenever a custom method is added, removed or re-uploaded."""
+    try:
+        stamps = sorted(
+            (entry.name, entry.stat().st_mtime_ns)
+            for entry in os.scandir(CUSTOM_METHODS_DIR)
+            if entry.name.endswith(".py")
+        )
+    except FileNotFoundError:
+        return ""
+    return hashlib.blake2b(repr(stamps).encode(), digest_size=8).hexdigest()
+
+
+def backend_code_version() -> str:
+    """Hash of the backend modules' sources; changes with every deploy that edits them."""
+    digest = hashlib.blake2b(digest_size=8)
+    for name in sorted(os.listdir(BACKEND_DIR)):
+        if name.endswith(".py"):
+            with open(os.path.join(BACKEND_DIR, name), "rb") as f:
+                digest.update(name.encode())
+                digest.update(f.read())
+    return digest.hexdigest()
+
+
+# Computed once: the sources do not change under a running process
+BACKEND_CODE_VERSION = backend_code_version()
+
+
+def cache_key(namespace: str, *parts) -> str:
+    """Hash of an endpoint name and its request parts (bytes or strings)."""
+    digest = hashlib.blake2b(digest_size=20)
+    digest.update(namespace.encode())
+    digest.update(BACKEND_CODE_VERSION.encode())
+    digest.update(custom_methods_version().encode())
+    for part in parts:
+        data = part if isinstance(part, bytes) else str(part).encode()
+        # Length prefix keeps ("ab", "c") and ("a", "bc") apart
+        digest.update(len(data).to_bytes(8, "little"))
+        digest.update(data)
+    return digest.hexdigest()
+
+
+async def cached_response(request: Optional[Request], key: str, compute, endpoint: str = "response") -> Response:
+    """
+    Serve ``key`` from the cache, or await ``compute()`` and cache a successful result.
+
+    ``compute`` returns a dict, a Response or None; only non-empty 200 responses
+    without an "error" field are stored. ``endpoint`` names the metrics span of the
+    JSON serialization.
+    """
+    etag = f'"{key}"'
+    # A profiled request must do the work it is meant to measure
+    profiled = active_profile.get() is not None
+    body = None if profiled else await response_cache.get_async(key)
+    if body is not None:
+        # 304 only for a stored entry: after eviction (or with the cache disabled) the
+        # client's copy cannot be vouched for, so the response is computed again
+        if request is not None and etag in request.headers.get("if-none-match", ""):
+            with response_cache.lock:
+                response_cache.stats["not_modified"] += 1
+            return Response(status_code=304, headers={"ETag": etag})
+        return Response(content=body, media_type="application/json", headers={"ETag": etag, "X-Cache": "hit"})
+
+    result = await compute()
+    if isinstance(result, Response):
+        response = result
+    else:
+        with span(endpoint, "serialize"):
+            response = JSONResponse(content=jsonable_encoder(result))
+    cacheable = result is not None and not (isinstance(result, dict) and result.get("error"))
+    if response.status_code == 200 and cacheable:
+        await run_in_thread(response_cache.put, key, bytes(response.body))
+        response.headers["ETag"] = etag
+    response.headers["X-Cache"] = "miss"
+    return response
+
+
+@router.get("/cache/{key}")
+async def get_cached_response(key: str, request: Request):
+    """Return a stored response by its ETag, honouring If-None-Match."""
+    if not key.isalnum():
+        raise HTTPException(status_code=400, detail="Invalid cache key")
+    etag = f'"{key}"'
+    body = await response_cache.get_async(key)
+    if body is None:
+        raise HTTPException(status_code=404, detail="Response not cached")
+    if etag in request.headers.get("if-none-match", ""):
+        return Response(status_code=304, headers={"ETag": etag})
+    return Response(content=body, media_type="application/json", headers={"ETag": etag})
@@ -0,0 +1,526 @@
+"""
+Similarity search over extracted feature matrices ("find windows/sessions like this one").
+
+A feature table (JSON records or a ``.npy`` matrix) is indexed once and then queried
+many times:
+
+- ``POST /similar/indexes`` standardizes the numeric feature columns (the
+  ``StandardScaler`` is fitted on this first table and kept fixed afterwards, so all
+  distances live in one space) and builds an IVF index: k-means centroids split the
+  rows into about ``IVF_LISTS_FACTOR * sqrt(n)`` inverted lists,
+- ``POST /similar`` returns the top-k neighbours of query rows (or of a stored item,
+  by ID) with their Euclidean distances in the standardized space. Only the ``nprobe``
+  lists whose centroids are nearest to the query are scanned, so a query compares
+  against a small fraction of the items instead of all of them; raise ``nprobe`` for
+  better recall,
+- ``POST /similar/indexes/{index_id}/items`` inserts new rows into the existing lists
+  without retraining the centroids,
+- ``GET`` / ``DELETE /similar/indexes/{index_id}`` and ``GET /similar/indexes``.
+
+Each index is a directory in SIMILARITY_INDEX_DIR with ``meta.json``, the centroids
+and one ``.npz`` chunk per build or insert, so an insert only writes the new rows. In
+memory the vectors and lists live in buffers with spare capacity, so an insert copies
+only the new rows (plus an occasional doubling), not the whole index.
+Loaded indexes are kept in an in-process LRU (SIMILARITY_CACHE_SIZE indexes).
+"""
+import io
+import json
+import os
+import re
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+from fastapi import APIRouter, File, Form, HTTPException, UploadFile
+from sklearn.cluster import MiniBatchKMeans
+
+from model_registry import NPY_MAGIC
+from preprocess_pipeline import StepCache
+from telemetry import get_logger
+from workers import run_in_thread
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+SIMILARITY_INDEX_DIR = os.environ.get("SIMILARITY_INDEX_DIR", os.path.join(BACKEND_DIR, ".similarity"))
+# Indexes kept loaded in memory
+SIMILARITY_CACHE_SIZE = int(os.environ.get("SIMILARITY_CACHE_SIZE", "4"))
+SIMILARITY_CACHE_MB = float(os.environ.get("SIMILARITY_CACHE_MB", "1024"))
+# Inverted lists scanned per query unless the request sets nprobe
+SIMILARITY_NPROBE = int(os.environ.get("SIMILARITY_NPROBE", "8"))
+
+# Inverted lists per index: IVF_LISTS_FACTOR * sqrt(rows at build time)
+IVF_LISTS_FACTOR = 4
+# Rows sampled to train the centroids
+IVF_TRAIN_ROWS = 100000
+DEFAULT_K = 10
+MAX_K = 1000
+
+router = APIRouter()
+logger = get_logger("similarity")
+
+_indexes = StepCache(SIMILARITY_CACHE_SIZE, max_bytes=int(SIMILARITY_CACHE_MB * 2 ** 20))
+
+
+class SimilarityIndex:
+    """Standardized feature vectors grouped into inverted lists around k-means centroids."""
+
+    def __init__(self, index_id: str, features: List[str], id_column: Optional[str],
+                 mean: np.ndarray, scale: np.ndarray, centroids: np.ndarray):
+        self.index_id = index_id
+        self.features = features
+        self.id_column = id_column
+        self.mean = mean
+        self.scale = scale
+        self.centroids = centroids.astype(np.float32)
+        self._vectors = _Buffer(np.float32, len(features))
+        self._norms = _Buffer(np.float32)
+        self._assignments = _Buffer(np.int32)
+        self._ids = _Buffer(str)
+        # Positions of the vectors in each inverted list
+        self._lists = [_Buffer(np.int64) for _ in range(len(centroids))]
+        self.chunks = []
+        self.created = time.time()
+        self.updated = self.created
+        self.lock = threading.Lock()
+
+    @property
+    def vectors(self) -> np.ndarray:
+        return self._vectors.view
+
+    @property
+    def norms(self) -> np.ndarray:
+        return self._norms.view
+
+    @property
+    def assignments(self) -> np.ndarray:
+        return self._assignments.view
+
+    @property
+    def ids(self) -> np.ndarray:
+        return self._ids.view
+
+    @property
+    def lists(self) -> List[np.ndarray]:
+        return [positions.view for positions in self._lists]
+
+    @classmethod
+    def build(cls, df: pd.DataFrame, id_column: Optional[str] = None, n_lists: Optional[int] = None) -> "SimilarityIndex":
+        """Fit the scaler and the centroids on a feature table and index its rows."""
+        if id_column and id_column not in df.columns:
+            raise HTTPException(status_code=400, detail=f"ID column '{id_column}' not found")
+        features = [c for c in df.select_dtypes(include=[np.number]).columns if c != id_column]
+        if not features:
+            raise HTTPException(status_code=400, detail="No numeric feature columns to index")
+        X = _matrix(df, features)
+        mean = X.mean(axis=0)
+        scale = X.std(axis=0)
+        scale[scale == 0] = 1.0
+        X_scaled = (X - mean) / scale
+
+        if n_lists is None:
+            n_lists = int(IVF_LISTS_FACTOR * np.sqrt(len(X)))
+        n_lists = int(min(max(n_lists, 1), len(X)))
+        rng = np.random.default_rng(0)
+        train = X_scaled if len(X) <= IVF_TRAIN_ROWS else X_scaled[rng.choice(len(X), IVF_TRAIN_ROWS, replace=False)]
+        quantizer = MiniBatchKMeans(
+            n_clusters=n_lists, batch_size=4096, n_init=1, random_state=0
+        ).fit(train)
+
+        index = cls(uuid.uuid4().hex, features, id_column, mean, scale, quantizer.cluster_centers_)
+        index._append(X_scaled, _item_ids(df, id_column, 0))
+        return index
+
+    def add(self, df: pd.DataFrame) -> int:
+        """Insert rows into the nearest existing lists; returns the number of rows added."""
+        if self.id_column and self.id_column not in df.columns:
+            raise HTTPException(status_code=400, detail=f"Missing ID column '{self.id_column}'")
+        X_scaled = self.transform(df)
+        with self.lock:
+            self._append(X_scaled, _item_ids(df, self.id_column, len(self.ids)))
+            self.updated = time.time()
+        return len(X_scaled)
+
+    def transform(self, df: pd.DataFrame) -> np.ndarray:
+        """Feature columns of a table in the index's standardized space."""
+        missing = [c for c in self.features if c not in df.columns]
+        if missing:
+            raise HTTPException(status_code=400, detail=f"Missing feature columns: {missing}")
+        return (_matrix(df, self.features) - self.mean) / self.scale
+
+    def search(self, queries: np.ndarray, k: int, nprobe: int,
+               exclude: Optional[List[int]] = None) -> List[Dict[str, Any]]:
+        """
+        Approximate top-k neighbours of standardized query rows.
+
+        Parameters:
+        -----------
+        queries : numpy.ndarray
+            (m, d) query vectors in the standardized space.
+        k : int
+            Neighbours per query.
+        nprobe : int
+            Inverted lists scanned per query, nearest centroids first.
+        exclude : list, optional
+            Per query, an item position left out of the results (the item itself when
+            querying by item ID).
+
+        Returns:
+        --------
+        list
+            Per query, {'neighbors': [{'id', 'distance'}, ...] nearest first, 'scanned'}.
+        """
+        queries = np.asarray(queries, dtype=np.float32)
+        nprobe = min(max(nprobe, 1), len(self.centroids))
+        results = []
+        with self.lock:
+            centroid_d2 = _squared_distances(queries, self.centroids, (self.centroids ** 2).sum(axis=1))
+            probes = np.argpartition(centroid_d2, nprobe - 1, axis=1)[:, :nprobe]
+            for i, q in enumerate(queries):
+                candidates = np.concatenate([self._lists[c].view for c in probes[i]])
+                if exclude is not None and exclude[i] is not None:
+                    candidates = candidates[candidates != exclude[i]]
+                d2 = _squared_distances(q[None, :], self.vectors[candidates], self.norms[candidates])[0]
+                top = min(k, len(candidates))
+                nearest = np.argpartition(d2, top - 1)[:top] if top else np.empty(0, dtype=np.int64)
+                nearest = nearest[np.argsort(d2[nearest], kind="stable")]
+                results.append({
+                    "neighbors": [
+                        {"id": str(self.ids[candidates[j]]), "distance": round(float(np.sqrt(d2[j])), 6)}
+                        for j in nearest
+                    ],
+                    "scanned": int(len(candidates)),
+                })
+        return results
+
+    def position(self, item_id: str) -> int:
+        """Position of a stored item."""
+        matches = np.flatnonzero(self.ids == str(item_id))
+        if not len(matches):
+            raise HTTPException(status_code=404, detail=f"Item '{item_id}' not found in index {self.index_id}")
+        return int(matches[0])
+
+    def status(self) -> Dict[str, Any]:
+        sizes = np.array([len(positions) for positions in self.lists])
+        return {
+            "indexId": self.index_id,
+            "features": self.features,
+            "idColumn": self.id_column,
+            "numItems": int(len(self.ids)),
+            "numLists": int(len(self.lists)),
+            "largestList": int(sizes.max()) if len(sizes) else 0,
+            "chunks": len(self.chunks),
+            "createdAt": self.created,
+            "updatedAt": self.updated,
+        }
+
+    def save(self):
+        """Write rows not yet on disk as a new chunk, then the metadata (atomically)."""
+        with self.lock:
+            stored = sum(chunk["rows"] for chunk in self.chunks)
+            directory = _index_dir(self.index_id)
+            if not os.path.isdir(directory):
+                # First save: the whole directory is staged so readers never see a partial index
+                os.makedirs(SIMILARITY_INDEX_DIR, exist_ok=True)
+                staging = tempfile.mkdtemp(prefix=".staging-", dir=SIMILARITY_INDEX_DIR)
+                try:
+                    np.save(os.path.join(staging, "centroids.npy"), self.centroids)
+                    self._write_chunk(staging, stored)
+                    self._write_meta(staging)
+                    os.replace(staging, directory)
+                except BaseException:
+                    shutil.rmtree(staging, ignore_errors=True)
+                    raise
+            elif stored < len(self.ids):
+                self._write_chunk(directory, stored)
+                self._write_meta(directory)
+
+    @classmethod
+    def load(cls, index_id: str) -> "SimilarityIndex":
+        """Index from the in-memory cache, or from its directory."""
+        index = _indexes.get(index_id)
+        if index is not None:
+            return index
+        meta = _read_meta(index_id)
+        directory = _index_dir(index_id)
+        index = cls(
+            index_id, meta["features"], meta["idColumn"], np.asarray(meta["mean"]), np.asarray(meta["scale"]),
+            np.load(os.path.join(directory, "centroids.npy")),
+        )
+        parts = {"vectors": [], "ids": [], "assignments": []}
+        for chunk in meta["chunks"]:
+            with np.load(os.path.join(directory, chunk["file"]), allow_pickle=False) as data:
+                for name, values in parts.items():
+                    values.append(data[name])
+        if meta["chunks"]:
+            # One append for all chunks: every list is filled in a single pass
+            index._append(*(np.concatenate(parts[name]) for name in ("vectors", "ids", "assignments")))
+        index.chunks = meta["chunks"]
+        index.created = meta["createdAt"]
+        index.updated = meta["updatedAt"]
+        _indexes.put(index_id, index)
+        return index
+
+    def _append(self, X_scaled, ids, assignments=None):
+        X_scaled = np.asarray(X_scaled, dtype=np.float32)
+        norms = (X_scaled ** 2).sum(axis=1)
+        if assignments is None:
+            assignments = np.empty(len(X_scaled), dtype=np.int32)
+            centroid_norms = (self.centroids ** 2).sum(axis=1)
+            # Assigned in blocks to bound the size of the distance matrix
+            for start in range(0, len(X_scaled), 8192):
+                block = X_scaled[start:start + 8192]
+                assignments[start:start + 8192] = _squared_distances(block, self.centroids, centroid_norms).argmin(axis=1)
+        offset = len(self.ids)
+        order = np.argsort(assignments, kind="stable")
+        bounds = np.searchsorted(assignments[order], np.arange(len(self.centroids) + 1))
+        for c in np.flatnonzero(np.diff(bounds)):
+            self._lists[c].append(offset + order[bounds[c]:bounds[c + 1]])
+        self._vectors.append(X_scaled)
+        self._norms.append(norms)
+        self._assignments.append(assignments)
+        self._ids.append(np.asarray(ids, dtype=str))
+
+    def _write_chunk(self, directory, start):
+        name = f"chunk-{len(self.chunks):05d}.npz"
+        tmp = os.path.join(directory, f".{name}.tmp")
+        with open(tmp, "wb") as f:
+            np.savez(f, vectors=self.vectors[start:], ids=self.ids[start:], assignments=self.assignments[start:])
+        os.replace(tmp, os.path.join(directory, name))
+        self.chunks.append({"file": name, "rows": int(len(self.ids) - start)})
+
+    def _write_meta(self, directory):
+        meta = {
+            **self.status(),
+            "mean": self.mean.tolist(),
+            "scale": self.scale.tolist(),
+            "chunks": self.chunks,
+        }
+        tmp = os.path.join(directory, ".meta.json.tmp")
+        with open(tmp, "w") as f:
+            json.dump(meta, f)
+        os.replace(tmp, os.path.join(directory, "meta.json"))
+
+
+class _Buffer:
+    """Growable array: appends write into spare capacity, which doubles when it runs out."""
+
+    def __init__(self, dtype, width=None):
+        self.data = np.empty((0,) if width is None else (0, width), dtype=dtype)
+        self.size = 0
+
+    @property
+    def view(self) -> np.ndarray:
+        return self.data[:self.size]
+
+    def append(self, values):
+        values = np.asarray(values)
+        dtype = self.data.dtype
+        if dtype.kind == "U" and values.dtype.itemsize > dtype.itemsize:
+            # Longer strings than stored so far widen the ID buffer
+            dtype = values.dtype
+        needed = self.size + len(values)
+        if needed > len(self.data) or dtype != self.data.dtype:
+            grown = np.empty((max(needed, 2 * len(self.data), 16),) + self.data.shape[1:], dtype=dtype)
+            grown[:self.size] = self.data[:self.size]
+            self.data = grown
+        self.data[self.size:needed] = values
+        self.size = needed
+
+
+def build_index(content: bytes, id_column: Optional[str] = None, n_lists: Optional[int] = None) -> Dict[str, Any]:
+    """Build and store an index over an uploaded feature table."""
+    start = time.perf_counter()
+    index = SimilarityIndex.build(_read_table(content), id_column or None, n_lists)
+    index.save()
+    _indexes.put(index.index_id, index)
+    logger.info("Built similarity index %s: %s items in %s lists", index.index_id, len(index.ids), len(index.lists))
+    return {**index.status(), "buildSeconds": round(time.perf_counter() - start, 3)}
+
+
+def add_items(index_id: str, content: bytes) -> Dict[str, Any]:
+    """Insert the rows of an uploaded feature table into a stored index."""
+    index = SimilarityIndex.load(index_id)
+    added = index.add(_read_table(content, index.features))
+    index.save()
+    # Stored again so the cache accounts for the grown index
+    _indexes.put(index_id, index)
+    return {**index.status(), "added": added}
+
+
+def find_similar(index_id: str, content: Optional[bytes] = None, item_id: Optional[str] = None,
+                 k: int = DEFAULT_K, nprobe: Optional[int] = None) -> Dict[str, Any]:
+    """
+    Top-k neighbours of query rows, or of a stored item, in a stored index.
+
+    Parameters:
+    -----------
+    index_id : str
+        Index returned by ``POST /similar/indexes``.
+    content : bytes, optional
+        Query rows as JSON records with the index's feature columns, or a ``.npy``
+        matrix with those columns in order.
+    item_id : str, optional
+        Query with a stored item instead; the item itself is left out of the results.
+    k : int
+        Neighbours per query (at most MAX_K).
+    nprobe : int, optional
+        Inverted lists scanned per query (default SIMILARITY_NPROBE).
+
+    Returns:
+    --------
+    dict
+        'indexId', 'k', 'nprobe' and 'results': per query row, the 'neighbors'
+        ({'id', 'distance'}, nearest first) and the number of items 'scanned'.
+    """
+    if not 1 <= k <= MAX_K:
+        raise HTTPException(status_code=400, detail=f"k must be between 1 and {MAX_K}")
+    index = SimilarityIndex.load(index_id)
+    nprobe = nprobe or SIMILARITY_NPROBE
+    if item_id is not None:
+        position = index.position(item_id)
+        queries = index.vectors[position:position + 1]
+        exclude = [position]
+    elif content:
+        queries = index.transform(_read_table(content, index.features))
+        exclude = None
+    else:
+        raise HTTPException(status_code=400, detail="Send query rows or an item_id")
+    results = index.search(queries, k, nprobe, exclude)
+    return {
+        "indexId": index_id,
+        "k": k,
+        "nprobe": min(nprobe, len(index.lists)),
+        "numItems": int(len(index.ids)),
+        "results": results,
+    }
+
+
+@router.post("/similar/indexes")
+async def create_index(
+    features: UploadFile = File(...),
+    id_column: Optional[str] = Form(None),
+    n_lists: Optional[int] = Form(None)
+):
+    """Index a feature table for similarity search (see ``SimilarityIndex.build``)."""
+    content = await features.read()
+    # Indexes stay loaded in this process, so the work runs on a thread
+    return await run_in_thread(build_index, content, id_column, n_lists)
+
+
+@router.get("/similar/indexes")
+async def list_indexes():
+    """Metadata of all stored indexes, newest first."""
+    indexes = []
+    if os.path.isdir(SIMILARITY_INDEX_DIR):
+        for index_id in os.listdir(SIMILARITY_INDEX_DIR):
+            if re.fullmatch(r"[0-9a-f]{32}", index_id):
+                meta = _read_meta(index_id, missing_ok=True)
+                if meta:
+                    indexes.append({k: v for k, v in meta.items() if k not in ("mean", "scale")})
+    indexes.sort(key=lambda m: m.get("createdAt", 0), reverse=True)
+    return {"indexes": indexes}
+
+
+@router.get("/similar/indexes/{index_id}")
+async def get_index(index_id: str):
+    """Size and layout of one index."""
+    return (await run_in_thread(SimilarityIndex.load, index_id)).status()
+
+
+@router.post("/similar/indexes/{index_id}/items")
+async def insert_items(index_id: str, features: UploadFile = File(...)):
+    """Insert feature rows into an index (see ``SimilarityIndex.add``)."""
+    content = await features.read()
+    return await run_in_thread(add_items, index_id, content)
+
+
+@router.delete("/similar/indexes/{index_id}")
+async def delete_index(index_id: str):
+    """Remove an index."""
+    directory = _index_dir(index_id)
+    if not os.path.isdir(directory):
+        raise HTTPException(status_code=404, detail=f"Similarity index '{index_id}' not found")
+    shutil.rmtree(directory)
+    _indexes.pop(index_id)
+    return {"indexId": index_id, "deleted": True}
+
+
+@router.post("/similar")
+async def similar(
+    index_id: str = Form(...),
+    query: Optional[UploadFile] = File(None),
+    item_id: Optional[str] = Form(None),
+    k: int = Form(DEFAULT_K),
+    nprobe: Optional[int] = Form(None)
+):
+    """Top-k most similar items for query rows or a stored item (see ``find_similar``)."""
+    content = await query.read() if query is not None else None
+    return await run_in_thread(find_similar, index_id, content, item_id, k, nprobe)
+
+
+# =============================================================================
+# Internals
+# =============================================================================
+def _index_dir(index_id):
+    if not re.fullmatch(r"[0-9a-f]{32}", index_id or ""):
+        raise HTTPException(status_code=400, detail="Invalid index ID")
+    return os.path.join(SIMILARITY_INDEX_DIR, index_id)
+
+
+def _read_meta(index_id, missing_ok=False):
+    try:
+        with open(os.path.join(_index_dir(index_id), "meta.json")) as f:
+            return json.load(f)
+    except (OSError, json.JSONDecodeError):
+        if missing_ok:
+            return None
+        raise HTTPException(status_code=404, detail=f"Similarity index '{index_id}' not found")
+
+
+def _read_table(content, features=None):
+    # .npy matrices have no column names: they are the index's features in order,
+    # or f0..fN when building
+    if content.startswith(NPY_MAGIC):
+        try:
+            X = np.load(io.BytesIO(content), allow_pickle=False)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=f"Invalid .npy upload: {e}")
+        if X.ndim != 2 or (features is not None and X.shape[1] != len(features)):
+            raise HTTPException(status_code=400, detail=f"Expected a 2-D array with {len(features or [])} columns, got shape {X.shape}")
+        return pd.DataFrame(X, columns=features or [f"f{i}" for i in range(X.shape[1])])
+    try:
+        payload = json.loads(content.decode("utf-8"))
+    except (UnicodeDecodeError, json.JSONDecodeError):
+        raise HTTPException(status_code=400, detail="Features must be JSON records or a .npy array")
+    if isinstance(payload, dict):
+        payload = payload.get("features", payload.get("selectedFeatures", payload.get("processedData")))
+    if not isinstance(payload, list) or not payload:
+        raise HTTPException(status_code=400, detail="No feature records in the upload")
+    return pd.DataFrame(payload)
+
+
+def _matrix(df, features):
+    try:
+        X = df[features].to_numpy(dtype=float)
+    except (TypeError, ValueError) as e:
+        raise HTTPException(status_code=400, detail=f"Feature columns must be numeric: {e}")
+    if not np.isfinite(X).all():
+        raise HTTPException(status_code=400, detail="Feature values must be finite (no missing values)")
+    return X
+
+
+def _item_ids(df, id_column, offset):
+    if id_column:
+        return df[id_column].astype(str).to_numpy()
+    # Without an ID column items are numbered in insertion order
+    return np.arange(offset, offset + len(df)).astype(str)
+
+
+def _squared_distances(A, B, B_norms):
+    # ||a - b||^2 = ||a||^2 - 2 a.b + ||b||^2, clipped against rounding below zero
+    d2 = (A ** 2).sum(axis=1)[:, None] - 2 * A @ B.T + B_norms[None, :]
+    return np.maximum(d2, 0)
@@ -0,0 +1,357 @@
+"""
+Logging, timing spans and Prometheus metrics for the backend services.
+
+- ``get_logger(name)`` returns a logger under the ``backend`` hierarchy, configured
+  from BACKEND_LOG_LEVEL (default INFO) and BACKEND_LOG_FORMAT ("text" or "json").
+  Pass values as %-style arguments (``logger.debug("shape %s", df.shape)``) so
+  messages below the configured level are never formatted.
+- ``span(endpoint, stage)`` times a block and ``StageTimer`` times consecutive stages
+  of a long function. Durations go into the ``backend_stage_duration_seconds``
+  histogram; spans recorded in worker processes are sent back with the result
+  (see ``workers.run_in_process``).
+- ``instrument(app)`` adds request latency and payload size histograms, an
+  ``X-Request-ID`` header, ``GET /metrics`` (Prometheus text format) and the
+  admin-only profiling hook of ``profiling`` to an app.
+  Other modules publish their own values (e.g. cache hit rates) with
+  ``register_collector``.
+"""
+import contextvars
+import json
+import logging
+import math
+import os
+import re
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+
+LOG_LEVEL = os.environ.get("BACKEND_LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = os.environ.get("BACKEND_LOG_FORMAT", "text").lower()
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+SIZE_BUCKETS = tuple(256 * 4 ** i for i in range(11))  # 256 B .. 256 MB
+
+# ID of the request being handled, attached to every log record
+request_id_var = contextvars.ContextVar("request_id", default="-")
+
+router = APIRouter()
+
+
+# =============================================================================
+# Logging
+# =============================================================================
+class _RequestIdFilter(logging.Filter):
+    def filter(self, record):
+        record.request_id = request_id_var.get()
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line, for log collectors."""
+
+    def format(self, record):
+        entry = {
+            "ts": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "request_id": getattr(record, "request_id", "-"),
+            "message": record.getMessage(),
+        }
+        if record.exc_info:
+            entry["exc_info"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+def configure_logging(level=LOG_LEVEL, fmt=LOG_FORMAT):
+    """Set up the ``backend`` logger hierarchy (safe to call more than once)."""
+    base = logging.getLogger("backend")
+    base.setLevel(level)
+    base.propagate = False
+    for handler in list(base.handlers):
+        base.removeHandler(handler)
+    handler = logging.StreamHandler()
+    handler.addFilter(_RequestIdFilter())
+    if fmt == "json":
+        handler.setFormatter(JsonFormatter())
+    else:
+        handler.setFormatter(logging.Formatter(
+            "%(asctime)s %(levelname)s %(name)s [%(request_id)s] %(message)s"
+        ))
+    base.addHandler(handler)
+
+
+def get_logger(name):
+    """Logger for a backend module, e.g. ``get_logger("extraction")``."""
+    return logging.getLogger(f"backend.{name}")
+
+
+configure_logging()
+logger = get_logger("telemetry")
+
+
+# =============================================================================
+# Metrics
+# =============================================================================
+class Histogram:
+    """Thread-safe Prometheus histogram with a fixed set of label names."""
+
+    def __init__(self, name, documentation, buckets, labelnames):
+        self.name = name
+        self.documentation = documentation
+        self.buckets = tuple(buckets)
+        self.labelnames = tuple(labelnames)
+        self.series = {}
+        self.lock = threading.Lock()
+
+    def observe(self, value, *labels):
+        with self.lock:
+            series = self.series.get(labels)
+            if series is None:
+                series = self.series[labels] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[0][i] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self.lock:
+            items = sorted((labels, (list(s[0]), s[1], s[2])) for labels, s in self.series.items())
+        for labels, (counts, total, count) in items:
+            base = list(zip(self.labelnames, labels))
+            for bound, bucket_count in zip(self.buckets, counts):
+                lines.append(f"{self.name}_bucket{_labels(base + [('le', _number(bound))])} {bucket_count}")
+            lines.append(f"{self.name}_bucket{_labels(base + [('le', '+Inf')])} {count}")
+            lines.append(f"{self.name}_sum{_labels(base)} {_number(total)}")
+            lines.append(f"{self.name}_count{_labels(base)} {count}")
+        return lines
+
+
+REQUEST_LATENCY = Histogram(
+    "backend_request_duration_seconds", "Time to handle an HTTP request.",
+    LATENCY_BUCKETS, ("method", "path", "status"),
+)
+REQUEST_SIZE = Histogram(
+    "backend_request_size_bytes", "Size of HTTP request bodies.", SIZE_BUCKETS, ("method", "path"),
+)
+RESPONSE_SIZE = Histogram(
+    "backend_response_size_bytes", "Size of HTTP response bodies.", SIZE_BUCKETS, ("method", "path"),
+)
+STAGE_LATENCY = Histogram(
+    "backend_stage_duration_seconds", "Time spent in a stage of an endpoint (parse, steps, extractors, plots, serialization).",
+    LATENCY_BUCKETS, ("endpoint", "stage"),
+)
+HISTOGRAMS = [REQUEST_LATENCY, REQUEST_SIZE, RESPONSE_SIZE, STAGE_LATENCY]
+
+_collectors = []
+# Spans recorded in a worker process while it runs a task, sent back to the parent
+_collected_spans = None
+
+
+def register_collector(collector):
+    """
+    Add a function called on every scrape of ``/metrics``.
+
+    It returns a list of ``(name, type, help, samples)`` where ``samples`` is a list of
+    ``(labels_dict, value)``.
+    """
+    _collectors.append(collector)
+    return collector
+
+
+def render_metrics():
+    """All metrics of this process in Prometheus text exposition format."""
+    lines = []
+    for histogram in HISTOGRAMS:
+        lines.extend(histogram.render())
+    for collector in _collectors:
+        try:
+            families = collector()
+        except Exception:
+            logger.exception("Metrics collector %s failed", getattr(collector, "__name__", collector))
+            continue
+        for name, metric_type, documentation, samples in families:
+            lines.append(f"# HELP {name} {documentation}")
+            lines.append(f"# TYPE {name} {metric_type}")
+            for labels, value in samples:
+                lines.append(f"{name}{_labels(sorted(labels.items()))} {_number(value)}")
+    return "\n".join(lines) + "\n"
+
+
+@router.get("/metrics")
+async def metrics():
+    """Prometheus scrape endpoint."""
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+
+
+# =============================================================================
+# Spans
+# =============================================================================
+def record_span(endpoint, stage, seconds):
+    """Record the duration of one stage of an endpoint."""
+    STAGE_LATENCY.observe(seconds, endpoint, stage)
+    if _collected_spans is not None:
+        _collected_spans.append((endpoint, stage, seconds))
+    logger.debug("%s/%s took %.4fs", endpoint, stage, seconds)
+
+
+@contextmanager
+def span(endpoint, stage):
+    """Time the enclosed block as ``stage`` of ``endpoint``."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_span(endpoint, stage, time.perf_counter() - start)
+
+
+class StageTimer:
+    """
+    Times consecutive stages of a long function without nesting its code in spans.
+
+    ``start(stage)`` ends the running stage (if any) and starts the next one;
+    ``stop()`` ends the running stage.
+    """
+
+    def __init__(self, endpoint):
+        self.endpoint = endpoint
+        self.stage = None
+        self.started = None
+
+    def start(self, stage):
+        self.stop()
+        self.stage = stage
+        self.started = time.perf_counter()
+
+    def stop(self):
+        if self.stage is not None:
+            record_span(self.endpoint, self.stage, time.perf_counter() - self.started)
+            self.stage = None
+
+
+@contextmanager
+def collect_spans():
+    """Collect the spans recorded in the enclosed block (used by worker processes)."""
+    global _collected_spans
+    previous = _collected_spans
+    _collected_spans = collected = []
+    try:
+        yield collected
+    finally:
+        _collected_spans = previous
+
+
+def merge_spans(spans):
+    """Record spans sent back by a worker process in this process."""
+    for endpoint, stage, seconds in spans:
+        STAGE_LATENCY.observe(seconds, endpoint, stage)
+
+
+# =============================================================================
+# Request middleware
+# =============================================================================
+class MetricsMiddleware:
+    """
+    ASGI middleware that assigns a request ID and records latency and payload sizes.
+
+    The ``path`` label is the matched route template (``/jobs/{job_id}``) so metrics
+    do not grow with every distinct URL. When apps are mounted inside each other only
+    the outermost middleware records the request.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or "backend.request_id" in scope:
+            await self.app(scope, receive, send)
+            return
+
+        headers = dict(scope.get("headers") or [])
+        # A client-supplied ID is kept if it is safe to use in log lines and file names
+        request_id = headers.get(b"x-request-id", b"").decode("latin-1")
+        if not re.fullmatch(r"[\w-]{1,64}", request_id):
+            request_id = uuid.uuid4().hex
+        scope["backend.request_id"] = request_id
+        root_path = scope.get("root_path", "")
+        sizes = {"request": 0, "response": 0}
+        status = {"code": 500}
+
+        async def receive_counting():
+            message = await receive()
+            if message["type"] == "http.request":
+                sizes["request"] += len(message.get("body", b""))
+            return message
+
+        async def send_counting(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+                message.setdefault("headers", [])
+                message["headers"] = list(message["headers"]) + [(b"x-request-id", request_id.encode("latin-1"))]
+            elif message["type"] == "http.response.body":
+                sizes["response"] += len(message.get("body", b""))
+            await send(message)
+
+        token = request_id_var.set(request_id)
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive_counting, send_counting)
+        finally:
+            elapsed = time.perf_counter() - start
+            path = _route_path(scope, root_path)
+            method = scope.get("method", "")
+            REQUEST_LATENCY.observe(elapsed, method, path, str(status["code"]))
+            REQUEST_SIZE.observe(sizes["request"], method, path)
+            RESPONSE_SIZE.observe(sizes["response"], method, path)
+            logger.debug("%s %s -> %s in %.4fs", method, path, status["code"], elapsed)
+            request_id_var.reset(token)
+
+
+def instrument(app):
+    """
+    Add the metrics middleware, ``GET /metrics`` and the on-demand profiling hook
+    (see ``profiling``) to a FastAPI app.
+    """
+    import profiling
+
+    # The last middleware added runs first: metrics assigns the request ID profiling uses
+    app.add_middleware(profiling.ProfilingMiddleware)
+    app.add_middleware(MetricsMiddleware)
+    app.include_router(router)
+    app.include_router(profiling.router)
+    return app
+
+
+# =============================================================================
+# Internals
+# =============================================================================
+def _route_path(scope, root_path):
+    route = scope.get("route")
+    if route is None or not hasattr(route, "path"):
+        return "unmatched"
+    # Mounted apps extend root_path with their mount prefix
+    return scope.get("root_path", "")[len(root_path):] + route.path
+
+
+def _labels(pairs):
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in pairs) + "}"
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _number(value):
+    value = float(value)
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    if value.is_integer():
+        return str(int(value))
+    return repr(value)
@@ -1,4 +1,4 @@
-from fastapi import FastAPI, File, UploadFile, Form, Body, Query
+from fastapi import FastAPI, File, UploadFile, Form, Body, Query, Request
 from fastapi.responses import JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
 from ydata_profiling import ProfileReport
@@ -8,7 +8,6 @@ import seaborn as sns
 import matplotlib.pyplot as plt
 import tempfile
 import os
-import logging
 import traceback
 import warnings
 import numpy as np
@@ -20,8 +19,12 @@ from scipy.signal import welch, hilbert
 from pydantic import BaseModel
 from typing import List, Optional, Union
 
-# Set up logging
-logging.basicConfig(level=logging.DEBUG, format='%(asctime)s - %(levelname)s - %(message)s')
+from response_cache import cache_key, cached_response
+from telemetry import get_logger, instrument
+from workers import run_in_process
+
+# Set up logging (level and format come from BACKEND_LOG_LEVEL / BACKEND_LOG_FORMAT)
+logger = get_logger("vizreport")
 
 app = FastAPI()
 
@@ -32,6 +35,8 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+# Request latency/size metrics and GET /metrics
+instrument(app)
 
 # Model for viz endpoints
 class VizPayload(BaseModel):
@@ -78,9 +83,24 @@ def generate_profile(df: pd.DataFrame) -> ProfileReport:
     return ProfileReport(df, config=config)
 
 @app.post("/eda/combined")
-async def combined_eda(file: UploadFile = File(...)):
+async def combined_eda(request: Request, file: UploadFile = File(...)):
+    # Profiling is the heaviest endpoint; it runs in the worker process pool
+    content = await file.read()
+
+    async def compute():
+        outcome = await run_in_process(build_eda_report, content)
+        if outcome is None:
+            return None
+        result, status_code = outcome
+        return JSONResponse(content=result, status_code=status_code)
+
+    return await cached_response(request, cache_key("viz:eda", content), compute, endpoint="viz:eda")
+
+
+def build_eda_report(content: bytes):
+    """Build the profiling report; returns (content, status_code), or None if profiling failed."""
     temp_file = tempfile.NamedTemporaryFile(delete=False)
-    temp_file.write(await file.read())
+    temp_file.write(content)
     temp_file.close()
 
     ydata_html_path = temp_file.name + "_ydata.html"
@@ -91,7 +111,7 @@ async def combined_eda(file: UploadFile = File(...)):
         df.columns = [f"ch{i+1}" for i in range(df.shape[1])]
 
         if df.empty:
-            return JSONResponse(content={"error": "Uploaded CSV is empty"}, status_code=400)
+            return {"error": "Uploaded CSV is empty"}, 400
 
         # Initialize cleaned_html with a default value
         cleaned_html = "<p>YData report generation failed.</p>"
@@ -138,15 +158,15 @@ async def combined_eda(file: UploadFile = File(...)):
                 ydata_html = f1.read()
                 cleaned_html = ydata_html.replace("Powered by YData", "")  # Remove watermark text
             # Return profiling HTML and an empty boxplots placeholder
-            return JSONResponse(content={"ydata": cleaned_html}, status_code=200)
+            return {"ydata": cleaned_html}, 200
         except Exception as e:
-            logging.error("YData Profiling failed:", exc_info=True)
+            logger.exception("YData Profiling failed")
 
        
 
     except Exception as e:
-        logging.error("Combined EDA failed:", exc_info=True)
-        return JSONResponse(content={"error": str(e)}, status_code=500)
+        logger.exception("Combined EDA failed")
+        return {"error": str(e)}, 500
 
     finally:
         if os.path.exists(temp_file.name):
@@ -154,6 +174,11 @@ async def combined_eda(file: UploadFile = File(...)):
         if os.path.exists(ydata_html_path):
             os.remove(ydata_html_path)
 
+async def cached_render(request: Optional[Request], name: str, render, payload: VizPayload):
+    """Serve a plot from the response cache or render it in the worker process pool."""
+    key = cache_key(f"viz:{name}", payload.model_dump_json())
+    return await cached_response(request, key, lambda: run_in_process(render, payload), endpoint=f"viz:{name}")
+
 @app.post("/channels")
 async def viz_channels(
     data: dict = Body(...)
@@ -166,8 +191,13 @@ async def viz_channels(
 
 @app.post("/Timeseries")
 async def viz_timeseries(
-    payload: VizPayload = Body(...)
+    payload: VizPayload = Body(...),
+    request: Request = None
 ):
+    return await cached_render(request, "timeseries", render_timeseries, payload)
+
+
+def render_timeseries(payload: VizPayload):
     import pandas as pd
     from io import BytesIO
     import matplotlib.pyplot as plt
@@ -197,8 +227,13 @@ async def viz_timeseries(
 
 @app.post("/Spectrogram")
 async def viz_spectrogram(
-    payload: VizPayload = Body(...)
+    payload: VizPayload = Body(...),
+    request: Request = None
 ):
+    return await cached_render(request, "spectrogram", render_spectrogram, payload)
+
+
+def render_spectrogram(payload: VizPayload):
      import pandas as pd
      from io import BytesIO
      import matplotlib.pyplot as plt
@@ -226,8 +261,13 @@ async def viz_spectrogram(
 
 @app.post("/PSD")
 async def viz_psd(
-    payload: VizPayload = Body(...)
+    payload: VizPayload = Body(...),
+    request: Request = None
 ):
+    return await cached_render(request, "psd", render_psd, payload)
+
+
+def render_psd(payload: VizPayload):
      import pandas as pd
      from io import BytesIO
      import matplotlib.pyplot as plt
@@ -256,8 +296,13 @@ async def viz_psd(
 
 @app.post("/Boxplot")
 async def viz_boxplot(
-    payload: VizPayload = Body(...)
+    payload: VizPayload = Body(...),
+    request: Request = None
 ):
+    return await cached_render(request, "boxplot", render_boxplot, payload)
+
+
+def render_boxplot(payload: VizPayload):
     import pandas as pd
     from io import BytesIO
     import matplotlib.pyplot as plt
@@ -288,8 +333,13 @@ async def viz_boxplot(
 
 @app.post("/Autocorrelation")
 async def viz_autocorrelation(
-    payload: VizPayload = Body(...)
+    payload: VizPayload = Body(...),
+    request: Request = None
 ):
+    return await cached_render(request, "autocorrelation", render_autocorrelation, payload)
+
+
+def render_autocorrelation(payload: VizPayload):
     import pandas as pd
     import numpy as np
     from io import BytesIO
@@ -321,8 +371,13 @@ async def viz_autocorrelation(
 
 @app.post("/Envelope")
 async def viz_envelope(
-    payload: VizPayload = Body(...)
+    payload: VizPayload = Body(...),
+    request: Request = None
 ):
+    return await cached_render(request, "envelope", render_envelope, payload)
+
+
+def render_envelope(payload: VizPayload):
     import pandas as pd
     import numpy as np
     from scipy.signal import hilbert
@@ -356,8 +411,13 @@ async def viz_envelope(
 
 @app.post("/Poincare")
 async def viz_poincare(
-    payload: VizPayload = Body(...)
+    payload: VizPayload = Body(...),
+    request: Request = None
 ):
+    return await cached_render(request, "poincare", render_poincare, payload)
+
+
+def render_poincare(payload: VizPayload):
     import pandas as pd
     import numpy as np
     from io import BytesIO
@@ -389,21 +449,22 @@ async def viz_poincare(
 @app.post("/viz")
 async def viz_dispatch(
     type: str = Query(..., description="Visualization type, e.g. timeseries, spectrogram, psd, boxplot, autocorrelation, envelope, poincare"),
-    payload: VizPayload = Body(...)
+    payload: VizPayload = Body(...),
+    request: Request = None
 ):
     t = type.lower()
     if t == "timeseries":
-        return await viz_timeseries(payload)
+        return await viz_timeseries(payload, request)
     if t == "spectrogram":
-        return await viz_spectrogram(payload)
+        return await viz_spectrogram(payload, request)
     if t == "psd":
-        return await viz_psd(payload)
+        return await viz_psd(payload, request)
     if t == "boxplot":
-        return await viz_boxplot(payload)
+        return await viz_boxplot(payload, request)
     if t == "autocorrelation":
-        return await viz_autocorrelation(payload)
+        return await viz_autocorrelation(payload, request)
     if t == "envelope":
-        return await viz_envelope(payload)
+        return await viz_envelope(payload, request)
     if t == "poincare":
-        return await viz_poincare(payload)
+        return await viz_poincare(payload, request)
     return JSONResponse({"error": f"Unsupported viz type '{type}'"}, status_code=400)
\ No newline at end of file
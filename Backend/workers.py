@@ -0,0 +1,160 @@
+"""
+Worker pools for CPU-bound endpoint work.
+
+Endpoint handlers stay ``async`` for I/O (reading uploads, parsing requests) and hand
+the pandas/sklearn/matplotlib work to a bounded pool so one heavy request does not
+block the event loop for everyone else:
+
+- ``run_in_process`` uses a process pool for heavy, self-contained computations
+  (extraction, classification, evaluation, plots). Functions and arguments must be
+  picklable, and matplotlib's global pyplot state stays private to each worker.
+- ``run_in_thread`` uses a thread pool for lighter work or work that relies on
+  in-process state, such as the /preprocess step cache.
+
+Pool sizes are set with BACKEND_PROCESS_WORKERS and BACKEND_THREAD_WORKERS.
+Setting BACKEND_PROCESS_WORKERS=0 runs process work on the thread pool instead.
+
+Both carry the request ID into the worker for logging, time each call as a
+``telemetry`` span named after the function (e.g. ``extraction/run_extraction``) and
+run it under the profiler when an admin asked for a profile of the request.
+
+A pool task keeps running after the coroutine awaiting it is cancelled. Callers that
+must know when their pool work has really finished (see ``jobs``) set
+``pool_futures`` to a set, which collects the futures of every task submitted from
+that context.
+"""
+import asyncio
+import contextvars
+import functools
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from fastapi import HTTPException
+
+import profiling
+import telemetry
+
+PROCESS_WORKERS = int(os.environ.get("BACKEND_PROCESS_WORKERS", str(min(4, os.cpu_count() or 1))))
+THREAD_WORKERS = int(os.environ.get("BACKEND_THREAD_WORKERS", "8"))
+
+_process_pool = None
+_thread_pool = None
+_pool_lock = threading.Lock()
+
+pool_futures = contextvars.ContextVar("pool_futures", default=None)
+
+
+def get_process_pool():
+    """Process pool shared by all endpoints of this server, created on first use."""
+    global _process_pool
+    with _pool_lock:
+        if _process_pool is None:
+            # 'spawn' avoids forking a process that already runs the event loop and threads
+            _process_pool = ProcessPoolExecutor(
+                max_workers=PROCESS_WORKERS, mp_context=multiprocessing.get_context("spawn")
+            )
+        return _process_pool
+
+
+def get_thread_pool():
+    """Thread pool shared by all endpoints of this server, created on first use."""
+    global _thread_pool
+    with _pool_lock:
+        if _thread_pool is None:
+            _thread_pool = ThreadPoolExecutor(max_workers=THREAD_WORKERS, thread_name_prefix="backend-worker")
+        return _thread_pool
+
+
+async def run_in_process(func, *args, **kwargs):
+    """
+    Run ``func(*args, **kwargs)`` in the process pool and await its result.
+
+    HTTPExceptions raised by ``func`` are re-raised here with the same status code and
+    detail. If a worker dies (e.g. out of memory) the pool is rebuilt and the request
+    fails with 503.
+    """
+    if PROCESS_WORKERS <= 0:
+        return await run_in_thread(func, *args, **kwargs)
+    try:
+        outcome = await _submit(
+            get_process_pool(),
+            functools.partial(
+                _call_in_worker,
+                (telemetry.request_id_var.get(), profiling.active_profile.get()),
+                func, *args, **kwargs,
+            ),
+        )
+    except BrokenProcessPool:
+        _reset_process_pool()
+        raise HTTPException(status_code=503, detail="Worker process terminated unexpectedly, please retry")
+    return _unwrap(outcome)
+
+
+async def run_in_thread(func, *args, **kwargs):
+    """Run ``func(*args, **kwargs)`` in the thread pool and await its result."""
+    # Executor threads do not inherit context variables such as the request ID
+    context = contextvars.copy_context()
+    return await _submit(get_thread_pool(), functools.partial(context.run, _timed_call, func, *args, **kwargs))
+
+
+def shutdown_pools():
+    """Stop both pools; called when the server shuts down."""
+    global _process_pool, _thread_pool
+    with _pool_lock:
+        if _process_pool is not None:
+            _process_pool.shutdown(wait=False, cancel_futures=True)
+            _process_pool = None
+        if _thread_pool is not None:
+            _thread_pool.shutdown(wait=False, cancel_futures=True)
+            _thread_pool = None
+
+
+# =============================================================================
+# Internals
+# =============================================================================
+def _submit(pool, call):
+    future = pool.submit(call)
+    tracked = pool_futures.get()
+    if tracked is not None:
+        tracked.add(future)
+    return asyncio.wrap_future(future)
+
+
+def _timed_call(func, *args, **kwargs):
+    with telemetry.span(func.__module__, func.__name__):
+        profile_mode = profiling.active_profile.get()
+        if profile_mode:
+            return profiling.profile_call(telemetry.request_id_var.get(), profile_mode, func, *args, **kwargs)
+        return func(*args, **kwargs)
+
+
+def _call_in_worker(context, func, *args, **kwargs):
+    # HTTPException cannot be unpickled in the parent, so it is sent back as plain values;
+    # spans recorded here are sent along so they show up in the parent's /metrics
+    request_id, profile_mode = context
+    telemetry.request_id_var.set(request_id)
+    profiling.active_profile.set(profile_mode)
+    with telemetry.collect_spans() as spans:
+        try:
+            outcome = ("ok", _timed_call(func, *args, **kwargs))
+        except HTTPException as e:
+            outcome = ("http_error", e.status_code, e.detail)
+    return outcome + (spans,)
+
+
+def _unwrap(outcome):
+    telemetry.merge_spans(outcome[-1])
+    if outcome[0] == "http_error":
+        raise HTTPException(status_code=outcome[1], detail=outcome[2])
+    return outcome[1]
+
+
+def _reset_process_pool():
+    global _process_pool
+    with _pool_lock:
+        if _process_pool is not None:
+            _process_pool.shutdown(wait=False, cancel_futures=True)
+            _process_pool = None
@@ -111,6 +111,21 @@ const methodParameters: MethodParameters = {
     },
     add_suffix: { type: "boolean", default: true, label: "Add '_band_pass' Suffix" }
   },
+  "powerline_filter": {
+    powerline: {
+      type: "select",
+      default: "50",
+      label: "Powerline Frequency",
+      options: [
+        { value: "50", label: "50 Hz" },
+        { value: "60", label: "60 Hz" }
+      ]
+    },
+    sampling_rate: { type: "number", default: 1000.0, label: "Sampling Rate (Hz)", min: 1, max: 10000 },
+    harmonics: { type: "number", default: 3, label: "Harmonics (incl. fundamental)", min: 1, max: 20, step: 1 },
+    quality_factor: { type: "number", default: 30, label: "Quality Factor", min: 1, max: 100 },
+    add_suffix: { type: "boolean", default: true, label: "Add '_notch' Suffix" }
+  },
   "dominant_frequency": {
     sampling_rate: { type: "number", default: 1.0, label: "Sampling Rate (Hz)", min: 0.1, max: 1000 }
   }